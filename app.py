@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, send_file, send_from_directory, redirect, url_for, flash, session, abort
+from flask import Flask, render_template, request, send_file, send_from_directory, redirect, url_for, flash, session, abort, jsonify
 from flask_session import Session
 import sys
 import tempfile
@@ -11,6 +11,7 @@ from utils.ofx_processador import processar_ofx
 from utils.folha_processador import process_sheet
 import json
 import utils.caixa_financeiro as caixa_fin
+from utils import nf_jobs
 import os
 import subprocess
 
@@ -375,6 +376,77 @@ def extrato_pdf():
                            txt_name=txt_name,
                            gerar_txt=gerar_txt)
 
+@app.route('/nf-comparador', methods=['GET', 'POST'])
+def nf_comparador():
+    if request.method == 'POST':
+        zip_file = request.files.get('zip_file')
+        rel_file = request.files.get('relatorio_pdf')
+        if not zip_file or zip_file.filename == '' or not rel_file or rel_file.filename == '':
+            return jsonify({'erro': 'Envie o ZIP de notas e o relatório PDF.'}), 400
+
+        # a comparação roda em segundo plano: aqui só grava os arquivos no
+        # workspace do job e enfileira (o job apaga a pasta quando expira)
+        workspace = nf_jobs.novo_workspace()
+        ext_zip = os.path.splitext(zip_file.filename)[1].lower()
+        zip_path = os.path.join(workspace, f'notas{ext_zip}')
+        rel_path = os.path.join(workspace, 'relatorio.pdf')
+        try:
+            zip_file.save(zip_path)
+            rel_file.save(rel_path)
+        except Exception:
+            nf_jobs.descartar_workspace(workspace)
+            raise
+
+        job_id = nf_jobs.submeter(zip_path, rel_path, workspace)
+        # só quem enviou acompanha/baixa o job: as rotas abaixo conferem esta
+        # lista (os jobs que já expiraram saem dela aqui)
+        session['nf_jobs'] = [j for j in session.get('nf_jobs', [])
+                              if nf_jobs.status(j) is not None] + [job_id]
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('nf_comparador_status', job_id=job_id),
+            'resultado_url': url_for('nf_comparador_resultado', job_id=job_id),
+        }), 202
+
+    return render_template('nf_comparador.html')
+
+def _job_da_sessao(job_id):
+    """O job foi enviado por esta sessão? (job de outra sessão responde como inexistente)"""
+    return job_id in session.get('nf_jobs', [])
+
+@app.route('/nf-comparador/status/<job_id>')
+def nf_comparador_status(job_id):
+    st = nf_jobs.status(job_id) if _job_da_sessao(job_id) else None
+    if st is None:
+        return jsonify({'erro': 'Comparação não encontrada.'}), 404
+    return jsonify(st)
+
+@app.route('/nf-comparador/resultado/<job_id>')
+def nf_comparador_resultado(job_id):
+    if not _job_da_sessao(job_id):
+        abort(404)
+    job = nf_jobs.obter(job_id)
+    if job is None:
+        flash('Comparação não encontrada (pode ter expirado). Envie os arquivos novamente.', 'danger')
+        return redirect(url_for('nf_comparador'))
+    if job['status'] == nf_jobs.ERRO:
+        flash(f"Erro ao comparar as notas: {job['erro']}", 'danger')
+        return redirect(url_for('nf_comparador'))
+    if job['status'] != nf_jobs.CONCLUIDO:
+        # ainda rodando: a página retoma o acompanhamento
+        return render_template('nf_comparador.html', job_id=job_id)
+    return render_template('nf_comparador.html', resultado=job['resultado'], job_id=job_id)
+
+@app.route('/nf-comparador/relatorio/<job_id>')
+def relatorio_nf_pdf(job_id):
+    if not _job_da_sessao(job_id):
+        abort(404)
+    job = nf_jobs.obter(job_id)
+    if not job or job['status'] != nf_jobs.CONCLUIDO or not os.path.isfile(job.get('pdf') or ''):
+        flash('PDF de validação indisponível. Envie os arquivos novamente.', 'danger')
+        return redirect(url_for('nf_comparador'))
+    return send_file(job['pdf'], as_attachment=True, download_name='relatorio_validacao.pdf')
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do parser de extrato XP sobre as linhas de um PDF.
+
+Lê as linhas cruas de todas as páginas uma vez (texto ou OCR, pela SessaoPDF)
+e mede, em rodadas repetidas, só a parte em Python puro: a quebra das linhas
+(_explode_lines: normalização + sentenças conhecidas + pares de datas) e a
+máquina de estados por página (_parse_pagina). Imprime o melhor tempo de
+cada etapa e linhas por segundo.
+
+Com --backends, mede também a leitura das palavras em cada backend do
+_page_to_lines (pdfplumber / pymupdf) e confere se as linhas montadas e os
+lançamentos saem iguais nos dois, página a página (aceita vários PDFs).
+A mesma paridade roda no pytest: tests/test_extrato_backends.py.
+
+    python benchmark_extrato.py extrato.pdf
+    python benchmark_extrato.py extrato.pdf --rodadas 20 --copias 10
+    python benchmark_extrato.py extratos/*.pdf --backends
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from utils import extrato_pdf_processador as ext
+
+
+def linhas_por_pagina(pdf_path, ocr_dpi=300, ocr_dpi_min=None, ocr_lang="por", backend=None):
+    with ext.SessaoPDF(pdf_path, backend) as sessao:
+        return [ext._linhas_cruas(sessao, idx, ocr_dpi_min or ocr_dpi, ocr_dpi, ocr_lang)[0]
+                for idx in range(sessao.total_paginas)]
+
+
+def melhor_tempo(funcao, rodadas):
+    tempos = []
+    for _ in range(rodadas):
+        t0 = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - t0)
+    return min(tempos)
+
+
+def comparar_backends(pdfs, args):
+    """Tempo de leitura por backend + páginas cujas linhas/lançamentos diferem."""
+    tempos = {b: 0.0 for b in ext.BACKENDS_PALAVRAS}
+    paginas = diferentes = lanc_diferentes = 0
+    for pdf in pdfs:
+        por_backend = {}
+        for b in ext.BACKENDS_PALAVRAS:
+            t = melhor_tempo(lambda: por_backend.__setitem__(
+                b, linhas_por_pagina(pdf, args.ocr_dpi, args.ocr_dpi_min, backend=b)), args.rodadas)
+            tempos[b] += t
+        base, outro = (por_backend[b] for b in ext.BACKENDS_PALAVRAS)
+        paginas += len(base)
+        for pno, (a, b) in enumerate(zip(base, outro), start=1):
+            if a == b:
+                continue
+            diferentes += 1
+            lanc_a = ext._parse_pagina(ext._explode_lines(a))
+            lanc_b = ext._parse_pagina(ext._explode_lines(b))
+            lanc_diferentes += lanc_a != lanc_b
+            if args.verbose:
+                print(f"  DIFERE {os.path.basename(pdf)} p{pno}"
+                      f"{' (lançamentos também)' if lanc_a != lanc_b else ''}")
+                for la, lb in zip(a, b):
+                    if la != lb:
+                        print(f"    {ext.BACKENDS_PALAVRAS[0]}: {la!r}\n    {ext.BACKENDS_PALAVRAS[1]}: {lb!r}")
+                        break
+    print("===== BACKENDS do _page_to_lines =====")
+    print(f"PDFs: {len(pdfs)}  páginas: {paginas}  com linhas diferentes: {diferentes}  "
+          f"com lançamentos diferentes: {lanc_diferentes}")
+    print("leitura (melhor rodada, soma dos PDFs): "
+          + "  ".join(f"{b}={t:.2f}s" for b, t in tempos.items())
+          + f"  ({tempos['pdfplumber'] / max(tempos['pymupdf'], 1e-9):.1f}x)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmark da quebra de linhas do extrato XP")
+    ap.add_argument("pdf", nargs="+")
+    ap.add_argument("--rodadas", type=int, default=7, help="repetições de cada etapa (vale a melhor)")
+    ap.add_argument("--copias", type=int, default=1, help="repete as páginas para simular um extrato maior")
+    ap.add_argument("--ocr-dpi", type=int, default=300)
+    ap.add_argument("--ocr-dpi-min", type=int)
+    ap.add_argument("--backend", choices=ext.BACKENDS_PALAVRAS, help="backend das palavras (padrão: EXTRATO_BACKEND_PALAVRAS)")
+    ap.add_argument("--backends", action="store_true", help="compara tempo e linhas dos dois backends")
+    ap.add_argument("-v", "--verbose", action="store_true", help="mostra a primeira linha diferente de cada página")
+    args = ap.parse_args()
+
+    if args.backends:
+        comparar_backends(args.pdf, args)
+        return
+
+    t0 = time.perf_counter()
+    paginas = [p for pdf in args.pdf
+               for p in linhas_por_pagina(pdf, args.ocr_dpi, args.ocr_dpi_min, backend=args.backend)]
+    paginas *= args.copias
+    leitura = time.perf_counter() - t0
+    linhas = sum(len(p) for p in paginas)
+    acentuadas = sum(not l.isascii() for p in paginas for l in p)
+    explodidas = [ext._explode_lines(p) for p in paginas]
+
+    t_explode = melhor_tempo(lambda: [ext._explode_lines(p) for p in paginas], args.rodadas)
+    t_estado = melhor_tempo(lambda: [ext._parse_pagina(p) for p in explodidas], args.rodadas)
+    lancamentos = sum(len(ext._parse_pagina(p)) for p in explodidas)
+
+    print("===== BENCHMARK extrato XP =====")
+    print(f"páginas: {len(paginas)}  linhas cruas: {linhas} (não ASCII: {acentuadas})  "
+          f"lançamentos: {lancamentos}  leitura (uma vez): {leitura:.2f}s")
+    print(f"_explode_lines: {t_explode * 1e3:.1f} ms  ({linhas / t_explode:,.0f} linhas/s)")
+    print(f"_parse_pagina:  {t_estado * 1e3:.1f} ms  ({linhas / t_estado:,.0f} linhas/s)")
+
+
+if __name__ == "__main__":
+    main()
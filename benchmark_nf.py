@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Benchmark + conferência do extrair_info_pdf sobre uma pasta de notas.
+
+Para cada arquivo mede o tempo total e quanto dele foi renderização, OCR,
+passos de regex e get_text (pelas etapas de utils.metricas); registra qual
+passo ganhou, quantas páginas a saída antecipada deixou sem OCR e, com
+--golden, compara número/data/valor com o gabarito. No fim imprime p50/p95
+por arquivo, páginas por segundo e a acurácia por campo.
+
+golden_notas.json é o gabarito conferido à mão, nota a nota:
+  - {numero, data, valor}: número impresso da nota sem zeros à esquerda e sem
+    o prefixo do ano (2025/108 -> 108, 202500000000153 -> 153), data de
+    emissão e valor bruto da nota ("valor total dos serviços / da nota");
+  - {"descartar": motivo}: NF-e/DANFE e cupons, que o extrator deve recusar
+    (resultado None);
+  - {"ignorar": motivo}: documento que não é nota; fica fora da acurácia.
+snapshot_notas.json é só a saída do extrator gravada com --gravar-snapshot,
+para pegar regressão entre versões; conferir contra ele mede estabilidade,
+não acerto.
+
+    python benchmark_nf.py temp_notas --golden golden_notas.json
+    python benchmark_nf.py temp_notas --golden snapshot_notas.json
+    python benchmark_nf.py temp_notas --gravar-snapshot snapshot_notas.json
+    python benchmark_nf.py temp_notas --sem-cache --saida bench.json -v
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import fitz  # PyMuPDF
+from utils import metricas, nf_comparador, ocr_cache
+
+EXTENSOES = (".pdf", ".jpg", ".jpeg", ".png")
+CAMPOS = ("numero", "data", "valor")
+ETAPAS = ("render", "ocr", "regex", "get_text")
+
+
+def agrupar_etapas(tempos):
+    """Soma as etapas finas de utils.metricas nos grupos do relatório."""
+    return {
+        "render": tempos.get("get_pixmap", 0.0) + tempos.get("binarizacao", 0.0),
+        "ocr": tempos.get("tesseract", 0.0),
+        "regex": sum(v for k, v in tempos.items()
+                     if k.startswith("passo:") or k in ("normalizacao", "data_emissao")),
+        "get_text": tempos.get("get_text", 0.0),
+    }
+
+
+def percentil(valores, p):
+    """Percentil pelo método nearest-rank."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = max(1, math.ceil(p / 100 * len(ordenados)))
+    return ordenados[k - 1]
+
+
+def contar_paginas(path):
+    try:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+
+def listar(pasta, filtro=None):
+    for fn in sorted(os.listdir(pasta)):
+        path = os.path.join(pasta, fn)
+        if not (os.path.isfile(path) and fn.lower().endswith(EXTENSOES)):
+            continue
+        if filtro and filtro.lower() not in fn.lower():
+            continue
+        yield fn, path
+
+
+def conferir(saida, esperado):
+    """Campo a campo; None ou {"descartar": ...} esperam que o extrator recuse a nota."""
+    if esperado is None or "descartar" in esperado:
+        return {c: saida is None for c in CAMPOS}
+    return {c: (saida or {}).get(c) == esperado.get(c) for c in CAMPOS}
+
+
+def rodar(pasta, golden=None, modo=None, verbose=False, filtro=None):
+    registros = []
+    for fn, path in listar(pasta, filtro):
+        cache_antes = ocr_cache.estatisticas()
+        t0 = time.perf_counter()
+        erro = None
+        with metricas.medindo() as m:
+            try:
+                info = nf_comparador.extrair_info_pdf(path, modo=modo)
+            except Exception as e:
+                info, erro = None, f"{type(e).__name__}: {e}"
+        total = time.perf_counter() - t0
+        cache_depois = ocr_cache.estatisticas()
+
+        saida = {c: info.get(c) for c in CAMPOS} if info else None
+        reg = {
+            "arquivo": fn,
+            "paginas": contar_paginas(path),
+            "tempo": total,
+            **agrupar_etapas(m.tempos),
+            "passo": m.anotacoes.get("passo") if info else None,
+            "bytes_renderizados": m.contadores.get("bytes_renderizados", 0),
+            "paginas_puladas": m.contadores.get("paginas_puladas", 0),
+            "etapas_detalhe": dict(m.tempos),
+            "cache_hits": cache_depois["hits"] - cache_antes.get("hits", 0),
+            "resultado": saida,
+            "erro": erro,
+        }
+        if golden is not None and fn in golden:
+            esperado = golden[fn]
+            if esperado and "ignorar" in esperado:
+                reg["ignorado"] = esperado["ignorar"]
+            else:
+                reg["confere"] = conferir(saida, esperado)
+                reg["esperado"] = esperado
+        registros.append(reg)
+
+        if verbose:
+            marca = ""
+            if "confere" in reg and not all(reg["confere"].values()):
+                marca = f"  DIVERGE esperado={reg['esperado']}"
+            print(f"{reg['tempo']:7.2f}s  render={reg['render']:.2f} ocr={reg['ocr']:.2f} "
+                  f"regex={reg['regex']:.3f} get_text={reg['get_text']:.2f}  {reg['passo'] or '-':<10} "
+                  f"{fn}  {saida}{marca}")
+    return registros
+
+
+def resumo(registros):
+    tempos = [r["tempo"] for r in registros]
+    total = sum(tempos)
+    paginas = sum(r["paginas"] for r in registros)
+    res = {
+        "arquivos": len(registros),
+        "paginas": paginas,
+        "tempo_total": total,
+        "p50": percentil(tempos, 50),
+        "p95": percentil(tempos, 95),
+        "paginas_por_s": paginas / total if total else 0.0,
+        "paginas_puladas": sum(r["paginas_puladas"] for r in registros),
+        "etapas": {e: sum(r[e] for r in registros) for e in ETAPAS},
+        "passos": dict(Counter(r["passo"] or "-" for r in registros)),
+        "erros": sum(1 for r in registros if r["erro"]),
+    }
+    conferidos = [r for r in registros if "confere" in r]
+    if conferidos:
+        res["conferidos"] = len(conferidos)
+        res["acertos"] = {c: sum(r["confere"][c] for r in conferidos) for c in CAMPOS}
+        res["todos_campos"] = sum(all(r["confere"].values()) for r in conferidos)
+        res["ignorados"] = sum(1 for r in registros if "ignorado" in r)
+    return res
+
+
+def imprimir_resumo(res, registros):
+    print("\n===== BENCHMARK extrair_info_pdf =====")
+    print(f"arquivos: {res['arquivos']}  páginas: {res['paginas']}  erros: {res['erros']}")
+    print(f"tempo total: {res['tempo_total']:.1f}s  p50: {res['p50']:.2f}s  p95: {res['p95']:.2f}s  "
+          f"páginas/s: {res['paginas_por_s']:.2f}  páginas sem OCR (saída antecipada): {res['paginas_puladas']}")
+    etapas = "  ".join(f"{e}={t:.1f}s" for e, t in res["etapas"].items())
+    outros = res["tempo_total"] - sum(res["etapas"].values())
+    print(f"etapas: {etapas}  outros={outros:.1f}s")
+    print("passo vencedor: " + ", ".join(f"{p}={n}" for p, n in sorted(res["passos"].items())))
+    if "conferidos" in res:
+        n = res["conferidos"]
+        campos = "  ".join(f"{c}={a}/{n}" for c, a in res["acertos"].items())
+        print(f"acurácia (golden): {campos}  nota inteira={res['todos_campos']}/{n}  "
+              f"fora da conta: {res['ignorados']}")
+        for r in registros:
+            if "confere" in r and not all(r["confere"].values()):
+                print(f"  DIVERGE {r['arquivo']}: {r['resultado']} (esperado {r['esperado']})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark e acurácia do extrator de NFS-e")
+    ap.add_argument("pasta", nargs="?", default="temp_notas")
+    ap.add_argument("--golden", help="JSON {arquivo: {numero, data, valor}} para conferir (gabarito ou snapshot)")
+    ap.add_argument("--gravar-snapshot", metavar="JSON", help="grava os resultados atuais como snapshot de regressão")
+    ap.add_argument("--saida", metavar="JSON", help="grava os registros por arquivo + resumo")
+    ap.add_argument("--modo", choices=("auto", "ocr"), help="modo do extrair_info_pdf (padrão: NF_MODO_EXTRACAO)")
+    ap.add_argument("--sem-cache", action="store_true", help="desliga o cache de OCR (mede o OCR de verdade)")
+    ap.add_argument("--filtro", help="só arquivos cujo nome contém este texto")
+    ap.add_argument("-v", "--verbose", action="store_true", help="uma linha por arquivo")
+    args = ap.parse_args()
+
+    nf_comparador.DEBUG_NF = False
+    if args.sem_cache:
+        ocr_cache.OCR_CACHE_ATIVO = False
+
+    golden = None
+    if args.golden:
+        with open(args.golden, encoding="utf-8") as f:
+            golden = json.load(f)
+
+    registros = rodar(args.pasta, golden=golden, modo=args.modo, verbose=args.verbose, filtro=args.filtro)
+    res = resumo(registros)
+    imprimir_resumo(res, registros)
+
+    if args.gravar_snapshot:
+        with open(args.gravar_snapshot, "w", encoding="utf-8") as f:
+            json.dump({r["arquivo"]: r["resultado"] for r in registros if not r["erro"]},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"\nsnapshot gravado em {args.gravar_snapshot}")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"resumo": res, "arquivos": registros}, f, ensure_ascii=False, indent=1)
+        print(f"relatório gravado em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
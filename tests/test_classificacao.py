@@ -0,0 +1,104 @@
+"""
+Regras de classificacao_regras.json x os mapeamentos fixos que elas substituíram.
+
+As referências abaixo são cópias do código antigo (MAPEAMENTO_FIXO + default
+por grupo do caixa_financeiro; cadeias de if do folha_processador). O caixa
+compara sem acento e sem caixa; a folha sempre casou exato, com acento e
+caixa ("normalizar": false).
+"""
+import unicodedata
+
+import pytest
+
+from utils import caixa_financeiro, folha_processador
+
+
+def _norm_antigo(s):
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s.upper().strip()
+
+
+MAPEAMENTO_FIXO_ANTIGO = {_norm_antigo(k): v for k, v in {
+    "CARTAO DE DÉBITO": ("142", "21"),
+    "CARTAO DE DEBITO": ("142", "21"),
+    "CREDIÁRIO": ("142", "21"),
+    "CREDIARIO": ("142", "21"),
+    "ENTRADAS DE CAIXA": ("142", "21"),
+    "DINHEIRO/PIX SICOOB": ("142", "21"),
+    "VALOR ABERTURA DE CAIXA": ("25091", "66"),
+    "BAIXA TELE ENTREGA": ("142", "21"),
+    "SOBRA CAIXA DIÁRIO": ("142", "21"),
+    "CARTAO DE CREDITO": ("142", "21"),
+    "CONVENIOS EMPRESARIAIS": ("142", "21"),
+    "SISTEMA FIDELIDADE": ("4556", "449"),
+    "BRINDE/PATROCI/RIFA/DOAÇÃ": ("4556", "449"),
+    "MAT. DE USO E CONSUMO INT": ("4546", "449"),
+    "ALUGUEL SALA COMERCIAL 2": ("4430", "449"),
+    "ALUGUEL SALA COMERCIAL": ("4430", "449"),
+    "CARTÓRIOS": ("4555", "449"),
+    "SANGRIA": ("25091", "66"),
+    "COMPRAS CONCORRÊNCIA": ("3035", "337"),
+    "DEVOLUCAO CONVENIOS": ("142", "21"),
+    "TRANSF. CX FINANCEIRO P/": ("25091", "66"),
+    "RETORNO CLIENTE (FAT105)": ("142", "21"),
+    "DEVOLUÇÃO VALOR P/ CLIENT": ("142", "21"),
+    "FALTA CAIXA DIÁRIO": ("142", "21"),
+    "SERV.TERCEIRIZADOS/ASSESS": ("1496", "337"),
+    "ALUGUEL ESTACIONAMENTO": ("4430", "449"),
+    "DESP. PESSOAL - HORA EXTRA": ("4014", "449"),
+    "DESP. PESSOAL - VALE TRAN": ("4014", "449"),
+    "PROLABORE SUELE FRANZEN": ("680", "10003"),
+    "PROLABORE HELMUT FUHR": ("680", "10003"),
+    "MATERIAIS EXPEDIENTE/PAPE": ("4534", "449"),
+    "LIMPEZA/FAXINA (MUTIRÃO/P": ("4546", "449"),
+}.items()}
+
+
+def _caixa_antigo(grupo_desc, conta_desc):
+    key = _norm_antigo(conta_desc)
+    if key in MAPEAMENTO_FIXO_ANTIGO:
+        return MAPEAMENTO_FIXO_ANTIGO[key]
+    g = _norm_antigo(grupo_desc)
+    if g.startswith("RECEIT") or g.startswith("RECEB") or "SOBRA" in g:
+        return "142", "21"
+    return "4698", "32"
+
+
+def _folha_antiga(tipo):
+    tipo = str(tipo)
+    if 'Cálculo Normal' in tipo or 'Folha Complementar' in tipo:
+        return 1634, 700
+    elif 'Pensão Judicial Normal' in tipo:
+        return 1637, 147
+    elif 'Rescisão Normal' in tipo:
+        return 1634, 132
+    elif 'Férias' in tipo:
+        return 313, 139
+    return 0, 0
+
+
+CONTAS_CAIXA = [
+    "CARTAO DE DÉBITO", "Cartao de Debito", "  crediário ", "SANGRIA", "sangria",
+    "BRINDE/PATROCI/RIFA/DOAÇÃ", "brinde/patroci/rifa/doaca", "Devolução valor p/ client",
+    "LIMPEZA/FAXINA (MUTIRÃO/P", "ALUGUEL SALA COMERCIAL 2", "ALUGUEL SALA COMERCIAL 3",
+    "PROLABORE HELMUT FUHR", "TRANSF. CX FINANCEIRO P/", "COMPRAS", "", None,
+]
+GRUPOS_CAIXA = ["RECEITAS", "Recebimentos", "receita de vendas", "SOBRA DE CAIXA", "DESPESAS", "Custos", ""]
+
+
+@pytest.mark.parametrize("grupo", GRUPOS_CAIXA)
+@pytest.mark.parametrize("conta", CONTAS_CAIXA)
+def test_caixa_igual_ao_mapeamento_antigo(conta, grupo):
+    assert caixa_financeiro._map_conta_historico(grupo, conta) == _caixa_antigo(grupo, conta)
+
+
+@pytest.mark.parametrize("tipo", [
+    "Cálculo Normal", "Folha Complementar", "Pensão Judicial Normal", "Rescisão Normal", "Férias",
+    "Adiantamento - Cálculo Normal 05/2025", "Férias + Rescisão Normal", "13º Salário",
+    # a folha casa exato: sem acento ou com outra caixa não é o mesmo evento
+    "cálculo normal", "CÁLCULO NORMAL", "Calculo Normal", "FÉRIAS", "ferias", "Ferias",
+    "Rescisao Normal", "pensão judicial normal", " Férias ", "", None,
+])
+def test_folha_igual_ao_if_antigo(tipo):
+    assert (folha_processador.map_conta(tipo), folha_processador.map_historico(tipo)) == _folha_antiga(tipo)
@@ -0,0 +1,100 @@
+"""
+Paridade dos backends de palavras do extrato (pdfplumber x pymupdf).
+
+Cada página é lida pelos dois backends (_linhas_cruas) e passa pelo mesmo
+parser; os lançamentos (datas, histórico, valor) têm de sair iguais.
+
+Roda sobre um extrato no layout da XP gerado aqui e, se EXTRATO_AMOSTRAS
+apontar para uma pasta, sobre os PDFs de extratos reais dela (que não vão
+para o repositório). Diferença conhecida entra em DIFERENCAS_CONHECIDAS,
+com o motivo.
+"""
+import glob
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+from utils import extrato_pdf_processador as ext
+
+# {nome do PDF: {página 1-based: motivo}}
+DIFERENCAS_CONHECIDAS = {}
+
+COLUNAS = (40, 105, 170, 400, 490)  # Liq, Mov, Histórico, Valor, Saldo
+
+LANCAMENTOS = [
+    ("02/05/2025", "02/05/2025", ["TAXA DE INTERMEDIACAO"], "-R$ 12,50", "R$ 987,50"),
+    ("02/05/2025", "03/05/2025", ["DEBITO CBLC IRRF S/ RENDIMENTO"], "-R$ 1,03", "R$ 986,47"),
+    ("05/05/2025", "05/05/2025", ["CREDITO REF. REMUNERACAO", "DE CONTA CORRENTE"], "R$ 3,21", "R$ 989,68"),
+    ("06/05/2025", "06/05/2025", ["OPERACOES EM BOLSA LIQ. 06/05"], "R$ 1.250,00", "R$ 2.239,68"),
+    ("07/05/2025", "07/05/2025", ["DIVIDENDOS DE CLIENTES", "Nº 116011339"], "R$ 48,90", "R$ 2.288,58"),
+    ("08/05/2025", "08/05/2025", ["TED ENVIADA - Conciliação mês"], "-R$ 2.000,00", "R$ 288,58"),
+    ("09/05/2025", "09/05/2025", ["CREDITO DE REEMBOLSO DE EVENTO"], "R$ 15,00", "R$ 303,58"),
+]
+
+
+def _gerar_extrato(path, paginas=3):
+    doc = fitz.open()
+    for p in range(paginas):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((40, 60), f"Extrato de conta corrente - página {p + 1}", fontsize=12)
+        y = 100
+        for x, titulo in zip(COLUNAS, ("Liq", "Mov", "Histórico", "Valor", "Saldo")):
+            page.insert_text((x, y), titulo, fontsize=9)
+        for i, (liq, mov, hist, valor, saldo) in enumerate(LANCAMENTOS):
+            y += 18
+            page.insert_text((COLUNAS[0], y), liq, fontsize=9)
+            page.insert_text((COLUNAS[1], y), mov, fontsize=9)
+            page.insert_text((COLUNAS[2], y), hist[0], fontsize=9)
+            # valor um pouco fora da linha de base (dentro da tolerância do agrupamento)
+            page.insert_text((COLUNAS[3], y + (1.5 if i % 2 else 0)), valor, fontsize=9)
+            page.insert_text((COLUNAS[4], y), saldo, fontsize=9)
+            for extra in hist[1:]:
+                y += 11
+                page.insert_text((COLUNAS[2], y), extra, fontsize=9)
+        if p == paginas - 1:
+            page.insert_text((40, y + 30), "Lançamentos futuros", fontsize=9)
+            page.insert_text((40, y + 48), "12/05/2025 12/05/2025 TAXA DE INTERMEDIACAO -R$ 9,00", fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def _lancamentos(path, backend):
+    with ext.SessaoPDF(path, backend) as sessao:
+        paginas = []
+        for idx in range(sessao.total_paginas):
+            raw_lines, _ = ext._linhas_cruas(sessao, idx, 300, 300, "por")
+            paginas.append([(r["data_liq"], r["data_mov"], r["descricao"], r["historico_code"], r["valor"])
+                            for r in ext._parse_pagina(ext._explode_lines(raw_lines))])
+    return paginas
+
+
+def _amostras():
+    pasta = os.environ.get("EXTRATO_AMOSTRAS")
+    return sorted(glob.glob(os.path.join(pasta, "*.pdf"))) if pasta else []
+
+
+def _comparar(path):
+    plumber = _lancamentos(path, "pdfplumber")
+    mupdf = _lancamentos(path, "pymupdf")
+    assert len(plumber) == len(mupdf)
+    conhecidas = DIFERENCAS_CONHECIDAS.get(os.path.basename(path), {})
+    diferentes = [pno for pno, (a, b) in enumerate(zip(plumber, mupdf), start=1) if a != b]
+    assert [p for p in diferentes if p not in conhecidas] == [], \
+        f"{os.path.basename(path)}: lançamentos diferentes nas páginas {diferentes}"
+    return plumber
+
+
+def test_paridade_backends_extrato_gerado(tmp_path):
+    path = str(tmp_path / "extrato_xp.pdf")
+    _gerar_extrato(path)
+    paginas = _comparar(path)
+    rows = [r for pagina in paginas for r in pagina]
+    assert len(rows) == 3 * len(LANCAMENTOS) + 1
+    assert ("07/05/2025", "07/05/2025", "DIVIDENDOS DE CLIENTES", "21", ext._to_decimal_br("48,90")) in rows
+    assert any(r[4] == -ext._to_decimal_br("2.000,00") for r in rows)
+
+
+@pytest.mark.parametrize("path", _amostras(), ids=os.path.basename)
+def test_paridade_backends_extratos_reais(path):
+    _comparar(path)
@@ -0,0 +1,110 @@
+"""
+Paridade dos parsers do relatório do Questor (palavras x pdfplumber).
+
+O parser por coordenadas de palavras (PyMuPDF) tem de devolver as mesmas
+linhas NFS ({numero, data, valor}, na mesma ordem) que o extract_table do
+pdfplumber. Roda sobre um relatório com grade gerado aqui e, se
+NF_RELATORIO_AMOSTRAS apontar para uma pasta, sobre os relatórios reais dela
+(que não vão para o repositório).
+
+Também cobre o fallback: sem linhas por palavras, "auto" relê com o
+pdfplumber e conta relatorio_fallback; "palavras" não relê.
+"""
+import glob
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+from utils import metricas
+from utils import nf_comparador as nfc
+
+# Data Entrada, Espécie, Série, Documento, Fornecedor, CFOP, Valor Contábil
+COLUNAS = (30, 95, 140, 175, 235, 420, 465, 565)
+TITULOS = ("Data Entrada", "Espécie", "Série", "Documento", "Fornecedor", "CFOP", "Valor Contábil")
+ESPECIES = ("NFS", "NFSE", "NFS-E", "NFE", "CTE", "NFS")
+LINHA_ALTURA = 16
+
+
+def _linhas(pagina, por_pagina):
+    for i in range(por_pagina):
+        n = pagina * por_pagina + i
+        inteiro = f"{(n * 731) % 90000 + 12:,}".replace(",", ".")  # milhar com ponto
+        valor = f"{inteiro},{n % 100:02d}"
+        yield (f"{n % 28 + 1:02d}/05/2025", ESPECIES[n % len(ESPECIES)], "1", str(1000 + n),
+               f"Fornecedor {n} LTDA", "1.933", valor)
+
+
+def _desenhar_tabela(page, y, linhas):
+    """Tabela com grade (réguas verticais e horizontais), como o Questor exporta."""
+    topo = y
+    for linha in linhas:
+        for x, texto in zip(COLUNAS, linha):
+            page.insert_text((x + 3, y + 11), texto, fontsize=8)
+        page.draw_line((COLUNAS[0], y), (COLUNAS[-1], y), width=0.5)
+        y += LINHA_ALTURA
+    page.draw_line((COLUNAS[0], y), (COLUNAS[-1], y), width=0.5)
+    for x in COLUNAS:
+        page.draw_line((x, topo), (x, y), width=0.5)
+
+
+def _gerar_relatorio(path, paginas=3, por_pagina=30, capas=0):
+    doc = fitz.open()
+    for _ in range(capas):
+        doc.new_page(width=595, height=842).insert_text((30, 60), "Relatório de Entradas - resumo", fontsize=12)
+    for p in range(paginas):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((30, 40), f"Relatório de Entradas - página {p + 1}", fontsize=11)
+        _desenhar_tabela(page, 60, [TITULOS, *_linhas(p, por_pagina)])
+    doc.save(path)
+    doc.close()
+
+
+def _amostras():
+    pasta = os.environ.get("NF_RELATORIO_AMOSTRAS")
+    return sorted(glob.glob(os.path.join(pasta, "*.pdf"))) if pasta else []
+
+
+def _comparar(path):
+    palavras = list(nfc._iter_relatorio_palavras(path, workers=1))
+    assert palavras, f"{os.path.basename(path)}: nenhuma linha pelo parser de palavras"
+    try:
+        plumber = list(nfc._iter_relatorio_pdfplumber(path))
+    except ValueError:
+        # relatório sem grade: o extract_table não acha tabela, não há com o que comparar
+        pytest.skip(f"{os.path.basename(path)}: pdfplumber não acha a tabela (sem grade)")
+    assert palavras == plumber
+    return palavras
+
+
+def test_paridade_parsers_relatorio_gerado(tmp_path):
+    path = str(tmp_path / "relatorio.pdf")
+    _gerar_relatorio(path)
+    linhas = _comparar(path)
+    esperadas = [r for p in range(3) for r in _linhas(p, 30) if r[1].startswith("NFS")]
+    assert len(linhas) == len(esperadas)
+    assert "1003" not in {r["numero"] for r in linhas}  # NFE fica de fora
+    assert {"numero": "1000", "data": "01/05/2025", "valor": "12.00"} in linhas
+    assert {"numero": "1017", "data": "18/05/2025", "valor": "12439.17"} in linhas
+
+
+@pytest.mark.parametrize("path", _amostras(), ids=os.path.basename)
+def test_paridade_parsers_relatorios_reais(path):
+    _comparar(path)
+
+
+def test_fallback_relatorio_contado(tmp_path, monkeypatch):
+    # cabeçalho depois das REL_PAGINAS_CABECALHO primeiras páginas: palavras não acha
+    path = str(tmp_path / "relatorio_capas.pdf")
+    _gerar_relatorio(path, paginas=1, por_pagina=6, capas=nfc.REL_PAGINAS_CABECALHO)
+
+    monkeypatch.setattr(nfc, "NF_RELATORIO_PARSER", "auto")
+    with metricas.medindo() as m:
+        linhas = list(nfc.iter_relatorio(path, workers=1))
+    assert linhas == list(nfc._iter_relatorio_pdfplumber(path))
+    assert len(linhas) == 4
+    assert m.contadores["relatorio_fallback"] == 1
+
+    monkeypatch.setattr(nfc, "NF_RELATORIO_PARSER", "palavras")
+    with pytest.raises(ValueError):
+        list(nfc.iter_relatorio(path, workers=1))
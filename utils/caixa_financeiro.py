@@ -1,10 +1,10 @@
 # utils/caixa_financeiro.py
 import re
-import unicodedata
 import calendar
 from datetime import date
 from decimal import Decimal, InvalidOperation
 from typing import List, Dict, Optional
+from utils import classificacao
 
 LINE_RX = re.compile(
     r"^\s*"
@@ -105,46 +105,7 @@ def _primeiro_dia_mes(data_ddmmaaaa: str) -> str:
     return f"01{mm}{aaaa}"
 
 def _norm(s: str) -> str:
-    s = unicodedata.normalize("NFKD", s or "")
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    return s.upper().strip()
-
-MAPEAMENTO_FIXO: dict[str, tuple[str, str]] = {
-    # RECEITAS
-    _norm("CARTAO DE DÉBITO"): ("142", "21"),
-    _norm("CARTAO DE DEBITO"): ("142", "21"),
-    _norm("CREDIÁRIO"): ("142", "21"),
-    _norm("CREDIARIO"): ("142", "21"),
-    _norm("ENTRADAS DE CAIXA"): ("142", "21"),
-    _norm("DINHEIRO/PIX SICOOB"): ("142", "21"),
-    _norm("VALOR ABERTURA DE CAIXA"): ("25091", "66"),
-    _norm("BAIXA TELE ENTREGA"): ("142", "21"),
-    _norm("SOBRA CAIXA DIÁRIO"): ("142", "21"),
-    _norm("CARTAO DE CREDITO"): ("142", "21"),
-    _norm("CONVENIOS EMPRESARIAIS"): ("142", "21"),
-    # EXEMPLOS DE DESPESAS/CUSTOS
-    _norm("SISTEMA FIDELIDADE"): ("4556", "449"),
-    _norm("BRINDE/PATROCI/RIFA/DOAÇÃ"): ("4556", "449"),
-    _norm("MAT. DE USO E CONSUMO INT"): ("4546", "449"),
-    _norm("ALUGUEL SALA COMERCIAL 2"): ("4430", "449"),
-    _norm("ALUGUEL SALA COMERCIAL"): ("4430", "449"),
-    _norm("CARTÓRIOS"): ("4555", "449"),
-    _norm("SANGRIA"): ("25091", "66"),
-    _norm("COMPRAS CONCORRÊNCIA"): ("3035", "337"),
-    _norm("DEVOLUCAO CONVENIOS"): ("142", "21"),
-    _norm("TRANSF. CX FINANCEIRO P/"): ("25091", "66"),
-    _norm("RETORNO CLIENTE (FAT105)"): ("142", "21"),
-    _norm("DEVOLUÇÃO VALOR P/ CLIENT"): ("142", "21"),
-    _norm("FALTA CAIXA DIÁRIO"): ("142", "21"),
-    _norm("SERV.TERCEIRIZADOS/ASSESS"): ("1496", "337"),
-    _norm("ALUGUEL ESTACIONAMENTO"): ("4430", "449"),
-    _norm("DESP. PESSOAL - HORA EXTRA"): ("4014", "449"),
-    _norm("DESP. PESSOAL - VALE TRAN"): ("4014", "449"),
-    _norm("PROLABORE SUELE FRANZEN"): ("680", "10003"),
-    _norm("PROLABORE HELMUT FUHR"): ("680", "10003"),
-    _norm("MATERIAIS EXPEDIENTE/PAPE"): ("4534", "449"),
-    _norm("LIMPEZA/FAXINA (MUTIRÃO/P"): ("4546", "449"),
-}
+    return classificacao.normalizar(s)
 
 def _deve_excluir(grupo_desc: str, conta_desc: str) -> bool:
 
@@ -155,15 +116,8 @@ def _deve_excluir(grupo_desc: str, conta_desc: str) -> bool:
     return any(t in texto for t in termos_banidos)
 
 def _map_conta_historico(grupo_desc: str, conta_desc: str) -> tuple[str, str]:
-    key = _norm(conta_desc)
-    if key in MAPEAMENTO_FIXO:
-        return MAPEAMENTO_FIXO[key]
-    g = _norm(grupo_desc)
-    # default de RECEITA
-    if g.startswith("RECEIT") or g.startswith("RECEB") or "SOBRA" in g:
-        return "142", "21"
-    # default de DESPESA/CUSTO
-    return "4698", "32"
+    # mapeamento fixo pela conta; sem ele, receita/despesa pelo grupo (regras "caixa")
+    return classificacao.classificar("caixa", conta_desc, grupo_desc)
 
 DATE_RX = re.compile(r"\b(\d{2})[\/\-.](\d{2})[\/\-.](\d{2,4})\b")
 
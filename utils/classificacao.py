@@ -0,0 +1,174 @@
+# utils/classificacao.py
+"""
+Classificação conta/histórico por regras em arquivo (classificacao_regras.json).
+
+Cada conjunto (extrato, caixa, folha) lista campos de entrada, regras em ordem
+e o resultado padrão; vale a primeira regra que casar:
+
+    {"igual": "SANGRIA", "resultado": [...]}             texto inteiro
+    {"contem": ["CREDITO REF", "REMUNERACAO"], ...}      todos os trechos
+    {"campo": "grupo", "prefixo": "RECEIT", ...}         começa com
+
+Textos e regras são comparados normalizados (sem acento, maiúsculas, sem
+espaço nas pontas); um conjunto com "normalizar": false compara o texto como
+veio, com acento e caixa (é o caso da folha, que sempre casou exato).
+Na carga as regras são compiladas: os "igual" viram um dict e cada trecho
+distinto aponta para as regras que o usam, então uma linha normaliza cada
+campo uma vez e só testa as regras dos trechos presentes.
+O resultado é memorizado por entrada, então descrições repetidas no mesmo
+extrato/caixa/folha não são normalizadas de novo.
+
+    from utils import classificacao
+    conta, hist, cp = classificacao.classificar("extrato", descricao)
+
+CLASSIFICACAO_REGRAS escolhe outro arquivo; recarregar() relê o arquivo.
+"""
+import json
+import os
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CLASSIFICACAO_REGRAS = os.environ.get(
+    "CLASSIFICACAO_REGRAS",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "classificacao_regras.json"),
+)
+# entradas distintas memorizadas por conjunto (passou disso, começa de novo)
+MEMO_MAX = 20000
+
+_lock = threading.Lock()
+_conjuntos: Optional[Dict[str, "Classificador"]] = None
+
+
+def normalizar(s: str) -> str:
+    s = s or ""
+    if s.isascii():
+        return s.upper().strip()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s.upper().strip()
+
+
+def _exato(s: str) -> str:
+    return s or ""
+
+
+def _lista(v) -> List[str]:
+    return [v] if isinstance(v, str) else list(v or [])
+
+
+class _Campo:
+    """Trechos distintos de todas as regras de um campo."""
+
+    def __init__(self, trechos: Sequence[str], prefixos: Sequence[str]):
+        # "in" do str (busca em C) por trecho distinto: com poucas dezenas de trechos
+        # sai mais barato que uma regex com todas as alternativas
+        self.trechos = tuple(dict.fromkeys(t for t in trechos if t))
+        self.prefixos = tuple(dict.fromkeys(t for t in prefixos if t))
+
+    def achar(self, texto: str) -> Tuple[set, set]:
+        """-> (trechos presentes, prefixos do texto)"""
+        return ({t for t in self.trechos if t in texto},
+                {t for t in self.prefixos if texto.startswith(t)})
+
+
+class Classificador:
+    """Um conjunto de regras compilado; classificar(*campos) -> resultado (tupla)."""
+
+    def __init__(self, nome: str, config: Dict):
+        self.nome = nome
+        self.campos = list(config.get("campos") or ["texto"])
+        self.padrao = tuple(config.get("padrao") or ())
+        self._norm = normalizar if config.get("normalizar", True) else _exato
+        self._regras = []  # (índice do campo, tipo, trechos, resultado)
+        self._iguais: List[Dict[str, int]] = [{} for _ in self.campos]
+        trechos: List[List[str]] = [[] for _ in self.campos]
+        prefixos: List[List[str]] = [[] for _ in self.campos]
+        for i, regra in enumerate(config.get("regras") or []):
+            campo = regra.get("campo", self.campos[0])
+            if campo not in self.campos:
+                raise ValueError(f"Regra {i} de '{nome}': campo '{campo}' não existe ({self.campos}).")
+            c = self.campos.index(campo)
+            resultado = tuple(regra["resultado"])
+            if "igual" in regra:
+                for t in _lista(regra["igual"]):
+                    self._iguais[c].setdefault(self._norm(t), i)
+                self._regras.append((c, "igual", (), resultado))
+            elif "contem" in regra:
+                ts = tuple(self._norm(t) for t in _lista(regra["contem"]))
+                trechos[c].extend(ts)
+                self._regras.append((c, "contem", ts, resultado))
+            elif "prefixo" in regra:
+                ts = tuple(self._norm(t) for t in _lista(regra["prefixo"]))
+                prefixos[c].extend(ts)
+                self._regras.append((c, "prefixo", ts, resultado))
+            else:
+                raise ValueError(f"Regra {i} de '{nome}' sem 'igual', 'contem' ou 'prefixo'.")
+        self._campos = [_Campo(t, p) for t, p in zip(trechos, prefixos)]
+        # trecho -> regras que dependem dele, por campo: só essas são testadas
+        self._por_trecho: List[Dict[str, List[int]]] = [{} for _ in self.campos]
+        for i, (c, tipo, ts, _) in enumerate(self._regras):
+            for t in ts:
+                self._por_trecho[c].setdefault(t, []).append(i)
+        self._memo: Dict[Tuple, Tuple] = {}
+
+    def classificar(self, *valores) -> Tuple:
+        chave = valores
+        r = self._memo.get(chave)
+        if r is None:
+            r = self._classificar(valores)
+            if len(self._memo) >= MEMO_MAX:
+                self._memo.clear()
+            self._memo[chave] = r
+        return r
+
+    def _classificar(self, valores) -> Tuple:
+        fim = len(self._regras)
+        melhor = fim  # índice da primeira regra que casa
+        for c in range(len(self.campos)):
+            v = valores[c] if c < len(valores) else None
+            texto = self._norm(str(v) if v is not None else "")
+            # "igual": consulta no dict
+            i = self._iguais[c].get(texto, fim)
+            if i < melhor:
+                melhor = i
+            # trechos: só as regras de algum trecho presente, anteriores à melhor até aqui
+            presentes, inicio = self._campos[c].achar(texto)
+            if not presentes and not inicio:
+                continue
+            candidatas = sorted({i for t in presentes | inicio for i in self._por_trecho[c][t] if i < melhor})
+            for i in candidatas:
+                _, tipo, ts, _ = self._regras[i]
+                if (tipo == "contem" and presentes.issuperset(ts)) or \
+                        (tipo == "prefixo" and not inicio.isdisjoint(ts)):
+                    melhor = i
+                    break
+        return self._regras[melhor][3] if melhor < fim else self.padrao
+
+
+def carregar(path: Optional[str] = None) -> Dict[str, Classificador]:
+    """Lê e compila todos os conjuntos do arquivo de regras."""
+    with open(path or CLASSIFICACAO_REGRAS, encoding="utf-8") as f:
+        config = json.load(f)
+    return {nome: Classificador(nome, c) for nome, c in config.items()}
+
+
+def recarregar() -> None:
+    global _conjuntos
+    novos = carregar()
+    with _lock:
+        _conjuntos = novos
+
+
+def classificador(nome: str) -> Classificador:
+    """Conjunto compilado (o arquivo é lido uma vez por processo)."""
+    global _conjuntos
+    if _conjuntos is None:
+        with _lock:
+            if _conjuntos is None:
+                _conjuntos = carregar()
+    return _conjuntos[nome]
+
+
+def classificar(nome: str, *valores) -> Tuple:
+    return classificador(nome).classificar(*valores)
@@ -1,12 +1,27 @@
 import io
+import multiprocessing
+import os
 import re
 import fitz  # PyMuPDF
 import pdfplumber
 import unicodedata
 from PIL import Image
-import pytesseract
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal, InvalidOperation
-from typing import List, Dict, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from utils import classificacao, ocr_cache, ocr_motor
+
+# processos para ler as páginas em paralelo; 1 (padrão) lê no próprio processo, o pool é opt-in
+EXTRATO_WORKERS = int(os.environ.get("EXTRATO_WORKERS", "1"))
+# páginas por tarefa do pool: lotes pequenos equilibram páginas de OCR (lentas) com as de texto
+EXTRATO_PAGINAS_POR_LOTE = 4
+# sessão sem guardar_linhas esvazia o cache de objetos do MuPDF a cada N páginas (a cada
+# página custa caro: fontes e recursos são relidos; sem esvaziar, cresce com o extrato)
+EXTRATO_PAGINAS_POR_LIMPEZA = 16
+# de onde vêm as palavras das páginas com texto: "pdfplumber" (extract_words) ou
+# "pymupdf" (get_text("words"), bem mais rápido); as linhas montadas são as mesmas
+BACKENDS_PALAVRAS = ("pdfplumber", "pymupdf")
+EXTRATO_BACKEND_PALAVRAS = os.environ.get("EXTRATO_BACKEND_PALAVRAS", "pdfplumber")
 
 # palavras-gatilho que marcam início de descrição no meio da linha
 KNOWN_STARTS = [
@@ -21,6 +36,12 @@ KNOWN_STARTS = [
 # detecta um SEGUNDO par de datas na mesma linha (quebra em novo lançamento)
 DATEPAIR_RE = re.compile(r'\d{2}/\d{2}/\d{4}\s+\d{2}/\d{2}/\d{4}')
 
+# pontos de corte numa passada só: sentenças conhecidas (lookahead: acha também as
+# sobrepostas, como o find() com start = idx + 1) ou par de datas (sem sobreposição)
+CORTE_RE = re.compile(
+    '(?=' + '|'.join(re.escape(s) for s in KNOWN_STARTS) + ')|' + DATEPAIR_RE.pattern
+)
+
 # fallback para quando as 2 datas vêm quebradas em LINHAS diferentes
 ONE_DATE_ONLY_RE = re.compile(r'^\s*(\d{2}/\d{2}/\d{4})\s*$')
 NEXT_DATE_AND_TEXT_RE = re.compile(r'^\s*(\d{2}/\d{2}/\d{4})(?:\s+(.*))?$')
@@ -36,21 +57,103 @@ DATE_LINE_RE = re.compile(
     r'^\s*(\d{2}/\d{2}/\d{4})\s+(\d{2}/\d{2}/\d{4})(?:\s+(.*))?$'
 )
 
+# ---------------------------
+# Sessão do documento: um único read do arquivo para as duas bibliotecas
+# ---------------------------
+class SessaoPDF:
+    """
+    Abre o extrato uma vez: os bytes são lidos do disco uma só vez e servem
+    tanto ao pdfplumber (texto) quanto ao PyMuPDF (OCR / contagem de páginas),
+    cada um aberto só quando usado. Guarda também as linhas cruas de cada
+    página (e o DPI, se veio de OCR), para o debug não extrair tudo de novo.
+    backend_palavras escolhe quem lê as palavras (ver BACKENDS_PALAVRAS); com
+    "pymupdf" o pdfplumber nem chega a ser aberto. guardar_linhas=False não
+    guarda as linhas (memória constante ao percorrer extratos longos uma vez só).
+
+        with SessaoPDF(pdf_path) as sessao:
+            rows, meta = parse_xp_extrato_pdf(pdf_path, sessao=sessao)
+    """
+
+    def __init__(self, pdf_path: str, backend_palavras: Optional[str] = None, guardar_linhas: bool = True):
+        backend_palavras = backend_palavras or EXTRATO_BACKEND_PALAVRAS
+        if backend_palavras not in BACKENDS_PALAVRAS:
+            raise ValueError(f"backend_palavras inválido: {backend_palavras!r} (use {', '.join(BACKENDS_PALAVRAS)})")
+        self.pdf_path = pdf_path
+        self.backend_palavras = backend_palavras
+        self.guardar_linhas = guardar_linhas
+        with open(pdf_path, "rb") as f:
+            self.dados = f.read()
+        self._fitz: Optional[fitz.Document] = None
+        self._plumber = None
+        # índice 0-based -> (linhas cruas, dpi do OCR ou None)
+        self.linhas: Dict[int, Tuple[List[str], Optional[int]]] = {}
+
+    @property
+    def fitz(self) -> fitz.Document:
+        if self._fitz is None:
+            self._fitz = fitz.open(stream=self.dados, filetype="pdf")
+        return self._fitz
+
+    @property
+    def plumber(self):
+        if self._plumber is None:
+            self._plumber = pdfplumber.open(io.BytesIO(self.dados))
+        return self._plumber
+
+    @property
+    def total_paginas(self) -> int:
+        return self.fitz.page_count
+
+    def close(self) -> None:
+        if self._plumber is not None:
+            self._plumber.close()
+            self._plumber = None
+        if self._fitz is not None:
+            self._fitz.close()
+            self._fitz = None
+
+    def __enter__(self) -> "SessaoPDF":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
 # ---------------------------
 # OCR helpers (usado só quando a página não tem texto)
 # ---------------------------
 def _ocr_page_to_lines(fitz_page: fitz.Page, dpi: int = 300, lang: Optional[str] = None) -> List[str]:
     """Renderiza a página como imagem e roda OCR, retornando as linhas de texto."""
-    zoom = dpi / 72.0
-    mat = fitz.Matrix(zoom, zoom)
-    pix = fitz_page.get_pixmap(matrix=mat, alpha=False)
-    img = Image.open(io.BytesIO(pix.tobytes("png")))
-    txt = pytesseract.image_to_string(img, lang=lang) if lang else pytesseract.image_to_string(img)
+    def _reconhecer() -> str:
+        zoom = dpi / 72.0
+        mat = fitz.Matrix(zoom, zoom)
+        # cinza direto do MuPDF (1 byte/pixel) e imagem sobre o próprio buffer do pixmap
+        pix = fitz_page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+        img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+        return ocr_motor.reconhecer(img, lang=lang)
+
+    txt = ocr_cache.ocr_com_cache(fitz_page, _reconhecer, dpi=dpi, lang=lang,
+                                  config=f"cinza motor={ocr_motor.nome_motor()}")
     # normaliza quebras de linha
     lines = [ln.rstrip() for ln in txt.splitlines()]
     # remove linhas vazias excessivas
     return [l for l in lines if l.strip()]
 
+RX_OCR_DATA = re.compile(r"\d{2}/\d{2}/\d{4}")
+RX_OCR_VALOR = re.compile(r"\d,\d{2}\b")
+
+def _ocr_linhas_suficientes(lines: List[str]) -> bool:
+    """Há ao menos uma linha de lançamento reconhecível (data + valor com centavos)."""
+    return any(RX_OCR_DATA.search(l) and RX_OCR_VALOR.search(l) for l in lines)
+
+def _ocr_page_adaptativo(fitz_page: fitz.Page, dpi_min: int, dpi_max: int,
+                         lang: Optional[str] = None) -> Tuple[List[str], int]:
+    """OCR em dpi_min; re-renderiza em dpi_max só se não aparecer lançamento. -> (linhas, dpi)"""
+    if dpi_min < dpi_max:
+        lines = _ocr_page_to_lines(fitz_page, dpi=dpi_min, lang=lang)
+        if _ocr_linhas_suficientes(lines):
+            return lines, dpi_min
+    return _ocr_page_to_lines(fitz_page, dpi=dpi_max, lang=lang), dpi_max
+
 # ---------------------------
 
 def _parse_doc_line(line: str) -> tuple[Optional[str], Optional[str]]:
@@ -91,6 +194,8 @@ def _is_big_doc_code(line: str) -> bool:
 
 def _norm(s: str) -> str:
     s = s or ""
+    if s.isascii():  # NFKD não muda ASCII
+        return s.upper()
     s = unicodedata.normalize('NFKD', s)
     s = ''.join(ch for ch in s if not unicodedata.combining(ch))
     return s.upper()
@@ -100,86 +205,87 @@ def _is_header_line(s: str) -> bool:
     return all(k in z for k in ["LIQ","MOV","HISTORICO","VALOR","SALDO"])
 
 def _classificar_conta_historico(descricao: str):
-    d = _norm(descricao)
-    if "TAXA DE INTERMEDIACAO" in d:
-        return "4698","32","25016"
-    if "DEBITO CBLC IRRF S/ RENDIMENTO" in d:
-        return "4698","32","25016"
-    if "CREDITO REF" in d and "REMUNERACAO" in d:
-        return "25016","21","25017"
-    if "OPERACOES EM BOLSA LIQ" in d:
-        return "25016","21","25017"
-    if "DIVIDENDOS DE CLIENTES" in d:
-        return "25016","21","25017"
-    if "CREDITO DE REEMBOLSO DE EVENTO" in d or "CREDITO DE REEMBOLSO" in d:
-        return "25016","21","25017"
-    return None, None, None
+    """(conta, histórico, contrapartida) pelas regras "extrato" de utils.classificacao."""
+    return classificacao.classificar("extrato", descricao)
 
-def _page_to_lines(page) -> list[str]:
-    words = page.extract_words(
-        x_tolerance=2,
-        y_tolerance=4,          # << antes era 2
-        keep_blank_chars=False,
-        use_text_flow=True
-    )
+def _agrupar_linhas(words) -> list[str]:
+    """Junta (top, x0, texto), na ordem do fluxo de texto, em linhas ordenadas por x."""
     lines, row, last_top = [], [], None
-    for w in words:
-        t = round(w["top"], 1)
+    for top, x0, text in words:
+        t = round(top, 1)
         if last_top is None or abs(t - last_top) <= 3.5:   # << antes era <= 2
-            row.append((w["x0"], w["text"]))
+            row.append((x0, text))
         else:
             row.sort(key=lambda z: z[0])
             lines.append(" ".join(z[1] for z in row))
-            row = [(w["x0"], w["text"])]
+            row = [(x0, text)]
         last_top = t
     if row:
         row.sort(key=lambda z: z[0])
         lines.append(" ".join(z[1] for z in row))
     return lines
 
+def _page_to_lines(page) -> list[str]:
+    words = page.extract_words(
+        x_tolerance=2,
+        y_tolerance=4,          # << antes era 2
+        keep_blank_chars=False,
+        use_text_flow=True
+    )
+    return _agrupar_linhas((w["top"], w["x0"], w["text"]) for w in words)
+
+def _page_to_lines_pymupdf(fitz_page: fitz.Page) -> list[str]:
+    """
+    Mesmas linhas do _page_to_lines, com as palavras do PyMuPDF. sort=False
+    mantém a ordem do conteúdo (como o use_text_flow); o y0 do PyMuPDF fica
+    deslocado do top do pdfplumber pela altura do ascendente, mas o
+    agrupamento só compara palavras vizinhas, então a tolerância é a mesma.
+    """
+    words = fitz_page.get_text("words", sort=False)
+    return _agrupar_linhas((w[1], w[0], w[4]) for w in words)
+
+# caractere -> (texto normalizado, quantas posições ocupa no mapa); preenchida sob demanda
+_TABELA_NORM: Dict[str, Tuple[str, int]] = {}
+
+def _norm_char(ch: str) -> Tuple[str, int]:
+    base = unicodedata.normalize('NFKD', ch)
+    base = ''.join(c for c in base if not c.isascii() and unicodedata.combining(c)) or base
+    base = ''.join(c for c in base if not unicodedata.combining(c))
+    _TABELA_NORM[ch] = item = (''.join(c.upper() for c in base), len(base))
+    return item
+
 def _normalize_with_map(s: str) -> tuple[str, list[int]]:
     """Normaliza (sem acentos, maiúsc.) e devolve o mapa de posições norm->orig."""
+    if s.isascii():
+        return s.upper(), list(range(len(s)))
     norm_chars = []
     pos_map = []
     for i, ch in enumerate(s):
-        base = unicodedata.normalize('NFKD', ch)
-        base = ''.join(c for c in base if not c.isascii() and unicodedata.combining(c)) or base
-        base = ''.join(c for c in base if not unicodedata.combining(c))
-        if not base:
-            continue
-        for c in base:
-            norm_chars.append(c.upper())
-            pos_map.append(i)
+        texto, n = _TABELA_NORM.get(ch) or _norm_char(ch)
+        if n:
+            norm_chars.append(texto)
+            pos_map.extend([i] * n)
     return ''.join(norm_chars), pos_map
 
 def _split_on_known_starts(line: str) -> list[str]:
     """Divide a linha em várias quando encontra uma sentença conhecida ou um novo par de datas."""
     if not line.strip():
         return []
-    norm, pos_map = _normalize_with_map(line)
-    cut_norm_pos = set()
-
-    # 1) sentenças conhecidas
-    for needle in KNOWN_STARTS:
-        start = 0
-        while True:
-            idx = norm.find(needle, start)
-            if idx == -1:
-                break
-            if idx > 0:                 # não corta se for no início da linha
-                cut_norm_pos.add(idx)
-            start = idx + 1
-
-    # 2) pares de datas extras no meio
-    for m in DATEPAIR_RE.finditer(norm):
-        if m.start() > 0:
-            cut_norm_pos.add(m.start())
+    # linha ASCII: a normalizada é só upper(), com as mesmas posições
+    ascii_ = line.isascii()
+    norm, pos_map = (line.upper(), None) if ascii_ else _normalize_with_map(line)
+
+    # sentenças conhecidas e pares de datas extras no meio (não corta no início da linha)
+    cut_norm_pos = {m.start() for m in CORTE_RE.finditer(norm) if m.start() > 0}
 
     if not cut_norm_pos:
         return [line.strip()]
 
     # converte posição normalizada -> posição no original
-    cut_pos = sorted({pos_map[p] for p in cut_norm_pos if p < len(pos_map)})
+    if ascii_:
+        cut_pos = sorted(cut_norm_pos)
+    else:
+        cut_pos = sorted({pos_map[p] for p in cut_norm_pos if p < len(pos_map)})
 
     parts, start = [], 0
     for p in cut_pos:
@@ -198,12 +304,46 @@ def _explode_lines(lines: list[str]) -> list[str]:
         out.extend(_split_on_known_starts(l))
     return out
 
-def parse_xp_extrato_pdf(pdf_path: str, *, ocr_dpi: int = 300, ocr_lang: Optional[str] = "por") -> Tuple[List[Dict], Dict]:
+def _linhas_cruas(sessao: SessaoPDF, idx: int, ocr_dpi_min: int, ocr_dpi: int,
+                  ocr_lang: Optional[str]) -> Tuple[List[str], Optional[int]]:
+    """Linhas cruas da página (texto -> extract_text -> OCR), guardadas na sessão (guardar_linhas)."""
+    if idx in sessao.linhas:
+        return sessao.linhas[idx]
+    dpi = None
+
+    if sessao.backend_palavras == "pymupdf":
+        fpage = sessao.fitz.load_page(idx)
+        raw_lines = _page_to_lines_pymupdf(fpage)
+        if not raw_lines:
+            raw_lines = [l.rstrip() for l in fpage.get_text().splitlines() if l.strip()]
+    else:
+        page = sessao.plumber.pages[idx]
+        # 1) tentativa padrão (mantém o que você já fazia)
+        raw_lines = _page_to_lines(page)
+
+        # 2) fallback: extract_text()
+        if not raw_lines:
+            text = page.extract_text() or ""
+            raw_lines = [l.rstrip() for l in text.splitlines() if l.strip()]
+        # libera os caracteres/objetos que o pdfplumber guarda em cada página lida
+        page.close()
+
+    # 3) fallback final: OCR somente se ainda não houver nada
+    if not raw_lines:
+        fpage = sessao.fitz.load_page(idx)
+        raw_lines, dpi = _ocr_page_adaptativo(fpage, ocr_dpi_min, ocr_dpi, lang=ocr_lang)
+
+    if sessao.guardar_linhas:
+        sessao.linhas[idx] = (raw_lines, dpi)
+    elif (idx + 1) % EXTRATO_PAGINAS_POR_LIMPEZA == 0:
+        fitz.TOOLS.store_shrink(100)
+    return raw_lines, dpi
+
+def _parse_pagina(lines: List[str]) -> List[Dict]:
     """
-    Lê o PDF de extrato.
-    - Usa pdfplumber normalmente (sem alterar seu comportamento atual).
-    - Se a página não tiver texto (imagem/digitalizada), usa OCR (pytesseract) naquela página.
-    Retorna (rows, meta) onde meta indica se houve OCR e em quais páginas.
+    Máquina de estados de UMA página (linhas já explodidas). O contexto zera a
+    cada página e o lançamento aberto é fechado no fim dela, então as páginas
+    são independentes: parse serial e paralelo dão o mesmo resultado.
     """
     rows: List[Dict] = []
     in_table = False
@@ -213,246 +353,380 @@ def parse_xp_extrato_pdf(pdf_path: str, *, ocr_dpi: int = 300, ocr_lang: Optiona
     candidate_desc = ""
     first_date_only: Optional[str] = None
 
-    fitz_doc = fitz.open(pdf_path)
-    paginas_ocr: List[int] = []
+    for raw_line in lines:
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        if first_date_only is None:
+            m_one = ONE_DATE_ONLY_RE.match(line)
+            if m_one:
+                first_date_only = m_one.group(1)
+                continue
+        else:
+            m_next = NEXT_DATE_AND_TEXT_RE.match(line)
+            if m_next:
+                segunda = m_next.group(1)
+                resto = m_next.group(2) or ""
+                line = f"{first_date_only} {segunda} {resto}".strip()
+                first_date_only = None
+            else:
+                # a primeira "data solta" não formou par — trate como texto pendente
+                pending_desc = _clean_spaces(((pending_desc + " " + first_date_only).strip()) if pending_desc else first_date_only)
+                first_date_only = None
+
+        m_dates = DATE_LINE_RE.match(line)  # <- sempre calcule aqui
+
+        # 0) Entrar na tabela
+        if not in_table:
+            # entra na tabela se ver o header OU já ver a primeira linha com datas
+            if HEADER_RE.search(line) or _is_header_line(line) or m_dates:
+                in_table = True
+                # se NÃO for uma linha de datas (ex.: cabeçalho), vai pra próxima
+                if not m_dates:
+                    continue
+            else:
+                continue
+
+        # 1) Fim da tabela
+        if FUTUROS_RE.search(line):
+            # garante que "data solta" não se perca ao fechar a seção
+            if first_date_only:
+                pending_desc = _clean_spaces(
+                    ((pending_desc + " " + first_date_only).strip()) if pending_desc else first_date_only
+                )
+                first_date_only = None
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for idx, page in enumerate(pdf.pages):
-            # garante flush do lançamento anterior ao mudar de página
             if current:
                 if not current.get('descricao') and candidate_desc:
                     current['descricao'] = candidate_desc
                 rows.append(current)
-                current = None
-
-            # --- zera o contexto por página ---
             in_table = False
+            current = None
             pending_desc = ""
             candidate_desc = ""
-            first_date_only = None
-
-            # 1) tentativa padrão (mantém o que você já fazia)
-            raw_lines = _page_to_lines(page)
-
-            # 2) fallback: extract_text()
-            if not raw_lines:
-                text = page.extract_text() or ""
-                raw_lines = [l.rstrip() for l in text.splitlines() if l.strip()]
-
-            # 3) fallback final: OCR somente se ainda não houver nada
-            if not raw_lines:
-                fpage = fitz_doc.load_page(idx)
-                raw_lines = _ocr_page_to_lines(fpage, dpi=ocr_dpi, lang=ocr_lang)
-                paginas_ocr.append(idx + 1)  # páginas 1-based
-
-            lines = _explode_lines(raw_lines)
+            continue
 
-            for raw_line in lines:
-                line = raw_line.strip()
-                if not line:
-                    continue
+        # 2) Linha com datas (abre/fecha lançamento)
+        if m_dates:
+            if first_date_only:
+                pending_desc = _clean_spaces(
+                    ((pending_desc + " " + first_date_only).strip()) if pending_desc else first_date_only
+                )
+                first_date_only = None
 
-                if first_date_only is None:
-                    m_one = ONE_DATE_ONLY_RE.match(line)
-                    if m_one:
-                        first_date_only = m_one.group(1)
-                        continue
-                else:
-                    m_next = NEXT_DATE_AND_TEXT_RE.match(line)
-                    if m_next:
-                        segunda = m_next.group(1)
-                        resto = m_next.group(2) or ""
-                        line = f"{first_date_only} {segunda} {resto}".strip()
-                        first_date_only = None
-                    else:
-                        # a primeira "data solta" não formou par — trate como texto pendente
-                        pending_desc = _clean_spaces(((pending_desc + " " + first_date_only).strip()) if pending_desc else first_date_only)
-                        first_date_only = None
-
-                m_dates = DATE_LINE_RE.match(line)  # <- sempre calcule aqui
-
-                # 0) Entrar na tabela
-                if not in_table:
-                    # entra na tabela se ver o header OU já ver a primeira linha com datas
-                    if HEADER_RE.search(line) or _is_header_line(line) or m_dates:
-                        in_table = True
-                        # se NÃO for uma linha de datas (ex.: cabeçalho), vai pra próxima
-                        if not m_dates:
-                            continue
-                    else:
-                        continue
-
-                # 1) Fim da tabela
-                if FUTUROS_RE.search(line):
-                    # garante que "data solta" não se perca ao fechar a seção
-                    if first_date_only:
-                        pending_desc = _clean_spaces(
-                            ((pending_desc + " " + first_date_only).strip()) if pending_desc else first_date_only
-                        )
-                        first_date_only = None
-
-                    if current:
-                        if not current.get('descricao') and candidate_desc:
-                            current['descricao'] = candidate_desc
-                        rows.append(current)
-                    in_table = False
-                    current = None
-                    pending_desc = ""
-                    candidate_desc = ""
-                    continue
+            if current:
+                if not current.get('descricao') and candidate_desc:
+                    current['descricao'] = candidate_desc
+                rows.append(current)
 
-                # 2) Linha com datas (abre/fecha lançamento)
-                if m_dates:
-                    if first_date_only:
-                        pending_desc = _clean_spaces(
-                            ((pending_desc + " " + first_date_only).strip()) if pending_desc else first_date_only
-                        )
-                        first_date_only = None
-
-                    if current:
-                        if not current.get('descricao') and candidate_desc:
-                            current['descricao'] = candidate_desc
-                        rows.append(current)
-
-                    # abre novo lançamento
-                    desc_inline = _strip_trailing_amounts(_clean_spaces(m_dates.group(3) or ""))
-                    current = {
-                        'data_liq': m_dates.group(1),
-                        'data_mov': m_dates.group(2),
-                        'descricao': desc_inline if desc_inline else None,
-                        'documento': None,
-                        'valor': None,   # só valor (sem saldo)
-                        'tipo': None,
-                        'conta': None,
-                        'historico_code': None,
-                        'contrapartida': None,
-                    }
-
-                    # valor pode (ou não) estar na mesma linha
-                    m_val_here = DECIMAL_RE.search(line)
-                    if m_val_here:
-                        sign_v, v = m_val_here.groups()
-                        valor = _to_decimal_br(v)
-                        if sign_v in ('-', '\u2212'):
-                            valor = -valor
-                        current['valor'] = valor
-                        current['tipo'] = 'D' if valor < 0 else 'C'
-
-                    # descrição/categorização
-                    candidate_desc = current['descricao'] or ""
-                    if not candidate_desc and pending_desc:
-                        candidate_desc = pending_desc
-                        current['descricao'] = pending_desc
-
-                    if current.get('descricao'):
-                        conta, hist, cp = _classificar_conta_historico(current['descricao'])
-                        current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
-
-                    pending_desc = ""
-                    continue
+            # abre novo lançamento
+            desc_inline = _strip_trailing_amounts(_clean_spaces(m_dates.group(3) or ""))
+            current = {
+                'data_liq': m_dates.group(1),
+                'data_mov': m_dates.group(2),
+                'descricao': desc_inline if desc_inline else None,
+                'documento': None,
+                'valor': None,   # só valor (sem saldo)
+                'tipo': None,
+                'conta': None,
+                'historico_code': None,
+                'contrapartida': None,
+            }
+
+            # valor pode (ou não) estar na mesma linha
+            m_val_here = DECIMAL_RE.search(line)
+            if m_val_here:
+                sign_v, v = m_val_here.groups()
+                valor = _to_decimal_br(v)
+                if sign_v in ('-', '\u2212'):
+                    valor = -valor
+                current['valor'] = valor
+                current['tipo'] = 'D' if valor < 0 else 'C'
+
+            # descrição/categorização
+            candidate_desc = current['descricao'] or ""
+            if not candidate_desc and pending_desc:
+                candidate_desc = pending_desc
+                current['descricao'] = pending_desc
+
+            if current.get('descricao'):
+                conta, hist, cp = _classificar_conta_historico(current['descricao'])
+                current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
 
-                # 3) Ainda não começou nenhum lançamento: acumula descrição pré-datas
-                if current is None:
-                    doc_id, after = _parse_doc_line(line)
-                    if doc_id:
-                        if after:
-                            pending_desc = _clean_spaces((pending_desc + " " + after).strip()) if pending_desc else after
-                        continue
-                    if DECIMAL_RE.search(line) or _is_big_doc_code(line):
-                        continue
-                    pending_desc = _clean_spaces((pending_desc + " " + line).strip()) if pending_desc else line
-                    continue
+            pending_desc = ""
+            continue
 
-                # 4.1) Documento “Nº 123 …”
-                doc_id, after = _parse_doc_line(line)
-                if doc_id:
-                    current['documento'] = doc_id
-                    if after and not current.get('descricao'):
-                        current['descricao'] = after
-                        candidate_desc = after
-                        conta, hist, cp = _classificar_conta_historico(current['descricao'])
-                        current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
-                    continue
+        # 3) Ainda não começou nenhum lançamento: acumula descrição pré-datas
+        if current is None:
+            doc_id, after = _parse_doc_line(line)
+            if doc_id:
+                if after:
+                    pending_desc = _clean_spaces((pending_desc + " " + after).strip()) if pending_desc else after
+                continue
+            if DECIMAL_RE.search(line) or _is_big_doc_code(line):
+                continue
+            pending_desc = _clean_spaces((pending_desc + " " + line).strip()) if pending_desc else line
+            continue
 
-                # 4.2) Documento longo 2025…-1
-                if _is_big_doc_code(line):
-                    current['documento'] = line.strip()
-                    continue
+        # 4.1) Documento “Nº 123 …”
+        doc_id, after = _parse_doc_line(line)
+        if doc_id:
+            current['documento'] = doc_id
+            if after and not current.get('descricao'):
+                current['descricao'] = after
+                candidate_desc = after
+                conta, hist, cp = _classificar_conta_historico(current['descricao'])
+                current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
+            continue
 
-                m_val = DECIMAL_RE.search(line)
-                if m_val and current.get('valor') is None:
-                    sign_v, v = m_val.groups()
-                    valor = _to_decimal_br(v)
-                    if sign_v in ('-', '\u2212'):
-                        valor = -valor
-                    current['valor'] = valor
-                    current['tipo'] = 'D' if valor < 0 else 'C'
-
-                    # tentar extrair a descrição desta linha de valor
-                    if not current.get('descricao'):
-                        maybe_desc = _clean_spaces(_strip_trailing_amounts(line))
-                        # ignora se sobrou apenas datas (ou nada)
-                        if maybe_desc and not re.fullmatch(r'\d{2}/\d{2}/\d{4}(?:\s+\d{2}/\d{2}/\d{4})?', maybe_desc):
-                            current['descricao'] = maybe_desc
-                            candidate_desc = maybe_desc
-                            conta, hist, cp = _classificar_conta_historico(maybe_desc)
-                            current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
-                    continue
+        # 4.2) Documento longo 2025…-1
+        if _is_big_doc_code(line):
+            current['documento'] = line.strip()
+            continue
 
-                # 4.4) Texto comum -> descrição (concatena)
-                if not current.get('descricao'):
-                    current['descricao'] = _clean_spaces(line)
-                    candidate_desc = current['descricao']
-                    conta, hist, cp = _classificar_conta_historico(current['descricao'])
+        m_val = DECIMAL_RE.search(line)
+        if m_val and current.get('valor') is None:
+            sign_v, v = m_val.groups()
+            valor = _to_decimal_br(v)
+            if sign_v in ('-', '\u2212'):
+                valor = -valor
+            current['valor'] = valor
+            current['tipo'] = 'D' if valor < 0 else 'C'
+
+            # tentar extrair a descrição desta linha de valor
+            if not current.get('descricao'):
+                maybe_desc = _clean_spaces(_strip_trailing_amounts(line))
+                # ignora se sobrou apenas datas (ou nada)
+                if maybe_desc and not re.fullmatch(r'\d{2}/\d{2}/\d{4}(?:\s+\d{2}/\d{2}/\d{4})?', maybe_desc):
+                    current['descricao'] = maybe_desc
+                    candidate_desc = maybe_desc
+                    conta, hist, cp = _classificar_conta_historico(maybe_desc)
                     current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
-                else:
-                    current['descricao'] = _clean_spaces(current['descricao'] + ' ' + line)
+            continue
 
-    fitz_doc.close()
+        # 4.4) Texto comum -> descrição (concatena)
+        if not current.get('descricao'):
+            current['descricao'] = _clean_spaces(line)
+            candidate_desc = current['descricao']
+            conta, hist, cp = _classificar_conta_historico(current['descricao'])
+            current['conta'], current['historico_code'], current['contrapartida'] = conta, hist, cp
+        else:
+            current['descricao'] = _clean_spaces(current['descricao'] + ' ' + line)
 
+    # garante flush do lançamento aberto ao fim da página
     if current:
         if not current.get('descricao') and candidate_desc:
             current['descricao'] = candidate_desc
         rows.append(current)
-
-    rows = [r for r in rows if (r.get('descricao') or r.get('documento') or r.get('valor') is not None)]
-    meta = {
-        "usou_ocr": len(paginas_ocr) > 0,
-        "paginas_ocr": paginas_ocr,
-        "total_paginas": len(paginas_ocr) + (fitz.open(pdf_path).page_count - len(paginas_ocr)) if paginas_ocr else fitz.open(pdf_path).page_count
-    }
+    return rows
+
+# sessão de cada processo do pool: aberta uma vez no initializer, usada por todos os lotes dele
+_sessao_worker: Optional[SessaoPDF] = None
+
+def _abrir_sessao_worker(pdf_path: str, backend_palavras: str) -> None:
+    global _sessao_worker
+    _sessao_worker = SessaoPDF(pdf_path, backend_palavras, guardar_linhas=False)
+
+def _extrato_paginas(args) -> Tuple[List[Tuple[int, List[str], Optional[int], List[Dict]]], Dict[str, int]]:
+    """Linhas cruas + lançamentos das páginas [inicio, fim) (roda no pool). -> (páginas, delta do cache de OCR)"""
+    inicio, fim, ocr_dpi_min, ocr_dpi, ocr_lang = args
+    antes = ocr_cache.estatisticas()
+    paginas = []
+    for idx in range(inicio, fim):
+        raw_lines, dpi = _linhas_cruas(_sessao_worker, idx, ocr_dpi_min, ocr_dpi, ocr_lang)
+        paginas.append((idx, raw_lines, dpi, _parse_pagina(_explode_lines(raw_lines))))
+    depois = ocr_cache.estatisticas()
+    return paginas, {k: depois[k] - antes.get(k, 0) for k in depois}
+
+def _iter_paginas(sessao: SessaoPDF, ocr_dpi_min: int, ocr_dpi: int, ocr_lang: Optional[str],
+                  workers: Optional[int]):
+    """(idx, linhas cruas, dpi do OCR ou None, lançamentos) de cada página, na ordem das páginas."""
+    n = sessao.total_paginas
+    lotes = [(i, min(i + EXTRATO_PAGINAS_POR_LOTE, n), ocr_dpi_min, ocr_dpi, ocr_lang)
+             for i in range(0, n, EXTRATO_PAGINAS_POR_LOTE)]
+    workers = min(EXTRATO_WORKERS if workers is None else workers, len(lotes))
+    if workers <= 1:
+        for idx in range(n):
+            raw_lines, dpi = _linhas_cruas(sessao, idx, ocr_dpi_min, ocr_dpi, ocr_lang)
+            yield idx, raw_lines, dpi, _parse_pagina(_explode_lines(raw_lines))
+        return
+    # "spawn", como nos pools do nf_comparador: o chamador pode ser o servidor web, com threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_abrir_sessao_worker,
+                             initargs=(sessao.pdf_path, sessao.backend_palavras)) as ex:
+        # map devolve os lotes na ordem das páginas
+        for paginas, delta in ex.map(_extrato_paginas, lotes):
+            # contadores do cache de OCR ficam nos workers: traz para este processo
+            ocr_cache.acumular(delta)
+            for idx, raw_lines, dpi, rows in paginas:
+                if sessao.guardar_linhas:
+                    sessao.linhas[idx] = (raw_lines, dpi)
+                yield idx, raw_lines, dpi, rows
+
+def parse_xp_extrato_pdf(pdf_path: str, *, ocr_dpi: int = 300, ocr_lang: Optional[str] = "por",
+                         ocr_dpi_min: Optional[int] = None,
+                         sessao: Optional[SessaoPDF] = None,
+                         workers: Optional[int] = None,
+                         backend_palavras: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Lê o PDF de extrato.
+    - Usa pdfplumber normalmente (sem alterar seu comportamento atual); backend_palavras="pymupdf"
+      (padrão EXTRATO_BACKEND_PALAVRAS) lê as palavras pelo PyMuPDF, com o mesmo agrupamento em linhas.
+    - Se a página não tiver texto (imagem/digitalizada), usa OCR (utils.ocr_motor) naquela página:
+      com ocr_dpi_min (ex.: 150), tenta primeiro nele e só sobe para ocr_dpi se não sair lançamento.
+    - sessao: SessaoPDF já aberta (reaproveitada pelo chamador, com o backend dela); sem ela,
+      abre e fecha uma aqui.
+    - workers > 1 (padrão EXTRATO_WORKERS, 1): páginas em lotes num pool de processos, OCR incluso;
+      como cada página é independente, o resultado é o mesmo do modo serial.
+    Retorna (rows, meta) onde meta indica se houve OCR, em quais páginas e com que DPI (dpi_paginas).
+    """
+    meta: Dict = {}
+    rows = list(iter_xp_extrato_pdf(pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang, ocr_dpi_min=ocr_dpi_min,
+                                    sessao=sessao, workers=workers, backend_palavras=backend_palavras,
+                                    meta=meta))
     return rows, meta
 
-def export_to_xlsx(rows: List[Dict], out_xlsx_path: str) -> None:
-    import pandas as pd
-    df = pd.DataFrame(rows)
-    df = df.rename(columns={
-        'descricao': 'Descrição',
-        'historico_code': 'Histórico',
-        'conta': 'Conta',
-        'contrapartida': 'Contrapartida',
-    })
-    col_ordem = ['data_liq','data_mov','Descrição','documento','tipo','valor','Conta','Histórico','Contrapartida']
-    for c in col_ordem:
-        if c not in df.columns:
-            df[c] = None
-    df = df[col_ordem]
-    df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
-    with pd.ExcelWriter(out_xlsx_path, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Extrato')
+def iter_xp_extrato_pdf(pdf_path: str, *, ocr_dpi: int = 300, ocr_lang: Optional[str] = "por",
+                        ocr_dpi_min: Optional[int] = None,
+                        sessao: Optional[SessaoPDF] = None,
+                        workers: Optional[int] = None,
+                        backend_palavras: Optional[str] = None,
+                        meta: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Mesmos lançamentos do parse_xp_extrato_pdf, entregues um a um, sem juntar a lista
+    (para gravar a saída enquanto o parser anda). meta, se passado, é preenchido ao terminar.
+    Sem sessao, a sessão aberta aqui não guarda as linhas cruas das páginas já lidas.
+    """
+    for _, rows in iter_xp_extrato_paginas(pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang,
+                                           ocr_dpi_min=ocr_dpi_min, sessao=sessao, workers=workers,
+                                           backend_palavras=backend_palavras, meta=meta):
+        yield from rows
+
+def iter_xp_extrato_paginas(pdf_path: str, *, ocr_dpi: int = 300, ocr_lang: Optional[str] = "por",
+                            ocr_dpi_min: Optional[int] = None,
+                            sessao: Optional[SessaoPDF] = None,
+                            workers: Optional[int] = None,
+                            backend_palavras: Optional[str] = None,
+                            meta: Optional[Dict] = None) -> Iterator[Tuple[int, List[Dict]]]:
+    """Como iter_xp_extrato_pdf, mas (página 1-based, lançamentos da página), página a página."""
+    if sessao is None:
+        with SessaoPDF(pdf_path, backend_palavras, guardar_linhas=False) as sessao:
+            yield from iter_xp_extrato_paginas(pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang,
+                                               ocr_dpi_min=ocr_dpi_min, sessao=sessao, workers=workers,
+                                               meta=meta)
+        return
 
-def export_to_txt_contabil(
-    rows: List[Dict],
-    out_txt_path: str,
-    *,
-    codigo_prefixo="1",   # continua 1
-    codigo_meio="5",      # fallback se não houver contrapartida no lançamento
-    codigo_cc="337"       # fallback se não houver histórico no lançamento
-) -> None:
-    from decimal import Decimal
+    paginas_ocr: List[int] = []
+    dpi_paginas: Dict[int, int] = {}
+    ocr_dpi_min = ocr_dpi_min or ocr_dpi
+
+    for idx, _, dpi, rows_pagina in _iter_paginas(sessao, ocr_dpi_min, ocr_dpi, ocr_lang, workers):
+        if dpi is not None:
+            dpi_paginas[idx + 1] = dpi
+            paginas_ocr.append(idx + 1)  # páginas 1-based
+        yield idx + 1, [r for r in rows_pagina
+                        if r.get('descricao') or r.get('documento') or r.get('valor') is not None]
+
+    if meta is not None:
+        meta.update({
+            "usou_ocr": len(paginas_ocr) > 0,
+            "paginas_ocr": paginas_ocr,
+            "dpi_paginas": dpi_paginas,
+            "total_paginas": sessao.total_paginas,
+        })
+
+# (chave do lançamento, título da coluna), na ordem da planilha
+COLUNAS_XLSX = [
+    ('data_liq', 'data_liq'),
+    ('data_mov', 'data_mov'),
+    ('descricao', 'Descrição'),
+    ('documento', 'documento'),
+    ('tipo', 'tipo'),
+    ('valor', 'valor'),
+    ('conta', 'Conta'),
+    ('historico_code', 'Histórico'),
+    ('contrapartida', 'Contrapartida'),
+]
+
+def _valor_xlsx(v) -> Optional[float]:
+    """valor como número na célula (o que não for número fica vazio, como no pd.to_numeric(errors='coerce'))."""
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+class PlanilhaExtrato:
+    """
+    XLSX do extrato gravado página a página (openpyxl write-only): os lançamentos de uma
+    página ficam num buffer e só vão para o arquivo temporário da planilha quando a página
+    é aceita, então a memória não cresce com o tamanho do extrato e uma página que falhou
+    no meio não deixa linhas. Mesmas colunas e células do export antigo via pandas
+    (valor numérico, demais campos como vieram), com o cabeçalho em negrito.
+
+        planilha = PlanilhaExtrato(out_xlsx_path)
+        for _, rows in iter_xp_extrato_paginas(pdf_path):
+            for r in rows:
+                planilha.adicionar(r)
+            planilha.aceitar_pagina()
+        planilha.salvar()
+    """
 
-    def _fmt_data_ddmmaa(dmy: str) -> str:
-        return dmy.replace('/', '')
+    def __init__(self, out_xlsx_path: str):
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+        self.out_xlsx_path = out_xlsx_path
+        self.linhas = 0
+        self._pagina: List[List] = []
+        self._wb = openpyxl.Workbook(write_only=True)
+        self._ws = self._wb.create_sheet('Extrato')
+        negrito = Font(bold=True)
+        cabecalho = []
+        for _, titulo in COLUNAS_XLSX:
+            cell = WriteOnlyCell(self._ws, value=titulo)
+            cell.font = negrito
+            cabecalho.append(cell)
+        self._ws.append(cabecalho)
+
+    def adicionar(self, r: Dict) -> None:
+        self._pagina.append([_valor_xlsx(r.get(c)) if c == 'valor' else r.get(c) for c, _ in COLUNAS_XLSX])
+
+    def aceitar_pagina(self) -> None:
+        """Grava na planilha as linhas da página corrente."""
+        for linha in self._pagina:
+            self._ws.append(linha)
+        self.linhas += len(self._pagina)
+        self._pagina = []
+
+    def salvar(self) -> None:
+        self.aceitar_pagina()
+        self._wb.save(self.out_xlsx_path)
+
+    def descartar(self) -> None:
+        """Desiste da planilha (erro no meio do parse): nada é gravado em out_xlsx_path."""
+        self._pagina = []
+        # salvar é o jeito público de o openpyxl fechar e apagar o temporário das páginas já
+        # aceitas; vai para um buffer que é jogado fora
+        self._wb.save(io.BytesIO())
+
+def export_to_xlsx(rows: Iterable[Dict], out_xlsx_path: str) -> None:
+    planilha = PlanilhaExtrato(out_xlsx_path)
+    try:
+        for r in rows:
+            planilha.adicionar(r)
+            planilha.aceitar_pagina()  # sem páginas aqui: cada linha já chega pronta
+    except BaseException:
+        planilha.descartar()
+        raise
+    planilha.salvar()
+
+def _linha_txt_contabil(r: Dict, codigo_prefixo: str, codigo_meio: str, codigo_cc: str) -> Optional[str]:
+    """Linha do TXT contábil do lançamento (None se não tiver valor)."""
+    if r.get('valor') is None:
+        return None
 
     def _fmt_valor_2p(v) -> str:
         try:
@@ -461,40 +735,72 @@ def export_to_txt_contabil(
             pass
         return f"{abs(v):.2f}"
 
+    data = r['data_liq'].replace('/', '')
+    conta = (r.get('conta') or "").strip()
+    contrapartida = (r.get('contrapartida') or codigo_meio)
+    valor = _fmt_valor_2p(r['valor'])
+    historico = (r.get('historico_code') or codigo_cc)
+    hist_txt = (r.get('descricao') or '').replace('"', "'")
+    return f'{codigo_prefixo},{data},{conta},{contrapartida},{valor},{historico},"{hist_txt}"'
+
+def export_to_txt_contabil(
+    rows: Iterable[Dict],
+    out_txt_path: str,
+    *,
+    codigo_prefixo="1",   # continua 1
+    codigo_meio="5",      # fallback se não houver contrapartida no lançamento
+    codigo_cc="337"       # fallback se não houver histórico no lançamento
+) -> None:
     with open(out_txt_path, 'w', encoding='utf-8') as f:
         for r in rows:
-            if r.get('valor') is None:
-                continue
-
-            data = _fmt_data_ddmmaa(r['data_liq'])
-            conta = (r.get('conta') or "").strip()
-            contrapartida = (r.get('contrapartida') or codigo_meio)
-            valor = _fmt_valor_2p(r['valor'])
-            historico = (r.get('historico_code') or codigo_cc)
-            hist_txt = (r.get('descricao') or '').replace('"', "'")
-            linha = f'{codigo_prefixo},{data},{conta},{contrapartida},{valor},{historico},"{hist_txt}"'
-            f.write(linha + '\n')
+            linha = _linha_txt_contabil(r, codigo_prefixo, codigo_meio, codigo_cc)
+            if linha is not None:
+                f.write(linha + '\n')
 
 def processar_extrato_pdf(in_pdf_path: str, out_xlsx_path: str, out_txt_path: Optional[str]=None, config: Optional[Dict]=None) -> Dict:
+    """
+    Extrato PDF -> XLSX (+ TXT contábil) numa passada só: os lançamentos de cada página são
+    gravados nos dois arquivos quando o parser termina a página, sem montar a lista inteira
+    em memória.
+    """
     config = config or {}
     ocr_dpi = int(config.get("ocr_dpi", 300))
+    ocr_dpi_min = int(config.get("ocr_dpi_min", ocr_dpi))
     ocr_lang = config.get("ocr_lang", "por")
+    workers = config.get("workers")
+    backend_palavras = config.get("backend_palavras")  # "pdfplumber" | "pymupdf"
+    codigos_txt = (config.get('codigo_prefixo', '1'), config.get('codigo_meio', '5'), config.get('codigo_cc', '337'))
 
-    rows, meta = parse_xp_extrato_pdf(in_pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang)
-    export_to_xlsx(rows, out_xlsx_path)
-    if out_txt_path:
-        export_to_txt_contabil(
-            rows,
-            out_txt_path,
-            codigo_prefixo=config.get('codigo_prefixo', '1'),
-            codigo_meio=config.get('codigo_meio', '5'),
-            codigo_cc=config.get('codigo_cc', '337'),
-        )
+    meta: Dict = {}
+    planilha = PlanilhaExtrato(out_xlsx_path)
+    txt = open(out_txt_path, 'w', encoding='utf-8') if out_txt_path else None
+    try:
+        for _, rows in iter_xp_extrato_paginas(in_pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang,
+                                               ocr_dpi_min=ocr_dpi_min, workers=workers,
+                                               backend_palavras=backend_palavras, meta=meta):
+            for r in rows:
+                planilha.adicionar(r)
+                if txt is not None:
+                    linha = _linha_txt_contabil(r, *codigos_txt)
+                    if linha is not None:
+                        txt.write(linha + '\n')
+            planilha.aceitar_pagina()
+    except BaseException:
+        # parse falhou no meio: não deixa XLSX/TXT pela metade
+        planilha.descartar()
+        if txt is not None:
+            txt.close()
+            os.remove(out_txt_path)
+        raise
+    if txt is not None:
+        txt.close()
+    planilha.salvar()
 
     resultado = {
-        'quantidade_lancamentos': len(rows),
+        'quantidade_lancamentos': planilha.linhas,
         'paginas_ocr': meta.get("paginas_ocr", []),
         'usou_ocr': meta.get("usou_ocr", False),
+        'dpi_paginas': meta.get("dpi_paginas", {}),
     }
     if meta.get("usou_ocr"):
         aviso = "⚠️ Atenção: OCR foi utilizado nas páginas {}. Confira os valores, pois o OCR pode confundir números (ex.: 0 ↔ O, , ↔ .).".format(
@@ -504,7 +810,8 @@ def processar_extrato_pdf(in_pdf_path: str, out_xlsx_path: str, out_txt_path: Op
         print(aviso)
     return resultado
 
-def debug_dump_pdf(pdf_path: str, max_lines_per_page: int = 9999, *, ocr_lang: str = "por", ocr_dpi: int = 300) -> None:
+def debug_dump_pdf(pdf_path: str, max_lines_per_page: int = 9999, *, ocr_lang: str = "por", ocr_dpi: int = 300,
+                   backend_palavras: Optional[str] = None) -> None:
     print("==== DEBUG XP EXTRATO ====")
     try:
         import pdfplumber
@@ -512,42 +819,32 @@ def debug_dump_pdf(pdf_path: str, max_lines_per_page: int = 9999, *, ocr_lang: s
         print("pdfplumber não disponível:", e)
         return
 
-    # roda o parser (com OCR condicional) para obter rows + meta (inclusive páginas com OCR)
-    try:
-        rows_preview, meta = parse_xp_extrato_pdf(pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang)
-    except Exception as e:
-        print("ERRO rodando parse_xp_extrato_pdf:", e)
-        rows_preview, meta = [], {"usou_ocr": False, "paginas_ocr": []}
+    with SessaoPDF(pdf_path, backend_palavras) as sessao:
+        # roda o parser (com OCR condicional) para obter rows + meta (inclusive páginas com OCR);
+        # as linhas cruas de cada página ficam na sessão e são reaproveitadas abaixo
+        try:
+            rows_preview, meta = parse_xp_extrato_pdf(pdf_path, ocr_dpi=ocr_dpi, ocr_lang=ocr_lang,
+                                                      sessao=sessao)
+        except Exception as e:
+            print("ERRO rodando parse_xp_extrato_pdf:", e)
+            rows_preview, meta = [], {"usou_ocr": False, "paginas_ocr": []}
 
-    if meta.get("usou_ocr"):
-        print(f"⚠️ AVISO GERAL: OCR foi utilizado neste arquivo nas páginas {', '.join(map(str, meta['paginas_ocr']))}.")
-        print("   Confira os valores, pois podem haver erros de reconhecimento (0↔O, vírgula/ponto, etc.).")
-
-    fitz_doc = fitz.open(pdf_path)
-    total_rows = rows_preview
-
-    with pdfplumber.open(pdf_path) as pdf:
-        for pidx, page in enumerate(pdf.pages, start=1):
-            # Se esta página consta como OCR pelo parser, já renderizamos direto via OCR
-            if pidx in meta.get("paginas_ocr", []):
-                used_ocr = True
-                fpage = fitz_doc.load_page(pidx - 1)
-                raw_lines = _ocr_page_to_lines(fpage, dpi=ocr_dpi, lang=ocr_lang)
-            else:
-                # tenta texto; se falhar, gera OCR (não deve acontecer se meta já tinha)
-                raw_lines = _page_to_lines(page)
-                used_ocr = False
-                if not raw_lines:
-                    text = page.extract_text() or ""
-                    raw_lines = [l.rstrip() for l in text.splitlines()]
-                if not raw_lines:
-                    used_ocr = True
-                    fpage = fitz_doc.load_page(pidx - 1)
-                    raw_lines = _ocr_page_to_lines(fpage, dpi=ocr_dpi, lang=ocr_lang)
+        if meta.get("usou_ocr"):
+            print(f"⚠️ AVISO GERAL: OCR foi utilizado neste arquivo nas páginas {', '.join(map(str, meta['paginas_ocr']))}.")
+            print("   Confira os valores, pois podem haver erros de reconhecimento (0↔O, vírgula/ponto, etc.).")
+
+        total_rows = rows_preview
+
+        for pidx in range(1, sessao.total_paginas + 1):
+            # mesmas linhas que o parser usou (só extrai de novo se o parser parou antes desta página)
+            raw_lines, dpi_pag = _linhas_cruas(sessao, pidx - 1, ocr_dpi, ocr_dpi, ocr_lang)
+            used_ocr = dpi_pag is not None
 
             exploded = _explode_lines(raw_lines)
 
             tag_ocr = " | OCR" if used_ocr else ""
+            if used_ocr:
+                tag_ocr += f" {dpi_pag}dpi"
             print(f"\n--- PÁGINA {pidx} | cruas={len(raw_lines)} | explodidas={len(exploded)}{tag_ocr} ---")
             if used_ocr:
                 print("⚠️ AVISO: Esta página foi processada com OCR. Confira os valores extraídos.")
@@ -584,8 +881,6 @@ def debug_dump_pdf(pdf_path: str, max_lines_per_page: int = 9999, *, ocr_lang: s
                 tagtxt = " | ".join(tags) if tags else "..."
                 print(f"[P{pidx}:{i:03d}] {tagtxt}  {line}")
 
-    fitz_doc.close()
-
     print("\n==== RESUMO PARSER ====")
     print(f"Lançamentos extraídos: {len(total_rows)}")
     for j, r in enumerate(total_rows[:20], start=1):
@@ -603,9 +898,11 @@ if __name__ == "__main__":
     parser.add_argument("--max", type=int, default=200, help="Máx. linhas por página no debug")
     parser.add_argument("--ocr-lang", default="por", help="Idioma do Tesseract (ex.: 'por' ou 'por+eng')")
     parser.add_argument("--ocr-dpi", type=int, default=300, help="DPI para renderização antes do OCR")
+    parser.add_argument("--backend", choices=BACKENDS_PALAVRAS, help="quem lê as palavras (padrão: EXTRATO_BACKEND_PALAVRAS)")
     args = parser.parse_args()
 
     path = os.path.expanduser(args.pdf)
     if not os.path.isfile(path):
         raise FileNotFoundError(f"Arquivo não encontrado: {path}")
-    debug_dump_pdf(path, max_lines_per_page=args.max, ocr_lang=args.ocr_lang, ocr_dpi=args.ocr_dpi)
+    debug_dump_pdf(path, max_lines_per_page=args.max, ocr_lang=args.ocr_lang, ocr_dpi=args.ocr_dpi,
+                   backend_palavras=args.backend)
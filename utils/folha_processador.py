@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import pandas as pd
 from decimal import Decimal
+from utils import classificacao
 
 def format_val(v):
     s = str(v).replace('.', '').replace(',', '.')
@@ -26,30 +27,10 @@ def fmt_competencia(c) -> str:
         return s
 
 def map_conta(tipo):
-    tipo = str(tipo)
-    if 'Cálculo Normal' in tipo or 'Folha Complementar' in tipo:
-        return 1634
-    elif 'Pensão Judicial Normal' in tipo:
-        return 1637
-    elif 'Rescisão Normal' in tipo:
-        return 1634
-    elif 'Férias' in tipo:
-        return 313
-    else:
-        return 0
+    return classificacao.classificar("folha", tipo)[0]
 
 def map_historico(tipo):
-    tipo = str(tipo)
-    if 'Cálculo Normal' in tipo or 'Folha Complementar' in tipo:
-        return 700
-    elif 'Pensão Judicial Normal' in tipo:
-        return 147
-    elif 'Rescisão Normal' in tipo:
-        return 132
-    elif 'Férias' in tipo:
-        return 139
-    else:
-        return 0
+    return classificacao.classificar("folha", tipo)[1]
 
 def normalize_name(n):
     if pd.isna(n):
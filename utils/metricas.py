@@ -0,0 +1,125 @@
+# utils/metricas.py
+"""
+Medições por nota (tempo por etapa + contadores), com custo quase zero
+quando ninguém está medindo.
+
+    with metricas.medindo() as m:
+        extrair_info_pdf(...)
+    m.como_dict()  # {"tempos": {...}, "contadores": {...}, "anotacoes": {...}}
+
+O código instrumentado só chama metricas.etapa("nome"), contar() e anotar();
+fora de um medindo() essas chamadas não fazem nada. A medição corrente é por
+thread (jobs da fila web rodam em threads).
+
+Sinks recebem um dict por nota e um do relatório da comparação (com
+"relatorio": True; ver emitir()); NF_METRICAS_JSONL=<arquivo> registra um
+sink que grava uma linha JSON por registro.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+_local = threading.local()
+_sinks: List[Callable[[Dict], None]] = []
+_sinks_lock = threading.Lock()
+
+
+class Metricas:
+    """Acumula tempos (segundos) por etapa, contadores e anotações livres."""
+
+    __slots__ = ("tempos", "contadores", "anotacoes")
+
+    def __init__(self):
+        self.tempos = defaultdict(float)
+        self.contadores = defaultdict(int)
+        self.anotacoes = {}
+
+    def como_dict(self) -> Dict:
+        return {
+            "tempos": {k: round(v, 6) for k, v in self.tempos.items()},
+            "contadores": dict(self.contadores),
+            "anotacoes": dict(self.anotacoes),
+        }
+
+
+def atual() -> Optional[Metricas]:
+    return getattr(_local, "metricas", None)
+
+
+@contextmanager
+def medindo():
+    """Abre uma medição para o bloco (aninhável: a externa é restaurada no fim)."""
+    anterior = atual()
+    m = _local.metricas = Metricas()
+    try:
+        yield m
+    finally:
+        _local.metricas = anterior
+
+
+@contextmanager
+def etapa(nome: str):
+    """Soma o tempo do bloco em tempos[nome] da medição corrente."""
+    m = atual()
+    if m is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        m.tempos[nome] += time.perf_counter() - t0
+
+
+def contar(nome: str, n: int = 1) -> None:
+    m = atual()
+    if m is not None:
+        m.contadores[nome] += n
+
+
+def anotar(nome: str, valor) -> None:
+    m = atual()
+    if m is not None:
+        m.anotacoes[nome] = valor
+
+
+# ------ sinks ------
+def registrar_sink(sink: Callable[[Dict], None]) -> None:
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remover_sink(sink: Callable[[Dict], None]) -> None:
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def emitir(registro: Dict) -> None:
+    """Entrega o registro de uma nota a todos os sinks; falha de sink não derruba o lote."""
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink(registro)
+        except Exception as e:
+            print(f"[METRICAS] sink falhou: {e}")
+
+
+def sink_jsonl(path: str) -> Callable[[Dict], None]:
+    """Sink que acrescenta uma linha JSON por registro em path."""
+    lock = threading.Lock()
+
+    def _gravar(registro: Dict) -> None:
+        linha = json.dumps(registro, ensure_ascii=False, default=str)
+        with lock, open(path, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+    return _gravar
+
+
+if os.environ.get("NF_METRICAS_JSONL"):
+    registrar_sink(sink_jsonl(os.environ["NF_METRICAS_JSONL"]))
@@ -1,13 +1,14 @@
+import multiprocessing
 import os
-import io
 import re
-import stat
-import shutil
 import tempfile
 import zipfile
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal, InvalidOperation
 import fitz  # PyMuPDF
+import numpy as np
 import pytesseract
 import pdfplumber
 from PIL import Image
@@ -15,6 +16,7 @@ from datetime import date
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 import sys
+from utils import metricas, nf_store, ocr_cache, ocr_motor
 
 if sys.platform.startswith("win"):
     pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
@@ -22,6 +24,15 @@ if sys.platform.startswith("win"):
 
 DEBUG_NF = True
 
+# processos para extrair as notas do ZIP e ler o relatório; 1 (padrão) roda no
+# próprio processo, o pool é opt-in: a comparação já roda num processo do
+# nf_jobs (NF_JOB_WORKERS), e um pool por CPU em cada job disputa as mesmas CPUs
+NF_WORKERS = int(os.environ.get("NF_WORKERS", "1"))
+
+def _contexto_pool():
+    """Processos "spawn": quem chama pode ser um processo com threads (servidor web), e fork ali não é seguro."""
+    return multiprocessing.get_context("spawn")
+
 def _dbg(arq, msg):
     if DEBUG_NF:
         print(f"[NFDBG:{os.path.basename(arq)}] {msg}")
@@ -49,512 +60,1060 @@ SPACES = rf"[.\s{UNICODE_SPACES}]"
 MONEY  = rf"(?:\d{{1,3}}(?:{SPACES}\d{{3}})*|\d{{4,6}})\s*,\s*\d\s*\d"
 SPAN   = r"[\s\S]{0,300}?"                            
 
-def extrair_info_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    texto_puro, ocr_text = "", []
-    for page in doc:
-        texto_puro += page.get_text() or ""
-        pix = page.get_pixmap(dpi=300, alpha=False)
-        img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("L")
-        bw  = img.point(lambda x: 0 if x < 180 else 255, "1")
-        cfg = r"--oem 3 --psm 6"
-        ocr_text.append(pytesseract.image_to_string(bw, lang="por", config=cfg))
-    doc.close()
-
-    texto = (texto_puro or "") + "\n" + "\n".join(ocr_text)
-    _dbg(pdf_path, f"text_len={len(texto)}  puro={len(texto_puro)}  ocr_len_total={sum(len(t) for t in ocr_text)}")
+# passos de extração do valor considerados confiáveis (o FALLBACK não é)
+PASSOS_CONFIAVEIS = ("NEAR-LINE", "LABEL-FWD", "GLOBAL-FWD", "ANC-JANELA")
+
+# "auto": camada de texto primeiro, OCR só quando precisar; "ocr": OCR em todas as páginas
+NF_MODO_EXTRACAO = os.environ.get("NF_MODO_EXTRACAO", "auto")
+
+# DPIs tentados no OCR da página inteira, do mais barato ao mais fino
+# (ex.: NF_DPI_OCR="150,300"). O padrão é uma passada só: o LSTM do tesseract
+# normaliza a altura das linhas e a 150 dpi o OCR ainda custa ~70% do de 300
+NF_DPI_OCR = tuple(sorted(int(d) for d in os.environ.get("NF_DPI_OCR", "300").split(",")))
+
+# OCR por regiões (NF_OCR_REGIOES=1): antes da página inteira, OCR a 300 dpi
+# só das faixas em volta de rótulos/datas/valores. Desligado por padrão: nas
+# notas escaneadas que testamos a maioria cai na página inteira mesmo assim
+NF_OCR_REGIOES = os.environ.get("NF_OCR_REGIOES", "0") == "1"
+DPI_LAYOUT = 100          # passada barata só para achar os rótulos
+RX_ANCORA_ROI = re.compile(r"emiss|emitid|valor|total|l[ií]quido|compet|data|R\$|\d[,.]\d{2}\b|\d{2}/\d{2}/", re.IGNORECASE)
+ROI_ACIMA, ROI_ABAIXO = 1.0, 4.0   # em alturas de linha a partir do rótulo
+ROI_MAX_COBERTURA = 0.6   # acima disso a página inteira sai mais barata
+
+# limiar de binarização do OCR: número fixo (0-255) ou "otsu" (calculado por página)
+NF_LIMIAR = os.environ.get("NF_LIMIAR", "180")
+
+# versão do extrator guardada com cada nota no utils.nf_store: incremente ao
+# mudar regex/passos, para que notas já extraídas sejam refeitas
+EXTRATOR_VERSAO = "2"
+
+def versao_extrator():
+    """Versão + configurações que mudam o resultado da extração (inclusive o motor de OCR
+    e o DPI da classificação NFS-e/DANFE, que decide quais notas são descartadas)."""
+    return (f"{EXTRATOR_VERSAO}|modo={NF_MODO_EXTRACAO}|dpi={','.join(map(str, NF_DPI_OCR))}"
+            f"|roi={int(NF_OCR_REGIOES)}|limiar={NF_LIMIAR}|motor={ocr_motor.nome_motor()}"
+            f"|dpi_classificacao={NF_DPI_CLASSIFICACAO}")
+
+def _cinza(page, dpi, clip=None):
+    """Renderiza direto em tons de cinza; devolve (pixmap, array HxW sobre pix.samples, sem cópia)."""
+    with metricas.etapa("get_pixmap"):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False, clip=clip)
+    metricas.contar("bytes_renderizados", len(pix.samples_mv))
+    arr = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return pix, arr
+
+def _limiar_otsu(arr):
+    """Limiar de Otsu pelo histograma (maximiza a variância entre as classes)."""
+    hist = np.bincount(arr.ravel(), minlength=256).astype(np.float64)
+    niveis = np.arange(256)
+    peso = np.cumsum(hist)
+    soma = np.cumsum(hist * niveis)
+    total, soma_total = peso[-1], soma[-1]
+    fundo = total - peso
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media_frente = soma / peso
+        media_fundo = (soma_total - soma) / fundo
+        variancia = peso * fundo * (media_frente - media_fundo) ** 2
+    return int(np.nanargmax(variancia)) + 1
+
+def _render_bw(page, dpi, clip=None):
+    pix, arr = _cinza(page, dpi, clip)
+    with metricas.etapa("binarizacao"):
+        limiar = _limiar_otsu(arr) if NF_LIMIAR == "otsu" else int(NF_LIMIAR)
+        # array bool vira imagem modo "1" (preto < limiar), sem callback por pixel
+        return Image.fromarray(arr >= limiar)
+
+def _ocr_pagina(page, clip=None, dpi=300):
+    cfg = r"--oem 3 --psm 6"
+
+    def _reconhecer():
+        img = _render_bw(page, dpi, clip)
+        metricas.contar("ocr_chamadas")
+        with metricas.etapa("tesseract"):
+            return ocr_motor.reconhecer(img, lang="por", config=cfg)
+
+    # renderização, limiar de binarização e motor também mudam o texto: entram na chave do cache
+    chave_cfg = f"{cfg} cinza limiar={NF_LIMIAR} motor={ocr_motor.nome_motor()}"
+    if clip is not None:
+        chave_cfg += " clip=" + ",".join(f"{v:.1f}" for v in clip)
+    return ocr_cache.ocr_com_cache(page, _reconhecer, dpi=dpi, lang="por", config=chave_cfg)
+
+def _ocr_suficiente(pdf_path, texto):
+    """
+    A página sozinha já basta: os passos acham nela data rotulada e valor por
+    um caminho confiável. Padrões soltos não servem de critério — em baixa
+    resolução a data de emissão se perde e o fallback pega o vencimento.
+    """
+    if not (RX_DATA_ANY.search(texto) and RX_VAL_PLAIN.search(texto)):
+        return False
+    info, passo, data_rotulada = EXTRATOR_NFSE.extrair(pdf_path, texto)
+    return _confiavel(info, passo, data_rotulada) and bool(info.get("valor"))
+
+def _ocr_adaptativo(page, pdf_path):
+    """OCR começando no menor DPI de NF_DPI_OCR; só re-renderiza mais fino se faltar âncora. -> (texto, dpi)"""
+    for dpi in NF_DPI_OCR:
+        texto = _ocr_pagina(page, dpi=dpi)
+        if dpi == NF_DPI_OCR[-1] or _ocr_suficiente(pdf_path, texto):
+            return texto, dpi
+
+def _palavras_layout(page):
+    """
+    Caixas (x0, y0, x1, y1, texto), em pontos da página: da camada de texto
+    quando ela tem algum rótulo; senão de um OCR a DPI_LAYOUT.
+    """
+    with metricas.etapa("get_text"):
+        palavras = [w[:5] for w in page.get_text("words")]
+    if any(RX_ANCORA_ROI.search(w[4]) for w in palavras):
+        return palavras
+
+    cfg = r"--oem 3 --psm 11"
+
+    def _reconhecer():
+        with metricas.etapa("get_pixmap"):
+            pix = page.get_pixmap(dpi=DPI_LAYOUT, colorspace=fitz.csGRAY, alpha=False)
+        metricas.contar("bytes_renderizados", len(pix.samples_mv))
+        img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+        metricas.contar("ocr_chamadas")
+        with metricas.etapa("tesseract"):
+            return ocr_motor.dados(img, lang="por", config=cfg)
+
+    tsv = ocr_cache.ocr_com_cache(page, _reconhecer, dpi=DPI_LAYOUT, lang="por",
+                                  config=f"{cfg} tsv motor={ocr_motor.nome_motor()}")
+    escala = 72 / DPI_LAYOUT
+    r = page.rect
+    palavras = []
+    for linha in tsv.splitlines():
+        c = linha.split("\t")
+        if len(c) < 12 or not c[0].isdigit() or not c[11].strip():
+            continue
+        x, y, w, h = (int(v) * escala for v in c[6:10])
+        palavras.append((r.x0 + x, r.y0 + y, r.x0 + x + w, r.y0 + y + h, c[11]))
+    return palavras
 
-    # Ignora NFe (não NFS-e)
-    if re.search(r'\bNFE\b', texto, re.IGNORECASE) and not PATTERN_NFSE.search(texto):
+def _faixas_roi(page):
+    """Faixas horizontais (largura total) em volta dos rótulos, já unidas; None se não compensa."""
+    if page.rotation:
         return None
-
-    def _norm(s: str) -> str:
-        s = (s or "").replace('\u00A0', ' ')
-        return re.sub(r'[ \t]+', ' ', s)
-
-    nome = os.path.basename(pdf_path)
-    m = re.search(r"(\d+)", nome)
-    raw = m.group(1) if m else ""
-    parts = re.split(r"0{4,}", raw)
-    numero = parts[-1].lstrip("0") if len(parts) > 1 and parts[-1] else raw.lstrip("0")
-
-    # Normalização agressiva de espaços e separadores
-    header_section = _norm(texto)
-    header_section = (header_section
-                      .replace('\u00A0', ' ')
-                      .replace('\u202F', ' ')
-                      .replace('\u2007', ' ')
-                      .replace('\u2009', ' '))
-    def _compact_money_digits(s: str) -> str:
-        def repl(m):
-            left = re.sub(r"\s+", "", m.group(1))
-            return f"{left},{m.group(2)}{m.group(3)}"
-        return re.sub(r'(?<!\d)(\d(?:\s?\d){0,10})\s*,\s*(\d)\s*(\d)(?!\d)', repl, s)
-    header_section = re.sub(r'R\$\s*(?=\d)', 'R$ ', header_section)
-    header_section = re.sub(r'(\d)\s*,\s*(\d{2})', r'\1,\2', header_section)
-    header_section = _compact_money_digits(header_section)
-
-    # ===== DATA =====
-    RX_DATA_ANY = re.compile(r"(\d{2}[\/\.-]\d{2}[\/\.-](?:\d{2}|\d{4}))", re.I)
-    RX_EMISSAO_NEAR = re.compile(
-        r"(?:data(?:\s+\w+){0,5}\s*(?:da\s*nota\s*|de\s*)?emiss[aã]o)\D{0,120}" + RX_DATA_ANY.pattern,
-        re.I
-    )
-    
-    RX_CNPJ = re.compile(r'\b\d{2}[.\s]?\d{3}[.\s]?\d{3}\s*/\s*\d{4}\s*-\s*\d{2}\b')
-    RX_CPF  = re.compile(r'\b\d{3}[.\s]?\d{3}[.\s]?\d{3}\s*-\s*\d{2}\b')
-    header_section = RX_CNPJ.sub(' [CNPJ] ', header_section)
-    header_section = RX_CPF.sub(' [CPF] ', header_section)
-    linhas = [x.strip() for x in header_section.splitlines()]
-    flat   = " ".join(linhas)
-    
-    def _canon_date(s: str) -> str:
-        d, m, y = re.split(r"[\/\.-]", s)
-        if len(y) == 2:
-            y = ("20" if int(y) <= 49 else "19") + y
-        return f"{d}/{m}/{y}"
-
-    def _first_date(s: str):
-        m = RX_DATA_ANY.search(s)
-        return _canon_date(m.group(1)) if m else None
-
-    def _pick_date(lines):
-        HAS_TIME   = re.compile(r"\b\d{2}:\d{2}:\d{2}\b")
-        BAN_DATE   = ("impress", "compet", "venc", "parcela", "boleto")
-        IS_PERIOD  = re.compile(r"\bper[íi]odo\b", re.IGNORECASE)
-        TWO_DATES  = re.compile(r"\d{2}/\d{2}/\d{4}\s*(?:a|-|–)\s*\d{2}/\d{2}/\d{4}", re.IGNORECASE)
-
-        for i, ln in enumerate(lines):
-            l = ln.lower()
-            if "data" in l and "emiss" in l and "impress" not in l:
-                d = _first_date(ln)
-                if d: return d
-                for j in range(max(0, i-2), min(len(lines), i+10)):
-                    lj = lines[j].lower()
-                    if any(b in lj for b in BAN_DATE) or IS_PERIOD.search(lines[j]) or TWO_DATES.search(lines[j]):
-                        continue
-                    d = _first_date(lines[j])
-                    if d: return d
-
-        for i, ln in enumerate(lines):
-            l = ln.lower()
-            if "data" in l and ("servi" in l or "execu" in l) and not IS_PERIOD.search(ln) and not TWO_DATES.search(ln):
-                d = _first_date(ln)
-                if d: return d
-                for j in range(max(0, i-2), min(len(lines), i+3)):
-                    lj = lines[j].lower()
-                    if any(b in lj for b in BAN_DATE) or HAS_TIME.search(lines[j]) or IS_PERIOD.search(lines[j]) or TWO_DATES.search(lines[j]):
-                        continue
-                    d = _first_date(lines[j])
-                    if d: return d
-
-        BAN_DATE_EXTRA = ("alvar","licen","vigênc","vigenc","simples","cnae","fund","constit","abertura")
-        def _ymd_tuple(dstr: str):
-            return (int(dstr[6:10]), int(dstr[3:5]), int(dstr[0:2]))
-        cands = []
-        for ln in lines:
-            l = ln.lower()
-            if any(b in l for b in BAN_DATE) or any(b in l for b in BAN_DATE_EXTRA):
-                continue
-            if HAS_TIME.search(ln) or IS_PERIOD.search(ln) or TWO_DATES.search(ln):
-                continue
-            for m in RX_DATA_ANY.finditer(ln):
-                d = _canon_date(m.group(1))
-                cands.append((_ymd_tuple(d), d))
-        if cands:
-            cands.sort(reverse=True)
-            return cands[0][1]
+    r = page.rect
+    faixas = []
+    for x0, y0, x1, y1, txt in _palavras_layout(page):
+        if RX_ANCORA_ROI.search(txt):
+            h = max(y1 - y0, 6.0)
+            faixas.append([max(r.y0, y0 - ROI_ACIMA * h), min(r.y1, y1 + ROI_ABAIXO * h)])
+    if not faixas:
         return None
+    faixas.sort()
+    unidas = [faixas[0]]
+    for a, b in faixas[1:]:
+        if a <= unidas[-1][1]:
+            unidas[-1][1] = max(unidas[-1][1], b)
+        else:
+            unidas.append([a, b])
+    if sum(b - a for a, b in unidas) > ROI_MAX_COBERTURA * r.height:
+        return None
+    return [fitz.Rect(r.x0, a, r.x1, b) for a, b in unidas]
 
-    m_emissao = RX_EMISSAO_NEAR.search(flat)
-    if m_emissao:
-        data = _canon_date(m_emissao.group(1))
-    else:
-        data = _pick_date(linhas)
-    if not data:
-        todas = [_canon_date(m.group(1)) for m in RX_DATA_ANY.finditer(flat)]
-        if todas:
-            data = max(todas, key=lambda d: (int(d[6:10]), int(d[3:5]), int(d[0:2])))
-    if data:
-        md = re.match(r"(\d{2})/(\d{2})/\d{2,4}$", data)
-        if md:
-            data = f"{md.group(1)}/{md.group(2)}/2025"
-
-    # --- rótulos bons e termos a evitar perto do número ---
-    GOOD_ANCHOR = re.compile(
-        r"(?:(?:valor|vlr\.?)\s+bruto\s+da\s+nota|"
-        r"valor\s+total\s+(?:da\s+nfs[–—-]?e|da\s+nota|do\s+documento)|"
-        r"valor\s+dos?\s+servi[cç]os?|"
-        r"total\s+do\s+servi[cç]o|"
-        r"valor\s+l[ií]quido|"
-        r"valor\s+da\s+nota|"
-        r"vlr\.?\s*total|"
-        r"valor\s+do\s+documento|"
-        r"valor\s+do\s+servi[cç]o|"
-        r"valor\s+(?:bruto|l[ií]quido|unit[áa]rio)\s+do\s+servi[cç]o|"
-        r"valor\s+l[ií]quido\s+do\s+servi[cç]o|"
-        r"valor\s+a\s+pagar|total\s+a\s+pagar|"
-        r"valor\s+total\s+da\s+nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?|"
-        r"valor\s+bruto\s+da\s+nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?)",
-        re.IGNORECASE
-    )
-
-    BAD_TAXES = r"(?:iss|issqn|pis|cofins|csll|inss|irrf)"
-    BAD_ISS_FUZZ = r"(?:iss|i[s5]{2}|[1iIl][s5]{2})"
-
-    BAD_CTX = re.compile(
-        rf"\b({BAD_ISS_FUZZ}|issqn|pis|cofins|csll|inss|irrf|"
-        r"al[ií]q|al[ií]quota|ret(?:id|en)|dedu[cç][aã]o|descon|"
-        r"base\s+de\s+c[aá]lculo|base\s+calc|ibpt|aprox(?:imad[oa])?|"
-        r"tribut|imposto|parcela|parcelas|venc(?:imento)?|juros|multa|"
-        r"pagamento|boleto|duplicata|carn[eé]|"
-        r"periodo|per[íi]odo|compet[eê]ncia|compet|"
-        r"quantidade|qtd|descri[cç][aã]o|cod\.?\s*serv|abatiment|percent|%|cep|"
-        r"cnpj|cpf|inscri[cç][aã]o|rps|c[oó]d|verifica[cç][aã]o|autenticidade)\b",
-        re.IGNORECASE
-    )
-
-    # usados no PASSO 3
-    rx_val_plain = re.compile(rf'(?<!\d)({MONEY})(?!\d)')
-    rx_val_rs    = re.compile(rf'(?<!\d)R\$\s*({MONEY})(?!\d)', re.IGNORECASE)
-
-    NEAR_LABELS = re.compile(
-        r"(valor\s+total\s+da\s+(?:nfs[–—-]?e|nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?|documento)|"
-        r"valor\s+dos?\s+servi[cç]os?|"
-        r"valor\s+do\s+servi[cç]o|"
-        r"valor\s+unit[áa]rio\s+do\s+servi[cç]o|"
-        r"valor\s+bruto\s+do\s+servi[cç]o|"
-        r"valor\s+l[ií]quido(?:\s+do\s+servi[cç]o)?|"
-        r"valor\s+a\s+pagar|total\s+a\s+pagar|"
-        r"valor\s+da\s+nota)",
-        re.IGNORECASE
-    )
-    RX_MONEY_ANY = re.compile(rf"(R\$\s*)?({MONEY})", re.IGNORECASE)
+def _ocr_regioes(page):
+    """Texto OCR só das faixas de interesse (de cima para baixo) ou None."""
+    faixas = _faixas_roi(page)
+    if not faixas:
+        return None
+    return "\n".join(_ocr_pagina(page, clip) for clip in faixas)
+
+# Classificação barata NF-e x NFS-e (antes do pipeline caro). Marcas de NFS-e
+# mandam; sem elas, "DANFE" ou várias seções típicas do layout do DANFE = NF-e
+RX_NFSE_FORTE = re.compile(
+    r"NFS[–—-]?e\b|DANFSE|nota\s+fiscal\s+(?:eletr[ôo]nica\s+)?de\s+servi[çc]|"
+    r"prestador\s+d[eo]s?\s+servi|tomador|\bRPS\b",
+    re.IGNORECASE,
+)
+RX_DANFE = re.compile(r"\bDANFE\b|documento\s+auxiliar\s+da\s+nota\s+fiscal\s+eletr[ôo]nica", re.IGNORECASE)
+RX_DANFE_LAYOUT = [re.compile(p, re.IGNORECASE) for p in (
+    r"natureza\s+d[ae]\s+opera[çc][ãa]o",
+    r"c[áa]lculo\s+do\s+imposto",
+    r"base\s+de\s+c[áa]lculo\s+d[eo]\s+icms",
+    r"valor\s+total\s+dos\s+produtos",
+    r"chave\s+de\s+acesso",
+    r"transportador",
+    r"dados\s+do\s+produto",
+)]
+DANFE_MIN_SECOES = 3
+# a 100 dpi o "DANFE" do cabeçalho ainda é lido; ~0,5 s por página escaneada
+NF_DPI_CLASSIFICACAO = int(os.environ.get("NF_DPI_CLASSIFICACAO", 100))
+FAIXA_CLASSIFICACAO = 0.25  # fração de cima da página (canhoto + cabeçalho do DANFE)
+
+def _classificar_texto(texto):
+    """'nfse', 'nfe' ou None (não dá para dizer só por este texto)."""
+    if not texto.strip():
+        return None
+    if RX_NFSE_FORTE.search(texto):
+        return "nfse"
+    if RX_DANFE.search(texto) or sum(1 for rx in RX_DANFE_LAYOUT if rx.search(texto)) >= DANFE_MIN_SECOES:
+        return "nfe"
+    if RX_NFE.search(texto) and not PATTERN_NFSE.search(texto):
+        return "nfe"
+    return None
+
+def classificar_documento(page, texto):
+    """
+    Classifica pela primeira página: camada de texto (texto) e, se ela estiver
+    vazia, OCR em baixo DPI só da faixa de cima. Retorna (tipo, origem) com
+    tipo 'nfse', 'nfe' ou None (indefinido: segue o pipeline normal).
+    """
+    tipo = _classificar_texto(texto)
+    if tipo or texto.strip():
+        return tipo, "texto"
+    r = page.rect
+    topo = fitz.Rect(r.x0, r.y0, r.x1, r.y0 + r.height * FAIXA_CLASSIFICACAO)
+    return _classificar_texto(_ocr_pagina(page, topo, dpi=NF_DPI_CLASSIFICACAO)), "ocr do topo"
 
-    best = None  # tuple(score, valor_decimal)
+def _confiavel(info, passo, data_rotulada):
+    return bool(info) and passo in PASSOS_CONFIAVEIS and bool(info.get("data")) and data_rotulada
 
-    def _score_candidate(has_rs: bool, same_line: bool, dist_chars: int, val: Decimal) -> int:
-        # quanto menor melhor
-        score  = 0 if same_line else 120          # penaliza forte se não estiver na mesma linha
-        score += 0 if has_rs else 60              # ter "R$" ajuda bem
-        score += min(dist_chars, 60)              # proximidade do rótulo
-        return score
+def extrair_info_pdf(pdf_path, modo=None, dados=None):
+    """
+    Extrai número (do nome do arquivo), data de emissão e valor de uma NFS-e.
+    Com dados (bytes do arquivo) o documento é aberto da memória e pdf_path
+    serve só como nome.
+
+    O OCR de página começa no menor DPI de NF_DPI_OCR e só sobe se faltarem
+    as âncoras; info["meta"]["dpi_paginas"] registra o DPI de cada página.
+    As páginas passam pelo OCR uma a uma e o laço para quando o resultado fica
+    confiável; info["meta"]["paginas_puladas"] conta as que ficaram de fora.
+
+    modo="auto" (padrão, ver NF_MODO_EXTRACAO) roda os passos primeiro na camada
+    de texto nativa; só renderiza e faz OCR das páginas sem texto; depois
+    (com NF_OCR_REGIOES) só das faixas em volta dos rótulos de data/valor e,
+    se ainda não houver resultado confiável, das páginas inteiras. modo="ocr"
+    faz OCR em todas as páginas antes de procurar (comportamento original).
+    Retorna None para NF-e (ver classificar_documento).
+    """
+    return _extrair_info(pdf_path, modo, dados)[0]
+
+def _extrair_info(pdf_path, modo=None, dados=None):
+    """extrair_info_pdf que também devolve o motivo do descarte: (info, descarte)."""
+    modo = modo or NF_MODO_EXTRACAO
+    if dados is not None:
+        ext = os.path.splitext(pdf_path)[1].lstrip(".").lower() or "pdf"
+        doc = fitz.open(stream=dados, filetype=ext)
+    else:
+        doc = fitz.open(pdf_path)
+    try:
+        paginas = list(doc)
+        metricas.contar("paginas", len(paginas))
+        with metricas.etapa("get_text"):
+            textos = [page.get_text() or "" for page in paginas]
+        texto_puro = "".join(textos)
+
+        # 0) NF-e/DANFE sai antes de qualquer renderização ou OCR
+        with metricas.etapa("classificacao"):
+            tipo, origem = classificar_documento(paginas[0], textos[0]) if paginas else (None, None)
+        if tipo == "nfe":
+            _dbg(pdf_path, f"[DESCARTE] NF-e ({origem})")
+            metricas.anotar("passo", "DESCARTE")
+            return None, f"NF-e ({origem})"
+
+        ocr_text = {}
+        dpi_paginas = {}  # página (1-based) -> DPI usado no OCR
+
+        if modo != "ocr":
+            # ordem de leitura (sort=True) aproxima o texto nativo do que o OCR
+            # enxerga; o fluxo do PDF costuma separar rótulo e valor
+            with metricas.etapa("get_text"):
+                texto_ordenado = "".join(page.get_text(sort=True) or "" for page in paginas)
+            # 1) só camada de texto
+            if texto_ordenado.strip():
+                info, passo, data_rotulada = _campos_do_texto(pdf_path, texto_ordenado, {})
+                if _confiavel(info, passo, data_rotulada):
+                    return _com_meta(info, dpi_paginas), None
+            # 2) OCR apenas das páginas sem camada de texto
+            vazias = [i for i, t in enumerate(textos) if not t.strip()]
+            if vazias and len(vazias) < len(paginas):
+                info, passo, data_rotulada, puladas = _ocr_incremental(
+                    pdf_path, paginas, vazias, texto_ordenado, ocr_text, dpi_paginas)
+                if _confiavel(info, passo, data_rotulada):
+                    return _com_meta(info, dpi_paginas, puladas), None
+
+            # 3) OCR só das regiões com rótulos de data/valor
+            if NF_OCR_REGIOES:
+                roi_text = dict(ocr_text)
+                for i, page in enumerate(paginas):
+                    if i not in roi_text:
+                        t = _ocr_regioes(page)
+                        if t:
+                            roi_text[i] = t
+                if len(roi_text) > len(ocr_text):
+                    info, passo, data_rotulada = _campos_do_texto(pdf_path, texto_ordenado, roi_text)
+                    if _confiavel(info, passo, data_rotulada):
+                        return _com_meta(info, dpi_paginas), None
+
+        # 4) OCR da página inteira nas demais (reaproveita as já reconhecidas),
+        # parando na primeira página que deixa o resultado confiável
+        faltam = [i for i in range(len(paginas)) if i not in ocr_text]
+        if faltam:
+            info, passo, _, puladas = _ocr_incremental(
+                pdf_path, paginas, faltam, texto_puro, ocr_text, dpi_paginas)
+        else:
+            info, passo, _ = _campos_do_texto(pdf_path, texto_puro, ocr_text)
+            puladas = 0
+    finally:
+        doc.close()
 
-    for i, ln in enumerate(linhas):
-        if not NEAR_LABELS.search(ln) or BAD_CTX.search(ln):
-            continue
+    return _com_meta(info, dpi_paginas, puladas), ("NF-e" if passo == "NFE" else None)
 
-        bloco_linhas = linhas[i:i+3]            # linha do rótulo + duas seguintes
-        bloco = " ".join(bloco_linhas)
-        lab_end = max((m.end() for m in NEAR_LABELS.finditer(ln.lower())), default=len(ln))
+def _ocr_incremental(pdf_path, paginas, indices, texto_base, ocr_text, dpi_paginas):
+    """
+    OCR das páginas indices, uma a uma, rodando os passos depois de cada uma;
+    para assim que número, data e valor saem de passos confiáveis.
+    Preenche ocr_text/dpi_paginas e retorna (info, passo, data_rotulada,
+    páginas que deixaram de ser renderizadas).
+    """
+    for n, i in enumerate(indices, 1):
+        ocr_text[i], dpi_paginas[i + 1] = _ocr_adaptativo(paginas[i], pdf_path)
+        info, passo, data_rotulada = _campos_do_texto(pdf_path, texto_base, ocr_text)
+        if _confiavel(info, passo, data_rotulada):
+            break
+    puladas = len(indices) - n
+    metricas.contar("paginas_puladas", puladas)
+    return info, passo, data_rotulada, puladas
+
+def _com_meta(info, dpi_paginas, paginas_puladas=0):
+    """Anexa ao resultado os metadados da extração (DPI de OCR por página e
+    páginas que a saída antecipada deixou sem OCR)."""
+    if info:
+        info["meta"] = {"dpi_paginas": dict(dpi_paginas), "paginas_puladas": paginas_puladas}
+    return info
+
+def _campos_do_texto(pdf_path, texto_puro, ocr_text):
+    """
+    Roda os passos de extração sobre a camada de texto + OCR (dict página -> texto).
+    Retorna (info, passo, data_rotulada): passo indica qual etapa definiu o valor;
+    data_rotulada é False quando a data saiu só do fallback "maior data".
+    """
+    ocr_text = [ocr_text[i] for i in sorted(ocr_text)]
+    texto = (texto_puro or "") + "\n" + "\n".join(ocr_text)
+    _dbg(pdf_path, f"text_len={len(texto)}  puro={len(texto_puro)}  ocr_len_total={sum(len(t) for t in ocr_text)}")
+    info, passo, data_rotulada = EXTRATOR_NFSE.extrair(pdf_path, texto)
+    metricas.anotar("passo", passo)  # vale a última rodada (a que gerou o retorno)
+    return info, passo, data_rotulada
+
+# ===== Padrões da extração de NFS-e (compilados uma única vez) =====
+RX_NFE = re.compile(r'\bNFE\b', re.IGNORECASE)
+RX_PRIMEIRO_NUMERO = re.compile(r"(\d+)")
+RX_ZEROS_NUMERO = re.compile(r"0{4,}")
+RX_ESPACOS_LINHA = re.compile(r'[ \t]+')
+RX_RS_ANTES_DIGITO = re.compile(r'R\$\s*(?=\d)')
+RX_VIRGULA_CENTAVOS = re.compile(r'(\d)\s*,\s*(\d{2})')
+RX_DIGITOS_ESPACADOS = re.compile(r'(?<!\d)(\d(?:\s?\d){0,10})\s*,\s*(\d)\s*(\d)(?!\d)')
+RX_ESPACOS = re.compile(r"\s+")
+RX_CENTAVOS_GRUDADOS = re.compile(r'(,\d{2})(?=\d)')
+
+RX_CNPJ = re.compile(r'\b\d{2}[.\s]?\d{3}[.\s]?\d{3}\s*/\s*\d{4}\s*-\s*\d{2}\b')
+RX_CPF  = re.compile(r'\b\d{3}[.\s]?\d{3}[.\s]?\d{3}\s*-\s*\d{2}\b')
+
+# ===== DATA =====
+RX_DATA_ANY = re.compile(r"(\d{2}[\/\.-]\d{2}[\/\.-](?:\d{2}|\d{4}))", re.I)
+RX_EMISSAO_NEAR = re.compile(
+    r"(?:data(?:\s+\w+){0,5}\s*(?:da\s*nota\s*|de\s*)?emiss[aã]o)\D{0,120}" + RX_DATA_ANY.pattern,
+    re.I
+)
+RX_SEP_DATA = re.compile(r"[\/\.-]")
+RX_DATA_CANONICA = re.compile(r"(\d{2})/(\d{2})/\d{2,4}$")
+HAS_TIME   = re.compile(r"\b\d{2}:\d{2}:\d{2}\b")
+IS_PERIOD  = re.compile(r"\bper[íi]odo\b", re.IGNORECASE)
+TWO_DATES  = re.compile(r"\d{2}/\d{2}/\d{4}\s*(?:a|-|–)\s*\d{2}/\d{2}/\d{4}", re.IGNORECASE)
+BAN_DATE   = ("impress", "compet", "venc", "parcela", "boleto")
+BAN_DATE_EXTRA = ("alvar","licen","vigênc","vigenc","simples","cnae","fund","constit","abertura")
+
+# --- rótulos bons e termos a evitar perto do número ---
+GOOD_ANCHOR = re.compile(
+    r"(?:(?:valor|vlr\.?)\s+bruto\s+da\s+nota|"
+    r"valor\s+total\s+(?:da\s+nfs[–—-]?e|da\s+nota|do\s+documento)|"
+    r"valor\s+dos?\s+servi[cç]os?|"
+    r"total\s+do\s+servi[cç]o|"
+    r"valor\s+l[ií]quido|"
+    r"valor\s+da\s+nota|"
+    r"vlr\.?\s*total|"
+    r"valor\s+do\s+documento|"
+    r"valor\s+do\s+servi[cç]o|"
+    r"valor\s+(?:bruto|l[ií]quido|unit[áa]rio)\s+do\s+servi[cç]o|"
+    r"valor\s+l[ií]quido\s+do\s+servi[cç]o|"
+    r"valor\s+a\s+pagar|total\s+a\s+pagar|"
+    r"valor\s+total\s+da\s+nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?|"
+    r"valor\s+bruto\s+da\s+nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?)",
+    re.IGNORECASE
+)
+
+BAD_ISS_FUZZ = r"(?:iss|i[s5]{2}|[1iIl][s5]{2})"
+RX_ISS_FUZZ = re.compile(BAD_ISS_FUZZ)
+
+BAD_CTX = re.compile(
+    rf"\b({BAD_ISS_FUZZ}|issqn|pis|cofins|csll|inss|irrf|"
+    r"al[ií]q|al[ií]quota|ret(?:id|en)|dedu[cç][aã]o|descon|"
+    r"base\s+de\s+c[aá]lculo|base\s+calc|ibpt|aprox(?:imad[oa])?|"
+    r"tribut|imposto|parcela|parcelas|venc(?:imento)?|juros|multa|"
+    r"pagamento|boleto|duplicata|carn[eé]|"
+    r"periodo|per[íi]odo|compet[eê]ncia|compet|"
+    r"quantidade|qtd|descri[cç][aã]o|cod\.?\s*serv|abatiment|percent|%|cep|"
+    r"cnpj|cpf|inscri[cç][aã]o|rps|c[oó]d|verifica[cç][aã]o|autenticidade)\b",
+    re.IGNORECASE
+)
+
+RX_VAL_PLAIN = re.compile(rf'(?<!\d)({MONEY})(?!\d)')
+RX_VAL_RS    = re.compile(rf'(?<!\d)R\$\s*({MONEY})(?!\d)', re.IGNORECASE)
+RX_RS_MONEY  = re.compile(rf"R\$\s*({MONEY})", re.IGNORECASE)
+
+NEAR_LABELS = re.compile(
+    r"(valor\s+total\s+da\s+(?:nfs[–—-]?e|nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?|documento)|"
+    r"valor\s+dos?\s+servi[cç]os?|"
+    r"valor\s+do\s+servi[cç]o|"
+    r"valor\s+unit[áa]rio\s+do\s+servi[cç]o|"
+    r"valor\s+bruto\s+do\s+servi[cç]o|"
+    r"valor\s+l[ií]quido(?:\s+do\s+servi[cç]o)?|"
+    r"valor\s+a\s+pagar|total\s+a\s+pagar|"
+    r"valor\s+da\s+nota)",
+    re.IGNORECASE
+)
+RX_MONEY_ANY = re.compile(rf"(R\$\s*)?({MONEY})", re.IGNORECASE)
+
+# ===== global FWD (rótulo -> número), janela curta =====
+SPAN_NEAR = r"[\s\S]{0,80}?"
+RX_FWD = [
+    re.compile(rf"valor\s+total\s+da\s+(?:nfs[–—-]?e|nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?)"
+               rf"{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
+    re.compile(rf"valor\s+dos?\s+servi[cç]os?{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
+    re.compile(rf"(?:valor|vlr\.?)\s+bruto\s+da\s+(?:nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?)"
+               rf"{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
+    re.compile(rf"valor\s+l[ií]quido(?:\s+da\s+nota\s+fiscal)?{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
+    re.compile(rf"(?:fatura|duplicata){SPAN_NEAR}valor{SPAN_NEAR}(?:R\$\s*)?({MONEY})",
+           re.I | re.S),
+]
+
+GOOD_NEAR = re.compile(r'(valor|total|nfs|nota|servi[cç]o|l[ií]quido|bruto)', re.IGNORECASE)
+
+# padrões dos índices de termos do DocumentoNF: (versão sem IGNORECASE para o
+# texto já em minúsculas, que é bem mais rápida, e a original)
+PADROES_INDICE = {
+    "ruim": (re.compile(BAD_CTX.pattern), BAD_CTX),
+    "iss": (RX_ISS_FUZZ, re.compile(BAD_ISS_FUZZ, re.IGNORECASE)),
+    "bom": (re.compile(GOOD_NEAR.pattern), GOOD_NEAR),
+}
+
+PREF_FLOOR = Decimal("200.00")
+WIN = 180
+
+def _norm_espacos(s: str) -> str:
+    s = (s or "").replace('\u00A0', ' ')
+    return RX_ESPACOS_LINHA.sub(' ', s)
+
+def _compact_money_digits(s: str) -> str:
+    def repl(m):
+        left = RX_ESPACOS.sub("", m.group(1))
+        return f"{left},{m.group(2)}{m.group(3)}"
+    return RX_DIGITOS_ESPACADOS.sub(repl, s)
+
+def _canon_date(s: str) -> str:
+    d, m, y = RX_SEP_DATA.split(s)
+    if len(y) == 2:
+        y = ("20" if int(y) <= 49 else "19") + y
+    return f"{d}/{m}/{y}"
+
+def _first_date(s: str):
+    m = RX_DATA_ANY.search(s)
+    return _canon_date(m.group(1)) if m else None
+
+def _ymd_tuple(dstr: str):
+    return (int(dstr[6:10]), int(dstr[3:5]), int(dstr[0:2]))
+
+def _numero_do_arquivo(pdf_path):
+    nome = os.path.basename(pdf_path)
+    m = RX_PRIMEIRO_NUMERO.search(nome)
+    raw = m.group(1) if m else ""
+    parts = RX_ZEROS_NUMERO.split(raw)
+    return parts[-1].lstrip("0") if len(parts) > 1 and parts[-1] else raw.lstrip("0")
 
-        # 1) juntar todos candidatos do bloco
-        cands = []
-        for m in RX_MONEY_ANY.finditer(bloco):
-            has_rs = bool(m.group(1))
-            raw_val = m.group(2)
-            dec = _money_to_decimal(raw_val)
-            if dec is None or dec <= 0:
-                continue
+def _score_candidate(has_rs: bool, same_line: bool, dist_chars: int, val: Decimal) -> int:
+    # quanto menor melhor
+    score  = 0 if same_line else 120          # penaliza forte se não estiver na mesma linha
+    score += 0 if has_rs else 60              # ter "R$" ajuda bem
+    score += min(dist_chars, 60)              # proximidade do rótulo
+    return score
 
-            ctx = bloco[max(0, m.start()-60): m.end()+60].lower()
-            if BAD_CTX.search(ctx):
-                continue
+class IndiceTermos:
+    """
+    Posições dos termos de um padrão no texto, levantadas por blocos sob
+    demanda: cada trecho passa pelo regex no máximo uma vez, por mais janelas
+    que o consultem, e tem(a, b) ("há termo inteiro em texto[a:b]?") sai por
+    busca binária. Trechos que nenhum passo consulta nem são varridos.
+    """
 
-            # está na mesma linha do rótulo?
-            off = 0
-            same_line = False
-            for k, ltxt in enumerate(bloco_linhas):
-                limite = off + len(ltxt) + (1 if k > 0 else 0)
-                if m.start() < limite:
-                    same_line = (k == 0)
-                    dist = abs(lab_end - (m.start()-off)) if same_line else 120
+    BLOCO = 256
+    FOLGA = 64  # o termo começa no bloco mas pode terminar depois dele
+
+    __slots__ = ("rx", "texto", "blocos")
+
+    def __init__(self, rx, texto):
+        self.rx = rx
+        self.texto = texto
+        self.blocos = {}
+
+    def _bloco(self, k):
+        """(inícios, fim_min) dos termos que começam no bloco k; fim_min[i] é o
+        menor fim entre os termos i em diante."""
+        bloco = self.blocos.get(k)
+        if bloco is None:
+            ini = k * self.BLOCO
+            fim = ini + self.BLOCO
+            limite = min(len(self.texto), fim + self.FOLGA)
+            spans = []
+            for m in self.rx.finditer(self.texto, ini, limite):
+                if m.start() >= fim:
                     break
-                off = limite
-
-            has_iss_like = re.search(BAD_ISS_FUZZ, ctx) is not None
-            cands.append((dec, has_rs, same_line, dist, has_iss_like))
-
-        if not cands:
-            continue
-
-        # 2) penalizar valores muito pequenos quando existe um muito maior no bloco
-        bloco_max = max(c[0] for c in cands)
-        for dec, has_rs, same_line, dist, has_iss_like in cands:
-            score = _score_candidate(has_rs, same_line, dist, dec)
-
-            if bloco_max and dec <= bloco_max * Decimal("0.15"):
-                score += 400
-
-            if has_iss_like and bloco_max and dec <= bloco_max * Decimal("0.25"):
-                score += 1000
-
-            pref = (dec >= Decimal("200.00"), dec)
+                if m.end() == limite < len(self.texto):
+                    # o \b no limite pode ser artificial: confere no texto inteiro
+                    m = self.rx.match(self.texto, m.start())
+                    if m is None:
+                        continue
+                spans.append(m.span())
+            inicios = [a for a, _ in spans]
+            fim_min = [e for _, e in spans]
+            for i in range(len(fim_min) - 2, -1, -1):
+                if fim_min[i + 1] < fim_min[i]:
+                    fim_min[i] = fim_min[i + 1]
+            bloco = self.blocos[k] = (inicios, fim_min)
+        return bloco
+
+    def tem(self, a, b):
+        a, b = max(a, 0), min(b, len(self.texto))
+        if a >= b:
+            return False
+        primeiro = a // self.BLOCO
+        for k in range(primeiro, (b - 1) // self.BLOCO + 1):
+            inicios, fim_min = self._bloco(k)
+            i = bisect_left(inicios, a) if k == primeiro else 0
+            if i < len(inicios) and fim_min[i] <= b:
+                return True
+        return False
+
+class DocumentoNF:
+    """
+    Modelo tokenizado do texto de uma nota, montado uma vez e compartilhado
+    por todos os passos: texto normalizado, linhas, texto corrido (flat) e o
+    offset de cada linha dentro do flat.
+    A variante "_v" (centavos grudados separados) só é montada se o passo 3
+    for necessário.
+    Os índices de termos (BAD_CTX, "iss", GOOD_NEAR) são montados na primeira
+    consulta e compartilhados pelos passos.
+    """
 
-            if best is None or score < best[0] or (score == best[0] and pref > (best[2] if len(best) > 2 else (False, Decimal("0")))):
-                best = (score, dec, pref)
+    def __init__(self, texto):
+        # Normalização agressiva de espaços e separadores
+        s = _norm_espacos(texto)
+        s = (s.replace('\u00A0', ' ')
+              .replace('\u202F', ' ')
+              .replace('\u2007', ' ')
+              .replace('\u2009', ' '))
+        s = RX_RS_ANTES_DIGITO.sub('R$ ', s)
+        s = RX_VIRGULA_CENTAVOS.sub(r'\1,\2', s)
+        s = _compact_money_digits(s)
+        s = RX_CNPJ.sub(' [CNPJ] ', s)
+        s = RX_CPF.sub(' [CPF] ', s)
+        self.normalizado = s
+        self.linhas = [x.strip() for x in s.splitlines()]
+        self.flat, self.offsets = self._juntar(self.linhas)
+        self._linhas_v = None
+        self._flat_v = None
+        self._offsets_v = None
+        self._indices = {}
+
+    @staticmethod
+    def _juntar(linhas):
+        offsets, pos = [], 0
+        for ln in linhas:
+            offsets.append(pos)
+            pos += len(ln) + 1
+        return " ".join(linhas), offsets
+
+    def bloco(self, i, n):
+        """Linhas i..i+n-1 unidas por espaço (fatia do flat, sem nova string intermediária)."""
+        j = min(i + n, len(self.linhas)) - 1
+        return self.flat[self.offsets[i]:self.offsets[j] + len(self.linhas[j])]
+
+    def _montar_v(self):
+        # [ \t]+ nunca atravessa quebra de linha: normalizar antes de quebrar dá o mesmo resultado
+        s = RX_CENTAVOS_GRUDADOS.sub(r'\1 ', self.normalizado)
+        self._linhas_v = _norm_espacos(s).splitlines()
+        self._flat_v, self._offsets_v = self._juntar(self._linhas_v)
+
+    @property
+    def linhas_v(self):
+        if self._linhas_v is None:
+            self._montar_v()
+        return self._linhas_v
+
+    @property
+    def flat_v(self):
+        if self._flat_v is None:
+            self._montar_v()
+        return self._flat_v
+
+    @property
+    def offsets_v(self):
+        if self._offsets_v is None:
+            self._montar_v()
+        return self._offsets_v
+
+    def _indice(self, nome, v=False):
+        idx = self._indices.get((nome, v))
+        if idx is None:
+            texto = self.flat_v if v else self.flat
+            rx_min, rx = PADROES_INDICE[nome]
+            minusc = self._indices.get(("min", v))
+            if minusc is None:
+                minusc = self._indices[("min", v)] = texto.lower()
+            # lower() só muda o tamanho em casos raros (ex.: "İ"); aí os offsets não batem
+            idx = IndiceTermos(rx_min, minusc) if len(minusc) == len(texto) else IndiceTermos(rx, texto)
+            self._indices[(nome, v)] = idx
+        return idx
+
+    def ruim(self, a, b, v=False):
+        """Há termo de BAD_CTX em flat[a:b] (flat_v com v=True)?"""
+        return self._indice("ruim", v).tem(a, b)
+
+    def iss(self, a, b):
+        """Há algo parecido com "iss" em flat[a:b]?"""
+        return self._indice("iss").tem(a, b)
+
+    def bom(self, a, b, v=False):
+        """Há termo de GOOD_NEAR em flat[a:b] (flat_v com v=True)?"""
+        return self._indice("bom", v).tem(a, b)
+
+class ExtratorNFSe:
+    """
+    Extrator reutilizável de data e valor de NFS-e.
 
-    if best is not None:
-        valor = str(best[1])
-        _dbg(pdf_path, f"[NEAR-LINE] score={best[0]} valor={valor}")
-        return {"numero": numero, "data": data, "valor": valor}
+    Os padrões ficam compilados no módulo; extrair() monta um único
+    DocumentoNF e roda os passos em ordem até um deles definir o valor:
+    NEAR-LINE, LABEL-FWD, GLOBAL-FWD, ANC-JANELA e, por último, FALLBACK.
+    """
 
-    def _canon_date(s: str) -> str:
-        d, m, y = re.split(r"[\/\.-]", s)
-        if len(y) == 2:
-            y = ("20" if int(y) <= 49 else "19") + y
-        return f"{d}/{m}/{y}"
+    PASSOS = (
+        ("NEAR-LINE", "_passo_near_line"),
+        ("LABEL-FWD", "_passo_label_fwd"),
+        ("GLOBAL-FWD", "_passo_global_fwd"),
+        ("ANC-JANELA", "_passo_anc_janela"),
+    )
 
-    def _first_date(s: str):
-        m = RX_DATA_ANY.search(s)
-        return _canon_date(m.group(1)) if m else None
+    def extrair(self, pdf_path, texto):
+        """Retorna (info, passo, data_rotulada) — ver _campos_do_texto."""
+        # Ignora NFe (não NFS-e)
+        if RX_NFE.search(texto) and not PATTERN_NFSE.search(texto):
+            return None, "NFE", False
+
+        numero = _numero_do_arquivo(pdf_path)
+        with metricas.etapa("normalizacao"):
+            doc = DocumentoNF(texto)
+        with metricas.etapa("data_emissao"):
+            data, data_rotulada = self._data(doc)
+
+        for passo, metodo in self.PASSOS:
+            with metricas.etapa("passo:" + passo):
+                valor = getattr(self, metodo)(doc, pdf_path)
+            if valor is not None:
+                return {"numero": numero, "data": data, "valor": valor}, passo, data_rotulada
+
+        with metricas.etapa("passo:FALLBACK"):
+            valor = self._passo_fallback(doc, pdf_path)
+        _dbg(pdf_path, f"[RETORNO] numero={numero} data={data} valor={valor}")
+        return {"numero": numero, "data": data, "valor": valor}, ("FALLBACK" if valor else None), data_rotulada
 
+    # ------ DATA ------
+    def _data(self, doc):
+        """Retorna (data, data_rotulada)."""
+        m_emissao = RX_EMISSAO_NEAR.search(doc.flat)
+        data_rotulada = True
+        if m_emissao:
+            data = _canon_date(m_emissao.group(1))
+        else:
+            data, data_rotulada = self._pick_date(doc.linhas)
+        if not data:
+            todas = [_canon_date(m.group(1)) for m in RX_DATA_ANY.finditer(doc.flat)]
+            if todas:
+                data_rotulada = False
+                data = max(todas, key=_ymd_tuple)
+        if data:
+            md = RX_DATA_CANONICA.match(data)
+            if md:
+                data = f"{md.group(1)}/{md.group(2)}/2025"
+        return data, data_rotulada
+
+    @staticmethod
     def _pick_date(lines):
         # preferir "Data de emissão" (evitar "impressão")
-        HAS_TIME   = re.compile(r"\b\d{2}:\d{2}:\d{2}\b")
-        BAN_DATE   = ("impress", "compet", "venc", "parcela", "boleto")
-        IS_PERIOD  = re.compile(r"\bper[íi]odo\b", re.IGNORECASE)
-        TWO_DATES  = re.compile(r"\d{2}/\d{2}/\d{4}\s*(?:a|-|–)\s*\d{2}/\d{2}/\d{4}", re.IGNORECASE)
-
+        lower = [ln.lower() for ln in lines]
         for i, ln in enumerate(lines):
-            l = ln.lower()
+            l = lower[i]
             if "data" in l and "emiss" in l and "impress" not in l:
                 d = _first_date(ln)
                 if d:
-                    return d
+                    return d, True
                 for j in range(max(0, i-2), min(len(lines), i+10)):
-                    lj = lines[j].lower()
+                    lj = lower[j]
                     if any(b in lj for b in BAN_DATE) or IS_PERIOD.search(lines[j]) or TWO_DATES.search(lines[j]):
                         continue
                     d = _first_date(lines[j])
                     if d:
-                        return d
+                        return d, True
 
         # Data do serviço/execução (sem período)
         for i, ln in enumerate(lines):
-            l = ln.lower()
+            l = lower[i]
             if "data" in l and ("servi" in l or "execu" in l) and not IS_PERIOD.search(ln) and not TWO_DATES.search(ln):
                 d = _first_date(ln)
                 if d:
-                    return d
+                    return d, True
                 for j in range(max(0, i-2), min(len(lines), i+3)):
-                    lj = lines[j].lower()
+                    lj = lower[j]
                     if any(b in lj for b in BAN_DATE) or HAS_TIME.search(lines[j]) or IS_PERIOD.search(lines[j]) or TWO_DATES.search(lines[j]):
                         continue
                     d = _first_date(lines[j])
                     if d:
-                        return d
+                        return d, True
 
         # fallback: maior data “limpa”
-        BAN_DATE_EXTRA = ("alvar","licen","vigênc","vigenc","simples","cnae","fund","constit","abertura")
-        def _ymd_tuple(dstr: str):
-            return (int(dstr[6:10]), int(dstr[3:5]), int(dstr[0:2]))
         cands = []
-        for ln in lines:
-            l = ln.lower()
+        for i, ln in enumerate(lines):
+            datas = RX_DATA_ANY.findall(ln)   # filtro barato: a maioria das linhas não tem data
+            if not datas:
+                continue
+            l = lower[i]
             if any(b in l for b in BAN_DATE) or any(b in l for b in BAN_DATE_EXTRA):
                 continue
             if HAS_TIME.search(ln) or IS_PERIOD.search(ln) or TWO_DATES.search(ln):
                 continue
-            for m in RX_DATA_ANY.finditer(ln):
-                d = _canon_date(m.group(1))
+            for raw in datas:
+                d = _canon_date(raw)
                 cands.append((_ymd_tuple(d), d))
         if cands:
             cands.sort(reverse=True)
-            return cands[0][1]
-        return None
+            return cands[0][1], False
+        return None, True
+
+    # ===== 0) rótulo e valor na mesma linha (ou nas duas seguintes) =====
+    def _passo_near_line(self, doc, pdf_path):
+        best = None  # tuple(score, valor_decimal, preferência)
+        linhas = doc.linhas
+        for i, ln in enumerate(linhas):
+            # todo rótulo de NEAR_LABELS contém "valor" ou "total"
+            l = ln.lower()
+            ini = doc.offsets[i]
+            if ("valor" not in l and "total" not in l) or not NEAR_LABELS.search(ln) or doc.ruim(ini, ini + len(ln)):
+                continue
 
-    linhas = [x.strip() for x in header_section.splitlines()]
-    flat = " ".join(linhas)
+            bloco = doc.bloco(i, 3)              # linha do rótulo + duas seguintes
+            lab_end = max((m.end() for m in NEAR_LABELS.finditer(l)), default=len(ln))
 
-    # ------ DATA ------
-    m_emissao = RX_EMISSAO_NEAR.search(flat)
-    if m_emissao:
-        data = _canon_date(m_emissao.group(1))
-    else:
-        data = _pick_date(linhas)
-    if not data:
-        todas = [_canon_date(m.group(1)) for m in RX_DATA_ANY.finditer(flat)]
-        if todas:
-            data = max(todas, key=lambda d: (int(d[6:10]), int(d[3:5]), int(d[0:2])) )
-    if data:
-        md = re.match(r"(\d{2})/(\d{2})/\d{2,4}$", data)
-        if md:
-            data = f"{md.group(1)}/{md.group(2)}/2025"
+            # 1) juntar todos candidatos do bloco
+            cands = []
+            for m in RX_MONEY_ANY.finditer(bloco):
+                has_rs = bool(m.group(1))
+                dec = _money_to_decimal(m.group(2))
+                if dec is None or dec <= 0:
+                    continue
 
-    # ===== 1) label -> número (apenas para FRENTE, janela curta) =====
-    PREF_FLOOR = Decimal("200.00")  
-    WIN = 180                        
+                # janela de ±60 dentro do bloco, em coordenadas do flat
+                a = ini + max(0, m.start() - 60)
+                b = ini + min(len(bloco), m.end() + 60)
+                if doc.ruim(a, b):
+                    continue
 
-    best_val = None
-    for ml in NEAR_LABELS.finditer(flat):
-        s = ml.end()
-        e = min(len(flat), ml.end() + WIN)
-        trecho = flat[s:e]
+                # está na mesma linha do rótulo?
+                same_line = m.start() < len(ln)
+                dist = abs(lab_end - m.start()) if same_line else 120
 
-        local_cands = []
+                has_iss_like = doc.iss(a, b)
+                cands.append((dec, has_rs, same_line, dist, has_iss_like))
 
-        # 1) Tente primeiro com "R$"
-        for mg in re.finditer(rf"R\$\s*({MONEY})", trecho, re.IGNORECASE):
-            ctx = trecho[max(0, mg.start()-40): mg.end()+40].lower()
-            if BAD_CTX.search(ctx):
+            if not cands:
                 continue
-            dec = _money_to_decimal(mg.group(1))
-            if dec is not None and dec > 0:
-                local_cands.append(dec)
-
-        if not local_cands:
-            for mg in re.finditer(rf"(?<!\d)({MONEY})(?!\d)", trecho):
-                ctx = trecho[max(0, mg.start()-40): mg.end()+40].lower()
-                if BAD_CTX.search(ctx):
+
+            # 2) penalizar valores muito pequenos quando existe um muito maior no bloco
+            bloco_max = max(c[0] for c in cands)
+            for dec, has_rs, same_line, dist, has_iss_like in cands:
+                score = _score_candidate(has_rs, same_line, dist, dec)
+
+                if bloco_max and dec <= bloco_max * Decimal("0.15"):
+                    score += 400
+
+                if has_iss_like and bloco_max and dec <= bloco_max * Decimal("0.25"):
+                    score += 1000
+
+                pref = (dec >= Decimal("200.00"), dec)
+
+                if best is None or score < best[0] or (score == best[0] and pref > best[2]):
+                    best = (score, dec, pref)
+
+        if best is None:
+            return None
+        valor = str(best[1])
+        _dbg(pdf_path, f"[NEAR-LINE] score={best[0]} valor={valor}")
+        return valor
+
+    # ===== 1) label -> número (apenas para FRENTE, janela curta) =====
+    def _passo_label_fwd(self, doc, pdf_path):
+        flat = doc.flat
+        best_val = None
+        for ml in NEAR_LABELS.finditer(flat):
+            s = ml.end()
+            e = min(len(flat), ml.end() + WIN)
+            trecho = flat[s:e]
+
+            local_cands = []
+
+            # 1) Tente primeiro com "R$"
+            for mg in RX_RS_MONEY.finditer(trecho):
+                if doc.ruim(s + max(0, mg.start() - 40), s + min(len(trecho), mg.end() + 40)):
                     continue
                 dec = _money_to_decimal(mg.group(1))
                 if dec is not None and dec > 0:
                     local_cands.append(dec)
 
-        if local_cands:
-            prefer = [v for v in local_cands if v >= PREF_FLOOR]
-            cand = max(prefer) if prefer else max(local_cands)
-            if best_val is None or cand > best_val:
-                best_val = cand
-
-    if best_val is not None:
+            if not local_cands:
+                for mg in RX_VAL_PLAIN.finditer(trecho):
+                    if doc.ruim(s + max(0, mg.start() - 40), s + min(len(trecho), mg.end() + 40)):
+                        continue
+                    dec = _money_to_decimal(mg.group(1))
+                    if dec is not None and dec > 0:
+                        local_cands.append(dec)
+
+            if local_cands:
+                prefer = [v for v in local_cands if v >= PREF_FLOOR]
+                cand = max(prefer) if prefer else max(local_cands)
+                if best_val is None or cand > best_val:
+                    best_val = cand
+
+        if best_val is None:
+            return None
         valor = str(best_val)
         _dbg(pdf_path, f"[LABEL-FWD] valor={valor}")
-        return {"numero": numero, "data": data, "valor": valor}
-
-    # ===== SEGUNDO: global FWD (rótulo -> número), janela curta =====
-    SPAN_NEAR = r"[\s\S]{0,80}?"
-    RX_FWD = [
-        re.compile(rf"valor\s+total\s+da\s+(?:nfs[–—-]?e|nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?)"
-                   rf"{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
-        re.compile(rf"valor\s+dos?\s+servi[cç]os?{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
-        re.compile(rf"(?:valor|vlr\.?)\s+bruto\s+da\s+(?:nota(?:\s+fiscal)?(?:\s+de\s+servi[cç]os)?)"
-                   rf"{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
-        re.compile(rf"valor\s+l[ií]quido(?:\s+da\s+nota\s+fiscal)?{SPAN_NEAR}(?:R\$\s*)?({MONEY})", re.I|re.S),
-        re.compile(rf"(?:fatura|duplicata){SPAN_NEAR}valor{SPAN_NEAR}(?:R\$\s*)?({MONEY})",
-               re.I | re.S),
-    ]
-
-    best_val = None
-    best_dist = 10**9
-    for rx in RX_FWD:
-        for m in rx.finditer(flat):
-            dec = _money_to_decimal(m.group(1))
-            ctx = flat[max(0, m.start(1)-80): m.end(1)+80].lower()
-            label_txt = flat[max(0, m.start()-80): m.start(1)].lower()
-            is_fatura = ('fatura' in label_txt) or ('duplicata' in label_txt)
-            if dec is None or dec <= 0:
-                continue
-            # só aplica BAD_CTX se não for o caso FATURA/DUPLICATA
-            if (not is_fatura) and BAD_CTX.search(ctx):
-                continue
-            dist = m.start(1) - m.start()
-            if dist < best_dist or (dist == best_dist and (best_val is None or dec > best_val)):
-                best_dist, best_val = dist, dec
+        return valor
+
+    # ===== 2) global FWD (rótulo -> número), janela curta =====
+    def _passo_global_fwd(self, doc, pdf_path):
+        flat = doc.flat
+        best_val = None
+        best_dist = 10**9
+        for rx in RX_FWD:
+            for m in rx.finditer(flat):
+                dec = _money_to_decimal(m.group(1))
+                if dec is None or dec <= 0:
+                    continue
+                label_txt = flat[max(0, m.start()-80): m.start(1)].lower()
+                is_fatura = ('fatura' in label_txt) or ('duplicata' in label_txt)
+                # só aplica BAD_CTX se não for o caso FATURA/DUPLICATA
+                if (not is_fatura) and doc.ruim(m.start(1) - 80, m.end(1) + 80):
+                    continue
+                dist = m.start(1) - m.start()
+                if dist < best_dist or (dist == best_dist and (best_val is None or dec > best_val)):
+                    best_dist, best_val = dist, dec
 
-    if best_val is not None:
+        if best_val is None:
+            return None
         valor = str(best_val)
         _dbg(pdf_path, f"[GLOBAL-FWD] dist={best_dist} valor={valor}")
-        return {"numero": numero, "data": data, "valor": valor}
+        return valor
 
-    # ------ PASSO 3: janela ancorada (±3 linhas) ------
-    header_section2 = re.sub(r'(,\d{2})(?=\d)', r'\1 ', header_section)
-    linhas = [_norm(x) for x in header_section2.splitlines()]
-    flat   = " ".join(linhas)
+    # ===== 3) janela ancorada (±3 linhas) =====
+    def _passo_anc_janela(self, doc, pdf_path):
+        linhas = doc.linhas_v
+        for i, ln in enumerate(linhas):
+            # todo rótulo de GOOD_ANCHOR contém "valor", "vlr" ou "total"
+            l = ln.lower()
+            ini = doc.offsets_v[i]
+            if ("valor" not in l and "vlr" not in l and "total" not in l) or not GOOD_ANCHOR.search(ln) \
+                    or doc.ruim(ini, ini + len(ln), v=True):
+                continue
+            janela = linhas[max(0, i-3):min(len(linhas), i+4)]
+            cands_txt = []
+            for w in janela:
+                cands_txt += [m.group(1) for m in RX_VAL_RS.finditer(w)]
+                cands_txt += [m.group(1) for m in RX_VAL_PLAIN.finditer(w)]
+
+            decs = [(d, t) for t in cands_txt if (d := _money_to_decimal(t)) is not None]
+            if decs:
+                _, melhor = max(decs, key=lambda t: t[0])
+                _dbg(pdf_path, f"[ANC-JANELA] -> {melhor}")
+                return str(_money_to_decimal(melhor))
+        return None
 
-    for i, ln in enumerate(linhas):
-        if not GOOD_ANCHOR.search(ln) or BAD_CTX.search(ln):
-            continue
-        janela = linhas[max(0, i-3):min(len(linhas), i+4)]
-        cands_txt = []
-        for w in janela:
-            cands_txt += [m.group(1) for m in rx_val_rs.finditer(w)]
-            cands_txt += [m.group(1) for m in rx_val_plain.finditer(w)]
-
-        decs = [(d, t) for t in cands_txt if (d := _money_to_decimal(t)) is not None]
-        if decs:
-            _, melhor = max(decs, key=lambda t: t[0])
-            valor = str(_money_to_decimal(melhor))
-            _dbg(pdf_path, f"[ANC-JANELA] -> {melhor}")
-            return {"numero": numero, "data": data, "valor": valor}
-
-    # ------ Fallback conservador ------
-    def _plausivel(v: Decimal) -> bool:
-        return Decimal('0.01') <= v <= Decimal('100000.00')
-
-    GOOD_NEAR = re.compile(r'(valor|total|nfs|nota|servi[cç]o|l[ií]quido|bruto)', re.IGNORECASE)
-    def _ok_context(pos: int) -> bool:
-        janela = flat[max(0, pos-150):pos+150].lower()
-        perto  = flat[max(0, pos-10):pos+10]
-        return (GOOD_NEAR.search(janela)
-                and '/' not in perto
-                and not BAD_CTX.search(janela))
-
-    candidatos = []
-    for m in rx_val_rs.finditer(flat):
-        if not _ok_context(m.start()):
-            continue
-        v = _money_to_decimal(m.group(1))
-        if v is not None and _plausivel(v):
-            candidatos.append((v, m.group(1), m.start()))
-    if not candidatos:
-        for m in rx_val_plain.finditer(flat):
+    # ===== Fallback conservador =====
+    def _passo_fallback(self, doc, pdf_path):
+        flat = doc.flat_v
+
+        def _plausivel(v: Decimal) -> bool:
+            return Decimal('0.01') <= v <= Decimal('100000.00')
+
+        def _ok_context(pos: int) -> bool:
+            perto  = flat[max(0, pos-10):pos+10]
+            return (doc.bom(pos - 150, pos + 150, v=True)
+                    and '/' not in perto
+                    and not doc.ruim(pos - 150, pos + 150, v=True))
+
+        candidatos = []
+        for m in RX_VAL_RS.finditer(flat):
             if not _ok_context(m.start()):
                 continue
             v = _money_to_decimal(m.group(1))
             if v is not None and _plausivel(v):
                 candidatos.append((v, m.group(1), m.start()))
+        if not candidatos:
+            for m in RX_VAL_PLAIN.finditer(flat):
+                if not _ok_context(m.start()):
+                    continue
+                v = _money_to_decimal(m.group(1))
+                if v is not None and _plausivel(v):
+                    candidatos.append((v, m.group(1), m.start()))
 
-    valor = None
-    if candidatos:
+        if not candidatos:
+            return None
         v, valor_str, pos = max(candidatos, key=lambda r: r[0])
         _dbg(pdf_path, f"[FALLBACK] pos={pos} val={valor_str} ctx='{_ctx(flat, pos)}'")
-        valor = str(_money_to_decimal(valor_str)) if valor_str else None
+        return str(_money_to_decimal(valor_str)) if valor_str else None
 
-    _dbg(pdf_path, f"[RETORNO] numero={numero} data={data} valor={valor}")
-    return {"numero": numero, "data": data, "valor": valor}
+EXTRATOR_NFSE = ExtratorNFSe()
 
-# === 2) Extrai notas (info) do RAR ===
-def extrair_notas_zip(zip_path, temp_dir):
+def _extrair_nota(nome_arquivo, dados):
     """
-    Extrai PDFs de um arquivo ZIP (não RAR) para temp_dir e processa.
-    Retorna (notas, sem_dados).
+    Roda extrair_info_pdf sobre os bytes de um membro do ZIP, isolando falhas
+    (também é o alvo do pool de processos).
+    Retorna (info, erro, delta dos contadores do cache de OCR, métricas da nota,
+    motivo do descarte ou None).
     """
-    os.makedirs(temp_dir, exist_ok=True)
+    antes = ocr_cache.estatisticas()
+    with metricas.medindo() as m:
+        with metricas.etapa("total"):
+            try:
+                (info, descarte), erro = _extrair_info(nome_arquivo, dados=dados), None
+            except Exception as e:
+                info, descarte, erro = None, None, f"{type(e).__name__}: {e}"
+    depois = ocr_cache.estatisticas()
+    delta = {k: depois[k] - antes.get(k, 0) for k in depois}
+    m.contadores["bytes_arquivo"] = len(dados)
+    m.contadores["cache_hits"] = delta.get("hits", 0)
+    m.contadores["cache_misses"] = delta.get("misses", 0)
+    return info, erro, delta, m.como_dict(), descarte
+
+def _nome_e_nota(fn):
+    """Filtro pelo nome do arquivo: só PDFs, sem faturas e sem NF-e."""
+    fn_lower = fn.lower()
+    if not fn_lower.endswith('.pdf'):
+        return False
+    if 'fatura' in fn_lower:
+        return False
+    # Ignorar NFe pelo NOME: tem "nfe" e NÃO tem "nfs"/"nfs-e"
+    if re.search(r'\bnf[\s\-_.]*e\b', fn_lower) and not re.search(r'\bnfs[\s\-_.]*e?\b', fn_lower):
+        return False
+    return True
 
-    # valida extensão e extrai
+# === 2) Extrai notas (info) do RAR ===
+def extrair_notas_zip(zip_path, workers=None, progresso=None):
+    """
+    Lê as notas de um arquivo ZIP (não RAR) direto da memória: os filtros de
+    nome são aplicados sobre infolist() e só os membros selecionados são
+    descompactados e abertos no PyMuPDF — nada é gravado em disco.
+    Com workers > 1 as notas são extraídas em paralelo (processos);
+    None usa NF_WORKERS (padrão 1, serial). Arquivos que falharem entram
+    em sem_dados; os que não são NFS-e (NF-e/DANFE, ver
+    classificar_documento) em descartadas.
+    progresso(feitos, total), se informado, é chamado a cada nota processada.
+    As métricas de cada nota (tempo por etapa, páginas, bytes renderizados)
+    vão em nota["metricas"] e para os sinks de utils.metricas.
+    Notas com o mesmo conteúdo já extraídas nesta versão do extrator vêm do
+    utils.nf_store (nota["armazenada"] = True) e não passam pelo extrator.
+    Membros repetidos no ZIP (mesmos bytes, outro nome) são extraídos uma vez;
+    as cópias recebem o mesmo resultado e nota["duplicada_de"] = primeiro nome.
+    Retorna (notas, sem_dados, descartadas).
+    """
+    # valida extensão
     ext = os.path.splitext(zip_path)[1].lower()
     if ext != ".zip":
         raise RuntimeError("Este servidor só aceita arquivo ZIP (RAR não suportado).")
 
+    notas, sem_dados, descartadas = [], [], []
+    selecionados = []
     with zipfile.ZipFile(zip_path) as z:
-        z.extractall(temp_dir)
-
-    # varre recursivamente os PDFs extraídos (mesmo código que você já tinha)
-    pdfs = []
-    for root, dirs, files in os.walk(temp_dir):
-        for fn in files:
-            if not fn.lower().endswith('.pdf'):
+        for membro in z.infolist():
+            if membro.is_dir():
                 continue
-            if 'fatura' in fn.lower():
+            nome_arquivo = os.path.basename(membro.filename)
+            if not _nome_e_nota(nome_arquivo):
                 continue
-            fn_lower = fn.lower()
-            # Ignorar NFe pelo NOME: tem "nfe" e NÃO tem "nfs"/"nfs-e"
-            if re.search(r'\bnf[\s\-_.]*e\b', fn_lower) and not re.search(r'\bnfs[\s\-_.]*e?\b', fn_lower):
+            m_num = re.search(r"(\d+)", nome_arquivo)
+            if not m_num:
+                sem_dados.append(nome_arquivo)
                 continue
-            pdfs.append(os.path.join(root, fn))
-
-    notas, sem_dados = [], []
-    for pdf in pdfs:
-        nome_arquivo = os.path.basename(pdf)
-        m_num = re.search(r"(\d+)", nome_arquivo)
-        if not m_num:
-            sem_dados.append(nome_arquivo)
+            selecionados.append((nome_arquivo, m_num.group(1).lstrip("0"), z.read(membro)))
+
+    # notas já extraídas (mesmo conteúdo, mesma versão) vêm do banco
+    versao = versao_extrator()
+    hashes = [nf_store.hash_conteudo(dados) for _, _, dados in selecionados]
+    armazenadas = nf_store.buscar(hashes, versao)
+    # membros com o mesmo conteúdo (a mesma nota com outro nome) são extraídos uma vez só
+    primeiro = {}
+    for i, h in enumerate(hashes):
+        primeiro.setdefault(h, i)
+    pendentes = [i for i, h in enumerate(hashes) if primeiro[h] == i and h not in armazenadas]
+    nomes = [selecionados[i][0] for i in pendentes]
+    blobs = [selecionados[i][2] for i in pendentes]
+
+    workers = NF_WORKERS if workers is None else workers
+    workers = max(1, min(workers, len(pendentes)))
+    total = len(selecionados)
+    prontas = total - len(pendentes)
+    if progresso:
+        progresso(prontas, total)
+    resultados = []
+    if workers > 1:
+        # map() devolve na mesma ordem do modo serial
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_contexto_pool()) as ex:
+            for res in ex.map(_extrair_nota, nomes, blobs):
+                # contadores do cache de OCR ficam nos workers: traz para este processo
+                ocr_cache.acumular(res[2])
+                resultados.append(res)
+                if progresso:
+                    progresso(prontas + len(resultados), total)
+    else:
+        for nome, dados in zip(nomes, blobs):
+            resultados.append(_extrair_nota(nome, dados))
+            if progresso:
+                progresso(prontas + len(resultados), total)
+
+    extraidas = dict(zip(pendentes, resultados))
+    nf_store.gravar([(hashes[i], selecionados[i][0], res[0], res[4])
+                     for i, res in extraidas.items() if not res[1]], versao)
+
+    for i, (nome_arquivo, numero, _) in enumerate(selecionados):
+        j = primeiro[hashes[i]]
+        duplicada_de = selecionados[j][0] if j != i else None
+        if j in extraidas:
+            info, erro, _, medicoes, descarte = extraidas[j]
+            if duplicada_de:
+                medicoes = None
+            else:
+                metricas.emitir({"arquivo": nome_arquivo, "erro": erro, "descarte": descarte, **medicoes})
+        else:
+            (info, descarte), erro, medicoes = armazenadas[hashes[i]], None, None
+        if erro:
+            # falha em um arquivo não derruba o lote: vai para "sem extração"
+            _dbg(nome_arquivo, f"[ERRO] {erro}")
+            sem_dados.append(f"{nome_arquivo} (erro: {erro})")
+            continue
+        if descarte:
+            # não é NFS-e (ex.: DANFE de produto): fora da conciliação
+            descartadas.append({"numero": numero, "arquivo": nome_arquivo,
+                                "motivo": descarte, "hash": hashes[i]})
             continue
-        numero = m_num.group(1).lstrip("0")
 
-        info = extrair_info_pdf(pdf)
         data = info.get("data") if info else None
         valor = info.get("valor") if info else None
 
@@ -562,13 +1121,174 @@ def extrair_notas_zip(zip_path, temp_dir):
             "numero": numero,
             "data": data,
             "valor": valor,
-            "arquivo": nome_arquivo
+            "arquivo": nome_arquivo,
+            "meta": info.get("meta", {}) if info else {},
+            "metricas": medicoes,
+            "hash": hashes[i],
+            "armazenada": j not in extraidas,
+            "duplicada_de": duplicada_de,
         })
 
-    return notas, sem_dados
+    return notas, sem_dados, descartadas
+
+# === 3) Extrai relatório do Questor ===
+# Parser por coordenadas de palavras (PyMuPDF): acha o cabeçalho uma vez, tira
+# dele os limites x das colunas e reaproveita nas demais páginas, que são lidas
+# em lotes no pool de processos. O extract_table do pdfplumber (detecção de
+# tabela página a página, bem mais lenta) fica de fallback.
+# NF_RELATORIO_PARSER: "auto" (palavras; se não sair nenhuma linha, relê tudo
+# com o pdfplumber e conta relatorio_fallback nas métricas), "palavras" (sem
+# fallback: nenhuma linha é erro) ou "pdfplumber"
+NF_RELATORIO_PARSER = os.environ.get("NF_RELATORIO_PARSER", "auto")
+CHAVES_RELATORIO = ("docum", "espécie", "entrada", "valor")   # documento, espécie, data, valor
+REL_TOL_LINHA = 3.0          # pt: topos até essa distância são a mesma linha
+REL_ALTURA_CABECALHO = 24.0  # pt: cabeçalho pode quebrar em até ~2 linhas
+REL_GAP_COLUNA = 6.0         # pt: sem réguas, espaço que separa duas células do cabeçalho
+REL_PAGINAS_CABECALHO = 3    # procura o cabeçalho só no começo do relatório
+REL_PAGINAS_POR_LOTE = 25
+
+
+def _indice_coluna(header, chave):
+    for i, h in enumerate(header):
+        if chave in h:
+            return i
+    raise ValueError(f"Coluna '{chave}' não encontrada no cabeçalho do relatório.")
+
+
+def _linha_relatorio(row, cols):
+    """Linha da tabela -> {numero, data, valor}, ou None se não for NFS."""
+    idx_doc, idx_esp, idx_date, idx_val = cols
+    esp = row[idx_esp].strip().upper()
+    if esp == "NFE" or not esp.startswith("NFS"):
+        return None
+    raw = row[idx_val].strip()
+    try:
+        valor = str(Decimal(raw.replace(".", "").replace(",", ".")).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return None
+    return {"numero": row[idx_doc].strip(), "data": row[idx_date].strip(), "valor": valor}
+
 
-# === 3) Extrai relatório via pdfplumber ===
-def extrair_relatorio(pdf_path):
+def _linhas_palavras(words):
+    """Agrupa as palavras de get_text("words") em linhas (lista de palavras ordenadas por x)."""
+    linhas = []
+    for w in sorted(words, key=lambda w: (w[1], w[0])):
+        if linhas and w[1] - linhas[-1][0] <= REL_TOL_LINHA:
+            linhas[-1][1].append(w)
+        else:
+            linhas.append((w[1], [w]))
+    return [sorted(ws, key=lambda w: w[0]) for _, ws in linhas]
+
+
+def _celulas(palavras, limites):
+    """Distribui as palavras entre as colunas [limites[i], limites[i+1]) pelo centro x."""
+    celulas = [[] for _ in range(len(limites) - 1)]
+    for w in palavras:
+        col = bisect_right(limites, (w[0] + w[2]) / 2) - 1
+        if 0 <= col < len(celulas):
+            celulas[col].append(w[4])
+    return [" ".join(c) for c in celulas]
+
+
+def _reguas_verticais(page, y0, y1):
+    """x das réguas verticais da grade que cruzam a faixa y0..y1 (vazio se não há grade)."""
+    xs = []
+    for d in page.get_drawings():
+        for item in d["items"]:
+            if item[0] == "l":
+                p, q = item[1], item[2]
+                if abs(p.x - q.x) < 1 and min(p.y, q.y) <= y0 and max(p.y, q.y) >= y1:
+                    xs.append(p.x)
+            elif item[0] == "re":
+                r = item[1]
+                if r.y0 <= y0 and r.y1 >= y1:
+                    xs.extend((r.x0, r.x1) if r.width >= 1.5 else ((r.x0 + r.x1) / 2,))
+    limites = []
+    for x in sorted(xs):
+        if not limites or x - limites[-1] > 1:
+            limites.append(x)
+    return limites
+
+
+def _limites_por_texto(palavras):
+    """Sem grade: junta as palavras do cabeçalho em células e corta no meio dos vãos."""
+    grupos = []
+    for w in sorted(palavras, key=lambda w: w[0]):
+        if grupos and w[0] - grupos[-1][1] <= REL_GAP_COLUNA:
+            grupos[-1][1] = max(grupos[-1][1], w[2])
+        else:
+            grupos.append([w[0], w[2]])
+    meios = [(a[1] + b[0]) / 2 for a, b in zip(grupos, grupos[1:])]
+    return [float("-inf")] + meios + [float("inf")]
+
+
+def _cabecalho_relatorio(page):
+    """Acha o cabeçalho na página; devolve (limites x das colunas, índices doc/esp/data/valor) ou None."""
+    linhas = _linhas_palavras(page.get_text("words"))
+    textos = [" ".join(w[4] for w in ln).lower() for ln in linhas]
+    # janela de linhas mais justa que contém as quatro chaves (ignora títulos acima)
+    for fim in range(len(linhas)):
+        for ini in range(fim, -1, -1):
+            if linhas[fim][0][1] - linhas[ini][0][1] > REL_ALTURA_CABECALHO:
+                break
+            if all(any(ch in t for t in textos[ini:fim + 1]) for ch in CHAVES_RELATORIO):
+                palavras = [w for ln in linhas[ini:fim + 1] for w in ln]
+                y0 = min(w[1] for w in palavras)
+                y1 = max(w[3] for w in palavras)
+                for limites in (_reguas_verticais(page, y0, y1), _limites_por_texto(palavras)):
+                    if len(limites) < 2:
+                        continue
+                    ordem = sorted(palavras, key=lambda w: (w[1], w[0]))
+                    header = [c.lower() for c in _celulas(ordem, limites)]
+                    try:
+                        cols = tuple(_indice_coluna(header, ch) for ch in CHAVES_RELATORIO)
+                    except ValueError:
+                        continue
+                    if len(set(cols)) == len(cols):
+                        return limites, cols
+                break
+    return None
+
+
+def _relatorio_paginas(args):
+    """Lê as linhas NFS das páginas [inicio, fim) com as colunas já conhecidas (roda no pool)."""
+    pdf_path, inicio, fim, limites, cols = args
+    linhas = []
+    with fitz.open(pdf_path) as doc:
+        for pno in range(inicio, fim):
+            for palavras in _linhas_palavras(doc[pno].get_text("words")):
+                linha = _linha_relatorio(_celulas(palavras, limites), cols)
+                if linha:
+                    linhas.append(linha)
+    return linhas
+
+
+def _iter_relatorio_palavras(pdf_path, workers=None):
+    with fitz.open(pdf_path) as doc:
+        n = doc.page_count
+        achado = None
+        for pno in range(min(n, REL_PAGINAS_CABECALHO)):
+            achado = _cabecalho_relatorio(doc[pno])
+            if achado:
+                break
+    if not achado:
+        _dbg(pdf_path, f"relatório: cabeçalho não achado nas {REL_PAGINAS_CABECALHO} primeiras páginas")
+        return
+    limites, cols = achado
+    lotes = [(pdf_path, i, min(i + REL_PAGINAS_POR_LOTE, n), limites, cols)
+             for i in range(pno, n, REL_PAGINAS_POR_LOTE)]
+    workers = min(workers or NF_WORKERS, len(lotes))
+    if workers <= 1:
+        for lote in lotes:
+            yield from _relatorio_paginas(lote)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_contexto_pool()) as ex:
+        # map devolve os lotes na ordem das páginas, conforme ficam prontos
+        for linhas in ex.map(_relatorio_paginas, lotes):
+            yield from linhas
+
+
+def _iter_relatorio_pdfplumber(pdf_path):
     with pdfplumber.open(pdf_path) as pdf:
         rows = []
         for page in pdf.pages:
@@ -580,27 +1300,36 @@ def extrair_relatorio(pdf_path):
     if not rows:
         raise ValueError("Nenhuma linha extraída do relatório.")
     header = [c.replace("\n", " ").strip().lower() for c in rows[0]]
-    idx_doc = next(i for i,h in enumerate(header) if "docum" in h)
-    idx_esp = next(i for i,h in enumerate(header) if "espécie" in h)
-    idx_date = next(i for i,h in enumerate(header) if "entrada" in h)
-    idx_val = next(i for i,h in enumerate(header) if "valor" in h)
-    rel = []
+    cols = tuple(_indice_coluna(header, ch) for ch in CHAVES_RELATORIO)
     for row in rows[1:]:
-        esp = row[idx_esp].strip().upper()
-        if esp == "NFE" or not esp.startswith("NFS"):
-            continue
-        numero = row[idx_doc].strip()
-        data = row[idx_date].strip()
-        raw = row[idx_val].strip()
-        try:
-            valor = str(Decimal(raw.replace(".", "").replace(",", ".")).quantize(Decimal("0.01")))
-        except InvalidOperation:
-            continue
-        rel.append({"numero": numero, "data": data, "valor": valor})
-    return rel
+        linha = _linha_relatorio(row, cols)
+        if linha:
+            yield linha
+
+
+def iter_relatorio(pdf_path, workers=None):
+    """Gera as linhas NFS do relatório ({numero, data, valor}) à medida que as páginas são lidas."""
+    if NF_RELATORIO_PARSER != "pdfplumber":
+        achou = False
+        for linha in _iter_relatorio_palavras(pdf_path, workers):
+            achou = True
+            yield linha
+        if achou:
+            return
+        if NF_RELATORIO_PARSER == "palavras":
+            raise ValueError("Nenhuma linha extraída do relatório.")
+        # o pdfplumber relê o PDF inteiro: relatório que cai aqui paga os dois parsers
+        _dbg(pdf_path, "relatório: nenhuma linha por palavras, relendo com pdfplumber")
+        metricas.contar("relatorio_fallback")
+    yield from _iter_relatorio_pdfplumber(pdf_path)
+
+
+def extrair_relatorio(pdf_path, workers=None):
+    return list(iter_relatorio(pdf_path, workers))
 
 # === 4) Compara e gera PDF de validação ===
-def gerar_pdf_relatorio(encontradas, divergentes, nao_encontradas, sem_dados, output_path):
+def gerar_pdf_relatorio(encontradas, divergentes, nao_encontradas, sem_dados, output_path,
+                        descartadas=(), duplicadas=()):
     c = canvas.Canvas(output_path, pagesize=A4)
     width, height = A4
     y = height - 50
@@ -645,22 +1374,35 @@ def gerar_pdf_relatorio(encontradas, divergentes, nao_encontradas, sem_dados, ou
             y -= 15
         y -= 20
 
+    def add_lista(titulo, linhas):
+        nonlocal y
+        if y < 70:
+            c.showPage()
+            y = height - 50
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(40, y, f"{titulo} ({len(linhas)})")
+        y -= 20
+        c.setFont("Helvetica", 10)
+        for linha in linhas:
+            if y < 50:
+                c.showPage()
+                y = height - 50
+            c.drawString(50, y, linha)
+            y -= 15
+        y -= 20
+
     c.setFont("Helvetica-Bold", 14)
     c.drawString(40, y, "Relatório de Validação de NFS-e")
     y -= 30
     add_secao("✔ Encontradas e Correspondentes", encontradas)
     add_secao("⚠ Divergentes (data ou valor)", divergentes)
     add_secao("❌ Não encontradas no relatório", nao_encontradas)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, f"🛈 Arquivos sem extração ({len(sem_dados)})")
-    y -= 20
-    c.setFont("Helvetica", 10)
-    for fname in sem_dados:
-        if y < 50:
-            c.showPage()
-            y = height - 50
-        c.drawString(50, y, fname)
-        y -= 15
+    add_lista("🛈 Arquivos sem extração", sem_dados)
+    add_lista("⊘ Descartados: não são NFS-e",
+              [f"{it['arquivo']} | {it['motivo']}" for it in descartadas])
+    add_lista("⧉ Duplicadas no ZIP (mesmo conteúdo, não contadas de novo)",
+              [f"Nº: {it['numero']} | Arquivo: {it['arquivo']} | cópia de: {it['duplicada_de']}"
+               for it in duplicadas])
     c.save()
 
 def to_decimal_br(s):
@@ -674,19 +1416,15 @@ def to_decimal_br(s):
         return None
 
 # === 5) Função principal ===
-def processar_comparacao_nf(zip_path, relatorio_pdf_path, output_dir):
-
-    temp = os.path.join(os.path.dirname(output_dir), "temp_notas")
-    if os.path.isdir(temp):
-        shutil.rmtree(temp, onerror=lambda f, p, e: os.chmod(p, stat.S_IWRITE) or f(p))
-    if os.path.isdir(output_dir):
-        shutil.rmtree(output_dir, onerror=lambda f, p, e: os.chmod(p, stat.S_IWRITE) or f(p))
-    os.makedirs(temp, exist_ok=True)
+def processar_comparacao_nf(zip_path, relatorio_pdf_path, output_dir, workers=None, progresso=None):
+
+    # output_dir é exclusivo da comparação (ver nf_jobs.novo_workspace): não
+    # apaga nada aqui, quem criou a pasta cuida da limpeza
     os.makedirs(output_dir, exist_ok=True)
 
     # Extrai NFS-e do ZIP (NF-e já são ignoradas) e lê o relatório
     try:
-        notas, sem_dados = extrair_notas_zip(zip_path, temp)
+        notas, sem_dados, descartadas = extrair_notas_zip(zip_path, workers=workers, progresso=progresso)
     except Exception as e:
         # Mensagem clara para a UI/log
         raise RuntimeError(
@@ -694,16 +1432,23 @@ def processar_comparacao_nf(zip_path, relatorio_pdf_path, output_dir):
             "Envie um arquivo ZIP (RAR não é suportado)."
         )
 
-    rel = extrair_relatorio(relatorio_pdf_path)
+    # cópias da mesma nota no ZIP vão para uma seção própria, sem conciliar de novo
+    duplicadas = [nf for nf in notas if nf.get("duplicada_de")]
+    notas = [nf for nf in notas if not nf.get("duplicada_de")]
 
     encontradas, divergentes, nao_encontradas = [], [], []
 
-    # Indexa relatório por número (pode haver mais de uma linha por número)
+    # Indexa relatório por número (pode haver mais de uma linha por número),
+    # conforme as linhas saem do parser
     idx = defaultdict(list)
-    for r in rel:
-        num_str = r.get("numero", "")
-        if num_str.isdigit():
-            idx[int(num_str)].append(r)
+    with metricas.medindo() as m:
+        with metricas.etapa("total"):
+            for r in iter_relatorio(relatorio_pdf_path, workers=workers):
+                num_str = r.get("numero", "")
+                if num_str.isdigit():
+                    idx[int(num_str)].append(r)
+    # tempo do relatório e relatorio_fallback vão aos sinks junto com as notas
+    metricas.emitir({"arquivo": os.path.basename(relatorio_pdf_path), "relatorio": True, **m.como_dict()})
 
     for nf in notas:
         num_str = nf.get("numero", "")
@@ -736,6 +1481,13 @@ def processar_comparacao_nf(zip_path, relatorio_pdf_path, output_dir):
             nf['esperado'] = matches[0]
             divergentes.append(nf)
 
+    nf_store.registrar_conciliacao(
+        (nf.get("hash"), nf.get("arquivo"), nf.get("numero"), status, nf.get("esperado"))
+        for status, itens in (("encontrada", encontradas), ("divergente", divergentes),
+                              ("nao_encontrada", nao_encontradas), ("descartada", descartadas))
+        for nf in itens
+    )
+
     MISSING = "—"
 
     def _sanitize(items):
@@ -752,13 +1504,16 @@ def processar_comparacao_nf(zip_path, relatorio_pdf_path, output_dir):
     _sanitize(nao_encontradas)
 
     pdf_out = os.path.join(output_dir, "relatorio_validacao.pdf")
-    gerar_pdf_relatorio(encontradas, divergentes, nao_encontradas, sem_dados, pdf_out)
+    gerar_pdf_relatorio(encontradas, divergentes, nao_encontradas, sem_dados, pdf_out,
+                        descartadas, duplicadas)
 
     resultado = {
         "encontradas": encontradas,
         "divergentes": divergentes,
         "nao_encontradas": nao_encontradas,
         "sem_dados": sem_dados,
+        "descartadas": descartadas,
+        "duplicadas": duplicadas,
         "pdf": pdf_out
     }
     return resultado, pdf_out
@@ -0,0 +1,211 @@
+# utils/nf_jobs.py
+"""
+Fila de jobs do comparador de NFs.
+
+Cada job tem um workspace próprio (novo_workspace()): a rota grava ali os
+arquivos enviados e chama submeter(), que devolve o id do job na hora. A
+comparação roda fora do processo web, num pool de processos "spawn" (o
+PyMuPDF não é thread-safe e não se faz fork de um servidor com threads);
+NF_JOB_WORKERS=1 (padrão) roda um job por vez. O job grava o andamento
+(notas processadas / total) em workspace/progresso.json e status() o lê,
+para a página consultar por polling.
+
+Ao terminar o job, os arquivos enviados são apagados e só a saída (PDF de
+validação) fica até o job expirar (NF_JOB_TTL); aí o workspace inteiro vai
+embora. Workspaces órfãos (processo reiniciado) também são varridos pela
+idade. Como nenhum job toca na pasta de outro, várias comparações rodam
+juntas.
+
+O registro fica na memória do processo: com vários workers web, o status
+precisa ser consultado no mesmo processo que recebeu o envio.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from utils.nf_comparador import processar_comparacao_nf
+
+# comparações simultâneas, cada uma no seu processo (cada job tem seu workspace)
+NF_JOB_WORKERS = int(os.environ.get("NF_JOB_WORKERS", 1))
+# jobs terminados somem do registro (e do disco) depois deste tempo (segundos)
+NF_JOB_TTL = int(os.environ.get("NF_JOB_TTL", 6 * 3600))
+# raiz dos workspaces por job
+NF_JOB_DIR = os.environ.get(
+    "NF_JOB_DIR", os.path.join(tempfile.gettempdir(), "utilitarios_nf_jobs")
+)
+
+NA_FILA, PROCESSANDO, CONCLUIDO, ERRO = "na_fila", "processando", "concluido", "erro"
+
+_lock = threading.Lock()
+_jobs: Dict[str, Dict] = {}
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=NF_JOB_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _atualizar(job_id: str, **campos) -> None:
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(campos)
+
+
+def novo_workspace() -> str:
+    """Cria a pasta exclusiva de um job (entradas + saida/)."""
+    os.makedirs(NF_JOB_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix="nf_job_", dir=NF_JOB_DIR)
+
+
+def descartar_workspace(workspace: Optional[str]) -> None:
+    """Apaga o workspace (também usado pela rota se o envio falhar antes do submeter)."""
+    if workspace and os.path.isdir(workspace):
+        # arquivos somente leitura (Windows) impedem o rmtree
+        shutil.rmtree(workspace, onerror=lambda f, p, e: os.chmod(p, stat.S_IWRITE) or f(p))
+
+
+def _limpar_expirados() -> None:
+    limite = time.time() - NF_JOB_TTL
+    with _lock:
+        expirados = [_jobs.pop(j) for j, job in list(_jobs.items())
+                     if job["status"] in (CONCLUIDO, ERRO) and job["atualizado_em"] < limite]
+        ativos = {job["workspace"] for job in _jobs.values()}
+    for job in expirados:
+        descartar_workspace(job["workspace"])
+
+    # sobras de processos anteriores: workspaces sem job e mais velhos que o TTL
+    try:
+        nomes = os.listdir(NF_JOB_DIR)
+    except OSError:
+        return
+    for nome in nomes:
+        path = os.path.join(NF_JOB_DIR, nome)
+        try:
+            if nome.startswith("nf_job_") and path not in ativos and os.path.getmtime(path) < limite:
+                descartar_workspace(path)
+        except OSError:
+            pass
+
+
+def _descartar_entradas(*paths: str) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _arquivo_progresso(workspace: str) -> str:
+    return os.path.join(workspace, "progresso.json")
+
+
+def _executar(zip_path: str, relatorio_pdf_path: str, output_dir: str, arquivo_progresso: str):
+    """Roda no processo do pool: a comparação + andamento em arquivo_progresso."""
+
+    def progresso(feitos, total):
+        tmp = arquivo_progresso + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"feitos": feitos, "total": total}, f)
+        os.replace(tmp, arquivo_progresso)
+
+    progresso(0, None)
+    try:
+        return processar_comparacao_nf(zip_path, relatorio_pdf_path, output_dir, progresso=progresso)
+    except Exception:
+        print(traceback.format_exc())
+        raise
+    finally:
+        # os envios não servem mais; o PDF de saída fica até o TTL
+        _descartar_entradas(zip_path, relatorio_pdf_path)
+
+
+def _concluir(job_id: str, futuro: Future) -> None:
+    global _executor
+    try:
+        resultado, pdf_out = futuro.result()
+    except BaseException as e:
+        if isinstance(e, BrokenProcessPool):
+            # processo do job morreu: o próximo submeter() cria outro pool
+            with _lock:
+                _executor = None
+        _atualizar(job_id, status=ERRO, erro=str(e) or type(e).__name__, atualizado_em=time.time())
+        return
+    _atualizar(job_id, status=CONCLUIDO, resultado=resultado, pdf=pdf_out,
+               atualizado_em=time.time())
+
+
+def submeter(zip_path: str, relatorio_pdf_path: str, workspace: str) -> str:
+    """Enfileira uma comparação e devolve o id do job.
+
+    workspace vem de novo_workspace() e passa a ser do job: a saída vai para
+    workspace/saida e a pasta é apagada quando o job expira.
+    """
+    _limpar_expirados()
+    output_dir = os.path.join(workspace, "saida")
+    job_id = uuid.uuid4().hex
+    agora = time.time()
+    with _lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "status": NA_FILA,
+            "feitos": 0,
+            "total": None,
+            "erro": None,
+            "resultado": None,
+            "pdf": None,
+            "workspace": workspace,
+            "criado_em": agora,
+            "atualizado_em": agora,
+        }
+    futuro = _pool().submit(_executar, zip_path, relatorio_pdf_path, output_dir,
+                            _arquivo_progresso(workspace))
+    futuro.add_done_callback(lambda f: _concluir(job_id, f))
+    return job_id
+
+
+def _ler_progresso(job: Dict) -> None:
+    """Atualiza status/feitos/total de um job em andamento pelo arquivo que o processo grava."""
+    if job["status"] not in (NA_FILA, PROCESSANDO):
+        return
+    try:
+        with open(_arquivo_progresso(job["workspace"]), encoding="utf-8") as f:
+            andamento = json.load(f)
+    except (OSError, ValueError):
+        return
+    job.update(status=PROCESSANDO, feitos=andamento["feitos"], total=andamento["total"])
+
+
+def status(job_id: str) -> Optional[Dict]:
+    """Resumo serializável em JSON (sem o resultado) ou None se o job não existe."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        _ler_progresso(job)
+        return {k: job[k] for k in ("id", "status", "feitos", "total", "erro")}
+
+
+def obter(job_id: str) -> Optional[Dict]:
+    """Job completo (inclui resultado e caminho do PDF) ou None."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        _ler_progresso(job)
+        return dict(job)
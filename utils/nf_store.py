@@ -0,0 +1,153 @@
+# utils/nf_store.py
+"""
+Banco local (SQLite) das notas já extraídas, para conciliações incrementais.
+
+Cada nota é guardada pelo hash do conteúdo do arquivo + versão do extrator
+(ver nf_comparador.versao_extrator()): reenviar o ZIP do mês com alguns
+arquivos a mais só extrai os novos ou alterados; os demais vêm do banco e
+são conciliados de novo contra o relatório (o que é barato). Mudou a versão,
+as notas são extraídas de novo.
+
+A tabela conciliacao guarda o último status de cada arquivo
+(encontrada / divergente / nao_encontrada / descartada) e a linha esperada
+do relatório.
+
+NF_STORE=0 desliga; NF_STORE_DB escolhe o arquivo. Falhas do banco não
+derrubam a comparação: a nota só é extraída de novo.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+NF_STORE_ATIVO = os.environ.get("NF_STORE", "1") != "0"
+NF_STORE_DB = os.environ.get(
+    "NF_STORE_DB", os.path.join(tempfile.gettempdir(), "utilitarios_nf_store.sqlite3")
+)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS notas (
+    hash        TEXT NOT NULL,
+    versao      TEXT NOT NULL,
+    arquivo     TEXT,
+    info        TEXT,
+    descarte    TEXT,
+    gravado_em  REAL,
+    PRIMARY KEY (hash, versao)
+);
+CREATE TABLE IF NOT EXISTS conciliacao (
+    hash          TEXT PRIMARY KEY,
+    arquivo       TEXT,
+    numero        TEXT,
+    status        TEXT,
+    esperado      TEXT,
+    atualizado_em REAL
+);
+"""
+
+_lock = threading.Lock()
+_iniciado = set()  # caminhos de banco com esquema já criado neste processo
+_stats = {"hits": 0, "misses": 0, "gravacoes": 0}
+
+
+def estatisticas() -> Dict[str, int]:
+    with _lock:
+        return dict(_stats)
+
+
+def hash_conteudo(dados: bytes) -> str:
+    return hashlib.sha256(dados).hexdigest()
+
+
+def _conectar() -> sqlite3.Connection:
+    # uma conexão por operação: jobs rodam em threads diferentes
+    con = sqlite3.connect(NF_STORE_DB, timeout=30)
+    if NF_STORE_DB not in _iniciado:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.executescript(_ESQUEMA)
+        colunas = {linha[1] for linha in con.execute("PRAGMA table_info(notas)")}
+        if "descarte" not in colunas:  # bancos criados antes da coluna
+            con.execute("ALTER TABLE notas ADD COLUMN descarte TEXT")
+        _iniciado.add(NF_STORE_DB)
+    return con
+
+
+def buscar(hashes: Iterable[str], versao: str) -> Dict[str, Tuple[Optional[Dict], Optional[str]]]:
+    """hash -> (info, descarte) já extraídos nesta versão (info None: NF-e / sem dados)."""
+    hashes = list(dict.fromkeys(hashes))
+    if not NF_STORE_ATIVO or not hashes:
+        return {}
+    achados = {}
+    try:
+        with _lock:
+            con = _conectar()
+        try:
+            for i in range(0, len(hashes), 500):  # limite de parâmetros do SQLite
+                lote = hashes[i:i + 500]
+                marcas = ",".join("?" * len(lote))
+                for h, info, descarte in con.execute(
+                    f"SELECT hash, info, descarte FROM notas WHERE versao = ? AND hash IN ({marcas})",
+                    [versao, *lote],
+                ):
+                    achados[h] = (json.loads(info), descarte)
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"[NF_STORE] leitura falhou: {e}")
+        return {}
+    with _lock:
+        _stats["hits"] += len(achados)
+        _stats["misses"] += len(hashes) - len(achados)
+    return achados
+
+
+def gravar(registros: Iterable[Tuple[str, str, Optional[Dict], Optional[str]]], versao: str) -> None:
+    """Guarda (hash, arquivo, info, descarte) das notas extraídas com sucesso."""
+    if not NF_STORE_ATIVO:
+        return
+    agora = time.time()
+    linhas = [(h, versao, arquivo, json.dumps(info, ensure_ascii=False), descarte, agora)
+              for h, arquivo, info, descarte in registros]
+    if not linhas:
+        return
+    try:
+        with _lock:
+            con = _conectar()
+        try:
+            with con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO notas (hash, versao, arquivo, info, descarte, gravado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", linhas)
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"[NF_STORE] gravação falhou: {e}")
+        return
+    with _lock:
+        _stats["gravacoes"] += len(linhas)
+
+
+def registrar_conciliacao(itens: Iterable[Tuple[str, str, str, str, Optional[Dict]]]) -> None:
+    """Guarda o último status de cada nota: (hash, arquivo, numero, status, esperado)."""
+    if not NF_STORE_ATIVO:
+        return
+    agora = time.time()
+    linhas = [(h, arquivo, numero, status, json.dumps(esperado, ensure_ascii=False), agora)
+              for h, arquivo, numero, status, esperado in itens if h]
+    if not linhas:
+        return
+    try:
+        with _lock:
+            con = _conectar()
+        try:
+            with con:
+                con.executemany("INSERT OR REPLACE INTO conciliacao VALUES (?, ?, ?, ?, ?, ?)", linhas)
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"[NF_STORE] gravação da conciliação falhou: {e}")
+
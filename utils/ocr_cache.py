@@ -0,0 +1,203 @@
+# utils/ocr_cache.py
+"""
+Cache persistente (em disco) do texto reconhecido por OCR.
+
+A chave é endereçada pelo conteúdo da página (content stream + objetos que ela
+referencia, inclusive imagens) somada a DPI, idioma e config do tesseract, de
+modo que reenviar o mesmo PDF — mesmo com outro nome — não refaz o OCR.
+O tamanho total é limitado por OCR_CACHE_MAX_BYTES com descarte LRU
+(a data de modificação do arquivo marca o último acesso).
+"""
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+OCR_CACHE_ATIVO = os.environ.get("OCR_CACHE", "1") != "0"
+OCR_CACHE_DIR = os.environ.get(
+    "OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "utilitarios_ocr_cache")
+)
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# ao estourar o limite, descarta até ficar nesta fração do orçamento
+_FRACAO_APOS_LIMPEZA = 0.9
+
+RX_REF = re.compile(r"(\d+)\s+0\s+R\b")
+RX_PARENT = re.compile(r"/Parent\s+\d+\s+0\s+R")
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "gravacoes": 0, "descartes": 0}
+_tamanho_total: Optional[int] = None  # estimativa local; recalculada na limpeza
+
+
+def estatisticas() -> Dict[str, int]:
+    """Contadores do processo atual (hits, misses, gravações, descartes)."""
+    with _lock:
+        return dict(_stats)
+
+
+def acumular(delta: Dict[str, int]) -> None:
+    """Soma contadores vindos de outro processo (ex.: workers do pool)."""
+    with _lock:
+        for k, v in (delta or {}).items():
+            _stats[k] = _stats.get(k, 0) + v
+
+
+def hash_pagina(page) -> str:
+    """
+    Hash do conteúdo da página, calculado uma vez por página de cada documento
+    aberto: a mesma página passa por várias consultas ao cache (classificação,
+    cada DPI do OCR adaptativo, faixas do ROI, layout) e o hash relê os streams
+    das imagens. Fica guardado no próprio fitz.Document (que não aceita weakref),
+    então vale enquanto o documento não for alterado.
+    """
+    doc = page.parent
+    hashes = getattr(doc, "_hashes_ocr", None)
+    if hashes is None:
+        hashes = doc._hashes_ocr = {}
+    h = hashes.get(page.number)
+    if h is None:
+        h = hashes[page.number] = _hash_conteudo(page)
+    return h
+
+
+def _hash_conteudo(page) -> str:
+    """
+    Em PDFs percorre o objeto da página e tudo o que ele referencia (sem subir
+    pelo /Parent); em imagens (JPEG etc.) usa os pixels em baixa resolução.
+    """
+    doc = page.parent
+    h = hashlib.sha256()
+    if not doc.is_pdf:
+        pix = page.get_pixmap(dpi=72, alpha=False)
+        h.update(f"{pix.width}x{pix.height}".encode())
+        h.update(pix.samples)
+        return h.hexdigest()
+
+    h.update(repr((tuple(page.rect), page.rotation)).encode())
+    h.update(page.read_contents())
+    # recursos herdados da árvore de páginas não aparecem no objeto da página
+    pilha = [page.xref]
+    pilha += [img[0] for img in page.get_images(full=True)]
+    pilha += [xo[0] for xo in page.get_xobjects()]
+    vistos = set()
+    while pilha:
+        xref = pilha.pop()
+        if xref <= 0 or xref in vistos:
+            continue
+        vistos.add(xref)
+        obj = RX_PARENT.sub("", doc.xref_object(xref, compressed=True))
+        h.update(obj.encode("utf-8", "replace"))
+        if doc.xref_is_stream(xref):
+            h.update(doc.xref_stream_raw(xref) or b"")
+        pilha.extend(int(x) for x in RX_REF.findall(obj))
+    return h.hexdigest()
+
+
+def chave_ocr(page, *, dpi: int, lang: Optional[str], config: str = "") -> str:
+    base = f"{hash_pagina(page)}|dpi={dpi}|lang={lang or ''}|cfg={config}"
+    return hashlib.sha256(base.encode()).hexdigest()
+
+
+def _caminho(chave: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, chave[:2], chave + ".txt")
+
+
+def obter(chave: str) -> Optional[str]:
+    path = _caminho(chave)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            texto = f.read()
+    except OSError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    try:
+        os.utime(path)  # marca como usado recentemente (LRU)
+    except OSError:
+        pass
+    with _lock:
+        _stats["hits"] += 1
+    return texto
+
+
+def gravar(chave: str, texto: str) -> None:
+    global _tamanho_total
+    path = _caminho(chave)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # grava em arquivo temporário + replace: leitores nunca veem arquivo pela metade
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(tmp, path)
+
+    tamanho = len(texto.encode("utf-8"))
+    with _lock:
+        _stats["gravacoes"] += 1
+        if _tamanho_total is None:
+            _tamanho_total = _medir()
+        else:
+            _tamanho_total += tamanho
+        estourou = _tamanho_total > OCR_CACHE_MAX_BYTES
+    if estourou:
+        _limpar_lru()
+
+
+def _listar():
+    for raiz, _, arquivos in os.walk(OCR_CACHE_DIR):
+        for fn in arquivos:
+            if not fn.endswith(".txt"):
+                continue
+            path = os.path.join(raiz, fn)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield st.st_mtime, st.st_size, path
+
+
+def _medir() -> int:
+    return sum(tam for _, tam, _ in _listar())
+
+
+def _limpar_lru() -> None:
+    """Remove os itens menos usados até caber no orçamento."""
+    global _tamanho_total
+    itens = sorted(_listar())
+    total = sum(tam for _, tam, _ in itens)
+    alvo = int(OCR_CACHE_MAX_BYTES * _FRACAO_APOS_LIMPEZA)
+    descartes = 0
+    for _, tam, path in itens:
+        if total <= alvo:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= tam
+        descartes += 1
+    with _lock:
+        _tamanho_total = total
+        _stats["descartes"] += descartes
+
+
+def ocr_com_cache(page, reconhecer: Callable[[], str], *, dpi: int,
+                  lang: Optional[str], config: str = "") -> str:
+    """
+    Devolve o texto de OCR da página a partir do cache; em caso de miss chama
+    reconhecer() (que renderiza + roda o tesseract) e grava o resultado.
+    config deve incluir tudo que muda o texto (parâmetros e pré-processamento).
+    """
+    if not OCR_CACHE_ATIVO:
+        return reconhecer()
+    chave = chave_ocr(page, dpi=dpi, lang=lang, config=config)
+    texto = obter(chave)
+    if texto is None:
+        texto = reconhecer()
+        try:
+            gravar(chave, texto)
+        except OSError:
+            pass  # cache é só otimização: falha de disco não derruba o OCR
+    return texto
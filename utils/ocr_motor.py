@@ -0,0 +1,143 @@
+# utils/ocr_motor.py
+"""
+Motores de OCR usados pelo comparador de NFs e pelo extrato em PDF.
+
+O padrão é o tesserocr: a API do Tesseract roda dentro do processo e cada
+handle (idioma + psm + oem) fica aquecido por thread, de modo que o modelo
+do idioma é carregado uma vez e reaproveitado entre páginas e arquivos.
+Sem tesserocr (ou sem o idioma pedido) cai para o pytesseract, que abre um
+processo `tesseract` por página.
+
+OCR_MOTOR=pytesseract força o motor antigo.
+"""
+import os
+import re
+import threading
+from typing import Optional
+
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # dependência opcional
+    tesserocr = None
+
+OCR_MOTOR = os.environ.get("OCR_MOTOR", "auto")
+
+RX_PSM = re.compile(r"--psm\s+(\d+)")
+RX_OEM = re.compile(r"--oem\s+(\d+)")
+RX_VAR = re.compile(r"-c\s+(\w+)=(\S+)")
+
+
+class MotorPytesseract:
+    """Um subprocesso `tesseract` por chamada (comportamento original)."""
+
+    nome = "pytesseract"
+
+    def reconhecer(self, img, lang: Optional[str] = None, config: str = "") -> str:
+        if lang:
+            return pytesseract.image_to_string(img, lang=lang, config=config)
+        return pytesseract.image_to_string(img, config=config)
+
+    def dados(self, img, lang: Optional[str] = None, config: str = "") -> str:
+        if lang:
+            return pytesseract.image_to_data(img, lang=lang, config=config)
+        return pytesseract.image_to_data(img, config=config)
+
+
+class MotorTesserocr:
+    """Tesseract em processo, com um handle por (idioma, psm, oem, variáveis) e por thread."""
+
+    nome = "tesserocr"
+
+    def __init__(self):
+        self._local = threading.local()  # PyTessBaseAPI não é thread-safe
+
+    def _api(self, lang: str, config: str):
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        m_psm, m_oem = RX_PSM.search(config), RX_OEM.search(config)
+        psm = int(m_psm.group(1)) if m_psm else tesserocr.PSM.AUTO
+        oem = int(m_oem.group(1)) if m_oem else tesserocr.OEM.DEFAULT
+        variaveis = tuple(RX_VAR.findall(config))
+        chave = (lang, psm, oem, variaveis)
+        api = apis.get(chave)
+        if api is None:
+            kwargs = {"lang": lang, "psm": psm, "oem": oem}
+            if os.environ.get("TESSDATA_PREFIX"):
+                kwargs["path"] = os.environ["TESSDATA_PREFIX"]
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            for nome, valor in variaveis:
+                api.SetVariable(nome, valor)
+            apis[chave] = api
+        return api
+
+    def reconhecer(self, img, lang: Optional[str] = None, config: str = "") -> str:
+        api = self._api(lang or "eng", config)
+        api.SetImage(img)
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()  # libera a imagem; o modelo continua carregado
+
+    def dados(self, img, lang: Optional[str] = None, config: str = "") -> str:
+        api = self._api(lang or "eng", config)
+        api.SetImage(img)
+        try:
+            return api.GetTSVText(0)
+        finally:
+            api.Clear()
+
+
+_motor = None
+_motor_lock = threading.Lock()
+
+
+def obter_motor():
+    """Motor do processo atual (criado na primeira chamada)."""
+    global _motor
+    if _motor is None:
+        with _motor_lock:
+            if _motor is None:
+                _motor = _criar_motor()
+    return _motor
+
+
+def _criar_motor():
+    if OCR_MOTOR == "pytesseract" or tesserocr is None:
+        return MotorPytesseract()
+    return MotorTesserocr()
+
+
+def _executar(metodo: str, img, lang: Optional[str], config: str) -> str:
+    # se o tesserocr falhar ao iniciar (ex.: idioma não instalado no tessdata
+    # dele), passa a usar o pytesseract
+    global _motor
+    motor = obter_motor()
+    if isinstance(motor, MotorTesserocr):
+        try:
+            return getattr(motor, metodo)(img, lang=lang, config=config)
+        except RuntimeError as e:
+            print(f"[OCR] tesserocr indisponível ({e}); usando pytesseract")
+            _motor = MotorPytesseract()
+            motor = _motor
+    return getattr(motor, metodo)(img, lang=lang, config=config)
+
+
+def reconhecer(img, lang: Optional[str] = None, config: str = "") -> str:
+    """OCR da imagem no motor do processo (texto corrido)."""
+    return _executar("reconhecer", img, lang, config)
+
+
+def dados(img, lang: Optional[str] = None, config: str = "") -> str:
+    """
+    TSV do tesseract para a imagem: uma linha por palavra com nível,
+    caixa (left, top, width, height), confiança e texto.
+    """
+    return _executar("dados", img, lang, config)
+
+
+def nome_motor() -> str:
+    """Nome do motor em uso — entra na chave do cache de OCR."""
+    return obter_motor().nome